@@ -0,0 +1,83 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+
+Benchmark: cold start of the API server, from a new process to the first served request.
+"inprocess" mode splits it into phases (import of main with database preparation, lifespan startup, first request,
+first /openapi.json), "uvicorn" mode measures a real "uvicorn main:app" process until it answers the first request.
+Run from the project root folder:
+    python benchmark/cold_start.py --runs 5
+"""
+import argparse
+import http.client
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+PROBE = """
+import json
+import time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+client_imported = time.perf_counter()
+with TestClient(main.app) as client:
+    started = time.perf_counter()
+    assert client.get("/favicon.ico").status_code == 200
+    first_request = time.perf_counter()
+    assert client.get("/openapi.json").status_code == 200
+    openapi = time.perf_counter()
+print(json.dumps({"import main": imported - start, "startup": started - client_imported,
+       "first request": first_request - started, "first openapi.json": openapi - first_request}))
+"""
+
+
+def run_inprocess() -> dict:
+    began = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", PROBE], capture_output=True, text=True, check=True).stdout
+    phases = json.loads(output.strip().splitlines()[-1])  # Last line printed by PROBE
+    phases["process total"] = time.perf_counter() - began
+    return phases
+
+
+def run_uvicorn(port: int) -> dict:
+    began = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                connection.request("GET", "/favicon.ico")
+                if connection.getresponse().status == 200:
+                    return {"first response": time.perf_counter() - began}
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError("uvicorn exited before the first response")
+                time.sleep(0.005)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(runs: int, modes: list[str], port: int):
+    for mode in modes:
+        results = [run_inprocess() if mode == "inprocess" else run_uvicorn(port) for _ in range(runs)]
+        print(f"{mode} ({runs} runs, median / min):")
+        for phase in results[0]:
+            values = [result[phase] * 1000 for result in results]
+            print(f"  {phase:<20} {statistics.median(values):8.1f} ms {min(values):8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API server cold start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", choices=["inprocess", "uvicorn"], default=["inprocess", "uvicorn"])
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    main(args.runs, args.modes, args.port)
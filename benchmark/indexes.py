@@ -0,0 +1,94 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+
+Benchmark: insert throughput and read latency of the tickets table with the previous index set (single-column
+index on almost every column) vs the current index plan (composite (owner_id, id) and (employee_id, id) only).
+Run from the project root folder:
+    python benchmark/indexes.py --rows 200000 --reads 2000
+"""
+import argparse
+import random
+import sqlite3
+import statistics
+import sys
+import pathlib
+import tempfile
+import time
+
+# SET PYTHONPATH based on the directory from which the program is run
+PROJECT_ROOT = str(pathlib.Path().resolve())
+sys.path.append(PROJECT_ROOT)  # Add to PYTHONPATH
+
+from util import get_config
+
+APP_CONFIG = get_config()
+TABLE = ("CREATE TABLE tickets (id INTEGER PRIMARY KEY, title VARCHAR(32), description VARCHAR(64), "
+         "status VARCHAR(16), employee_id INTEGER, owner_id INTEGER, created VARCHAR(19), updated VARCHAR(19))")
+INDEX_PLANS = {
+    "previous": [f"CREATE INDEX ix_tickets_{column} ON tickets ({column})"
+                 for column in ("title", "description", "status", "created", "updated")],
+    "current": ["CREATE INDEX ix_tickets_owner_id_id ON tickets (owner_id, id)",
+                "CREATE INDEX ix_tickets_employee_id_id ON tickets (employee_id, id)"],
+}
+READS = {  # Query shapes of crud.get_my_tickets() and Employee.tickets selectin loading
+    "my tickets page": ("SELECT * FROM tickets WHERE owner_id = ? AND id > ? ORDER BY id LIMIT 100",
+                        lambda owners, employees: (random.randrange(owners), 0)),
+    "employee tickets": ("SELECT * FROM tickets WHERE employee_id IN (?, ?, ?, ?, ?) ORDER BY employee_id, id",
+                         lambda owners, employees: tuple(random.randrange(employees) for _ in range(5))),
+}
+
+
+def ticket_rows(start: int, count: int, owners: int, employees: int):
+    for index in range(start, start + count):
+        yield (f"Problem {index % 97}", f"The employee cannot access resource {index % 991}.", "New",
+               random.randrange(employees), random.randrange(owners),
+               f"2024-{index % 12 + 1:02d}-01 00:00:{index % 60:02d}")
+
+
+def run_plan(name: str, rows: int, reads: int, owners: int, employees: int):
+    random.seed(42)
+    with tempfile.TemporaryDirectory() as directory:
+        connection = sqlite3.connect(f"{directory}/benchmark.db")
+        for pragma, value in APP_CONFIG["sqlite_pragmas"].items():
+            connection.execute(f"PRAGMA {pragma}={value}")
+        connection.execute(TABLE)
+        for statement in INDEX_PLANS[name]:
+            connection.execute(statement)
+
+        # Insert in transactions of 1000 rows, like bulk insert chunks
+        started = time.perf_counter()
+        for start in range(0, rows, 1000):
+            connection.executemany("INSERT INTO tickets (title, description, status, employee_id, owner_id, created) "
+                                   "VALUES (?, ?, ?, ?, ?, ?)",
+                                   ticket_rows(start, min(1000, rows - start), owners, employees))
+            connection.commit()
+        inserted = rows / (time.perf_counter() - started)
+        connection.execute("ANALYZE")
+
+        latencies = {}
+        for read_name, (statement, parameters) in READS.items():
+            samples = []
+            for _ in range(reads):
+                started = time.perf_counter()
+                connection.execute(statement, parameters(owners, employees)).fetchall()
+                samples.append((time.perf_counter() - started) * 1000)
+            latencies[read_name] = statistics.median(samples)
+        connection.close()
+
+    print(f"{name:>8}: inserts {inserted:10.0f} rows/s | " +
+          " | ".join(f"{read_name} p50 {latency:7.3f} ms" for read_name, latency in latencies.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tickets insert/read benchmark by index plan")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--owners", type=int, default=50)
+    parser.add_argument("--employees", type=int, default=5000)
+    args = parser.parse_args()
+    print(f"rows={args.rows} reads={args.reads} owners={args.owners} employees={args.employees}")
+    for plan_name in INDEX_PLANS:
+        run_plan(plan_name, args.rows, args.reads, args.owners, args.employees)
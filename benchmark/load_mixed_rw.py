@@ -0,0 +1,104 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+
+Load benchmark: p50/p95/p99 latency under concurrent mixed reads and writes.
+The app is driven in-process through httpx ASGI transport, so every request shares one event loop exactly like
+a single uvicorn worker does. Run from the project root folder:
+    python benchmark/load_mixed_rw.py --concurrency 32 --requests 2000 --write-ratio 0.3
+"""
+import argparse
+import asyncio
+import random
+import sys
+import pathlib
+import time
+
+# SET PYTHONPATH based on the directory from which the program is run
+PROJECT_ROOT = str(pathlib.Path().resolve())
+sys.path.append(PROJECT_ROOT)  # Add to PYTHONPATH
+
+import httpx
+from main import app, APP_CONFIG
+from util import get_test_main
+from benchmark.suite.report import percentile
+
+ROOT_PATH = APP_CONFIG["root_path"]
+TEST_DATA = get_test_main()
+
+
+async def get_token(client: httpx.AsyncClient) -> dict:
+    response = await client.post(ROOT_PATH + "/token", data={"username": TEST_DATA["admin_user"]["username"],
+                                                             "password": TEST_DATA["admin_user"]["password"]})
+    response.raise_for_status()
+    return {"Authorization": "Bearer " + response.json()["access_token"]}
+
+
+async def read_request(client: httpx.AsyncClient, headers: dict, sequence: int):
+    path = random.choice(["/employee/?limit=100", "/ticket/?limit=100", "/me", "/user/?limit=100"])
+    return await client.get(ROOT_PATH + path, headers=headers)
+
+
+async def write_request(client: httpx.AsyncClient, headers: dict, sequence: int):
+    employee = TEST_DATA["employee"].copy()
+    employee["phone"] = f"+38{time.time_ns() % 10 ** 10:010d}{sequence % 1000:03d}"
+    employee["email"] = f"bench.{time.time_ns()}.{sequence}@example.com"
+    response = await client.post(ROOT_PATH + "/employee/", headers=headers, json=employee)
+    if response.status_code == 200:
+        employee_id = response.json()["id"]
+        await client.put(ROOT_PATH + f"/employee/{employee_id}", headers=headers, json=employee)
+        response = await client.delete(ROOT_PATH + f"/employee/{employee_id}", headers=headers)
+    return response
+
+
+async def worker(client: httpx.AsyncClient, headers: dict, queue: asyncio.Queue, write_ratio: float,
+                 latencies: dict, errors: list):
+    while True:
+        try:
+            sequence = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        kind = "write" if random.random() < write_ratio else "read"
+        started = time.perf_counter()
+        response = await (write_request if kind == "write" else read_request)(client, headers, sequence)
+        latencies[kind].append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            errors.append(response.status_code)
+
+
+async def run(concurrency: int, requests: int, write_ratio: float, seed: int):
+    random.seed(seed)
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)  # Count server errors as 5xx responses
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        headers = await get_token(client)
+        queue = asyncio.Queue()
+        for sequence in range(requests):
+            queue.put_nowait(sequence)
+
+        latencies = {"read": [], "write": []}
+        errors = []
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, headers, queue, write_ratio, latencies, errors)
+                               for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    print(f"requests={requests} concurrency={concurrency} write_ratio={write_ratio} "
+          f"elapsed={elapsed:.2f}s throughput={requests / elapsed:.1f} req/s errors={len(errors)}")
+    for kind, samples in latencies.items():
+        if samples:
+            print(f"{kind:>5}: n={len(samples):<6} p50={percentile(samples, 50):8.2f}ms "
+                  f"p95={percentile(samples, 95):8.2f}ms p99={percentile(samples, 99):8.2f}ms")
+    all_samples = latencies["read"] + latencies["write"]
+    print(f"  all: p99={percentile(all_samples, 99):.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mixed read/write load benchmark against the in-process ASGI app")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--write-ratio", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.requests, args.write_ratio, args.seed))
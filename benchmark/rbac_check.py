@@ -0,0 +1,75 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+
+Microbenchmark: RBAC access check by ACL list scan (previous implementation) vs precompiled PermissionMatrix bitmask.
+Run from the project root folder:
+    python benchmark/rbac_check.py --roles 64 --endpoints 200 --user-roles 8
+"""
+import argparse
+import json
+import random
+import sys
+import pathlib
+import timeit
+
+# SET PYTHONPATH based on the directory from which the program is run
+PROJECT_ROOT = str(pathlib.Path().resolve())
+sys.path.append(PROJECT_ROOT)  # Add to PYTHONPATH
+
+from sql_app.permissions import PermissionMatrix
+
+
+def build_permissions(roles: int, endpoints: int, acl_size: int) -> dict:
+    rbac_roles = [f"role{index:03d}" for index in range(roles)]
+    permissions = {"about": "Synthetic permissions", "rbac_roles": rbac_roles}
+    for index in range(endpoints):
+        permissions[f"GET_endpoint{index:03d}"] = random.sample(rbac_roles, acl_size)
+    return permissions
+
+
+def acl_loop_check(acl: list[str], user_role: list[str]) -> bool:  # Previous RBAC.__call__ implementation
+    for permission in acl:
+        if permission in user_role:
+            return True
+    return False
+
+
+def main(roles: int, endpoints: int, acl_size: int, user_roles: int, number: int):
+    random.seed(42)
+    permissions = build_permissions(roles, endpoints, acl_size)
+    matrix = PermissionMatrix(permissions)
+    endpoint_keys = [key for key in permissions if key.startswith("GET_")]
+    user_role = random.sample(permissions["rbac_roles"], user_roles)
+    user_role_json = json.dumps(user_role)  # How the role list is stored in users.role JSON column
+    user_mask = matrix.role_mask(user_role)
+
+    # Same answers for every endpoint
+    assert all(acl_loop_check(permissions[key], user_role) == matrix.allows(key, user_mask) for key in endpoint_keys)
+
+    cases = {
+        "acl loop + JSON decode (per request)":
+            lambda: [acl_loop_check(permissions[key], json.loads(user_role_json)) for key in endpoint_keys],
+        "acl loop (roles already decoded)":
+            lambda: [acl_loop_check(permissions[key], user_role) for key in endpoint_keys],
+        "bitmask (mask cached per user)":
+            lambda: [matrix.allows(key, user_mask) for key in endpoint_keys],
+    }
+
+    print(f"roles={roles} endpoints={endpoints} acl_size={acl_size} user_roles={user_roles}")
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=number, repeat=5))
+        print(f"{name:<38} {seconds / number / len(endpoint_keys) * 1e9:8.1f} ns/check")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RBAC ACL scan vs bitmask microbenchmark")
+    parser.add_argument("--roles", type=int, default=64)
+    parser.add_argument("--endpoints", type=int, default=200)
+    parser.add_argument("--acl-size", type=int, default=8)
+    parser.add_argument("--user-roles", type=int, default=8)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+    main(args.roles, args.endpoints, args.acl_size, args.user_roles, args.number)
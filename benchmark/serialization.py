@@ -0,0 +1,72 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+
+Microbenchmark: serialization cost of an employee list page (every employee with embedded tickets) by page size,
+default FastAPI response_model path vs sql_app.serialization fast path.
+Run from the project root folder:
+    python benchmark/serialization.py --tickets 3
+"""
+import argparse
+import datetime
+import json
+import sys
+import pathlib
+import timeit
+
+# SET PYTHONPATH based on the directory from which the program is run
+PROJECT_ROOT = str(pathlib.Path().resolve())
+sys.path.append(PROJECT_ROOT)  # Add to PYTHONPATH
+
+from pydantic import TypeAdapter
+from sql_app import models, schemas, serialization
+
+EMPLOYEE_LIST = TypeAdapter(list[schemas.EmployeeResponse])
+
+
+def build_page(page_size: int, tickets: int) -> list[models.Employee]:
+    # Transient ORM objects: attribute access costs the same as for objects loaded by the session
+    return [models.Employee(id=index, first_name="Marry", last_name="Smith", nick_name="Bravo",
+                            phone=f"+3805044{index:05d}", email=f"Marry.Smith{index}@gmail.com",
+                            birthday=datetime.date(1998, 6, 1), country="Ukraine", city="Kyiv",
+                            address="Khreschatyk St, 14, UA 01001", created="2024-08-02 16:37:36", updated=None,
+                            tickets=[models.Ticket(id=index * tickets + number, title="Network problem",
+                                                   description="The employee cannot access network resources.",
+                                                   status="New", employee_id=index, owner_id=1,
+                                                   created="2024-09-08 10:41:19", updated="2024-09-08 10:42:39")
+                                     for number in range(tickets)])
+            for index in range(page_size)]
+
+
+def fastapi_default(page: list) -> bytes:
+    # fastapi.routing.serialize_response(): validate + serialize(mode="json"), then JSONResponse.render()
+    content = EMPLOYEE_LIST.dump_python(EMPLOYEE_LIST.validate_python(page, from_attributes=True), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def fast_path(page: list) -> bytes:
+    return serialization.json_list_response(serialization.EMPLOYEE_ROW, page).body
+
+
+def main(page_sizes: list[int], tickets: int, number: int):
+    print(f"tickets per employee={tickets}")
+    for page_size in page_sizes:
+        page = build_page(page_size, tickets)
+        assert json.loads(fastapi_default(page)) == json.loads(fast_path(page))  # Same response body
+
+        results = {}
+        for name, case in (("fastapi default", fastapi_default), ("fast path", fast_path)):
+            results[name] = min(timeit.repeat(lambda: case(page), number=number, repeat=5)) / number * 1e6
+        print(f"page size {page_size:>4}: " + " | ".join(f"{name} {value:9.1f} us" for name, value in results.items())
+              + f" | x{results['fastapi default'] / results['fast path']:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Employee list page serialization benchmark")
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--tickets", type=int, default=3)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+    main(args.page_sizes, args.tickets, args.number)
@@ -0,0 +1,115 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+
+Benchmark: concurrent read/write throughput of several processes sharing one SQLite file (like uvicorn workers do),
+SQLite defaults (rollback journal, synchronous=FULL) vs "sqlite_pragmas" profile from config.json.
+Run from the project root folder:
+    python benchmark/sqlite_pragmas.py --writers 3 --readers 3 --seconds 5
+"""
+import argparse
+import multiprocessing
+import sqlite3
+import sys
+import pathlib
+import tempfile
+import time
+
+# SET PYTHONPATH based on the directory from which the program is run
+PROJECT_ROOT = str(pathlib.Path().resolve())
+sys.path.append(PROJECT_ROOT)  # Add to PYTHONPATH
+
+from util import get_config
+
+APP_CONFIG = get_config()
+PROFILES = {
+    "default": {"busy_timeout": APP_CONFIG["sqlite_pragmas"].get("busy_timeout", 5000), "journal_mode": "DELETE"},
+    "config": APP_CONFIG["sqlite_pragmas"],
+}
+
+
+def connect(db_path: str, pragmas: dict) -> sqlite3.Connection:
+    connection = sqlite3.connect(db_path, timeout=pragmas.get("busy_timeout", 5000) / 1000)
+    for pragma, value in pragmas.items():  # Same statements as sql_app.database.set_sqlite_pragmas()
+        connection.execute(f"PRAGMA {pragma}={value}")
+    return connection
+
+
+def prepare(db_path: str, pragmas: dict, rows: int):
+    connection = connect(db_path, pragmas)
+    connection.execute("CREATE TABLE tickets (id INTEGER PRIMARY KEY, title VARCHAR(32), description VARCHAR(64), "
+                       "status VARCHAR(16), employee_id INTEGER, owner_id INTEGER, created VARCHAR(19))")
+    connection.executemany("INSERT INTO tickets (title, description, status, employee_id, owner_id, created) "
+                           "VALUES ('Network problem', 'The employee cannot access network resources.', 'New', "
+                           "?, ?, '2024-01-01 00:00:00')", ((index % 100, index % 10) for index in range(rows)))
+    connection.commit()
+    connection.close()
+
+
+def writer(db_path: str, pragmas: dict, deadline: float, results):
+    connection = connect(db_path, pragmas)
+    operations, errors = 0, 0
+    while time.time() < deadline:
+        try:  # One short write transaction per API request: insert + update
+            cursor = connection.execute("INSERT INTO tickets (title, description, status, employee_id, owner_id, "
+                                        "created) VALUES ('Network problem', 'Benchmark', 'New', 1, 1, "
+                                        "'2024-01-01 00:00:00')")
+            connection.execute("UPDATE tickets SET status = 'Closed' WHERE id = ?", (cursor.lastrowid,))
+            connection.commit()
+            operations += 1
+        except sqlite3.OperationalError:
+            connection.rollback()
+            errors += 1
+    results.put(("write", operations, errors))
+
+
+def reader(db_path: str, pragmas: dict, deadline: float, results):
+    connection = connect(db_path, pragmas)
+    operations, errors = 0, 0
+    while time.time() < deadline:
+        try:  # List page read
+            connection.execute("SELECT * FROM tickets WHERE id > ? ORDER BY id LIMIT 100",
+                               (operations * 100 % 10000,)).fetchall()
+            operations += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    results.put(("read", operations, errors))
+
+
+def run_profile(name: str, pragmas: dict, writers: int, readers: int, seconds: float, rows: int):
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = f"{directory}/benchmark.db"
+        prepare(db_path, pragmas, rows)
+
+        results = multiprocessing.Queue()
+        deadline = time.time() + 1 + seconds  # Give processes 1 second to start
+        processes = ([multiprocessing.Process(target=writer, args=(db_path, pragmas, deadline, results))
+                      for _ in range(writers)] +
+                     [multiprocessing.Process(target=reader, args=(db_path, pragmas, deadline, results))
+                      for _ in range(readers)])
+        for process in processes:
+            process.start()
+        totals = {"write": [0, 0], "read": [0, 0]}
+        for _ in processes:
+            kind, operations, errors = results.get()
+            totals[kind][0] += operations
+            totals[kind][1] += errors
+        for process in processes:
+            process.join()
+
+    print(f"{name:>8}: writes {totals['write'][0] / seconds:9.1f}/s (locked errors {totals['write'][1]}), "
+          f"reads {totals['read'][0] / seconds:9.1f}/s (locked errors {totals['read'][1]})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite multi-process read/write throughput by pragma profile")
+    parser.add_argument("--writers", type=int, default=3)
+    parser.add_argument("--readers", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--rows", type=int, default=10000)
+    args = parser.parse_args()
+    print(f"writers={args.writers} readers={args.readers} seconds={args.seconds}")
+    for profile_name, profile_pragmas in PROFILES.items():
+        run_profile(profile_name, profile_pragmas, args.writers, args.readers, args.seconds, args.rows)
@@ -0,0 +1,14 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+
+Load-test and benchmark suite: seeds a benchmark database with configurable volumes, replays weighted scenarios
+of "benchmark" section of test_main.json against the in-process ASGI app or a real uvicorn server and reports
+RPS, p50/p95/p99 latency and SQL queries per endpoint, optionally compared with a saved JSON baseline.
+Run from the project root folder:
+    python -m benchmark.suite seed --users 10000 --employees 10000 --tickets 1000000
+    python -m benchmark.suite run --target asgi --requests 5000 --save-baseline logs/benchmark_baseline.json
+    python -m benchmark.suite run --target uvicorn --workers 3 --compare logs/benchmark_baseline.json
+"""
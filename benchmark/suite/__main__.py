@@ -0,0 +1,179 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import time
+import httpx
+from util import get_config, get_project_root, get_test_main
+from .report import compare, print_report, save_baseline, summarize
+from .scenarios import SCENARIOS, ScenarioContext
+
+APP_CONFIG = get_config()
+TEST_DATA = get_test_main()
+BENCHMARK = TEST_DATA["benchmark"]
+
+
+def get_database_url(db_path: pathlib.Path) -> str:
+    return f"sqlite:///{db_path.resolve()}"
+
+
+def seed_database(db_path: pathlib.Path, volumes: dict, batch_size: int) -> None:
+    for suffix in ("", "-wal", "-shm"):  # Fresh database file of the benchmark
+        pathlib.Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    os.environ["DATABASE_URL"] = get_database_url(db_path)  # Before sql_app is imported
+    from .seed import seed, write_manifest
+
+    began = time.perf_counter()
+    timings = seed(volumes, TEST_DATA, BENCHMARK["password"], batch_size)
+    write_manifest(f"{db_path}.json", volumes, BENCHMARK["password"])
+    print(f"seeded {db_path} in {time.perf_counter() - began:.1f}s: " +
+          ", ".join(f"{table} {volumes.get(table, 0)} rows {seconds}s" for table, seconds in timings.items()))
+
+
+def get_query_count(response: httpx.Response) -> int | None:
+    # 'Server-Timing: db;dur=1.234;desc="2 queries", app;dur=...' of sql_app/timing.py
+    server_timing = response.headers.get("server-timing", "")
+    if 'desc="' not in server_timing:
+        return None
+    return int(server_timing.split('desc="')[1].split()[0])
+
+
+async def run_scenarios(client: httpx.AsyncClient, context: ScenarioContext, requests: int, concurrency: int,
+                        record: bool = True) -> dict:
+    weights = BENCHMARK["scenarios"]
+    plan = iter(context.rng.choices(list(weights), list(weights.values()), k=requests))
+    latencies = {name: [] for name in weights if weights[name]}
+    queries, errors = {name: [] for name in latencies}, {}
+
+    async def worker():
+        for name in plan:  # One iterator shared by all workers
+            started = time.perf_counter()
+            response = await SCENARIOS[name](client, context)
+            latencies[name].append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors[name] = errors.get(name, 0) + 1
+            query_count = get_query_count(response)
+            if query_count is not None:
+                queries[name].append(query_count)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    if not record:
+        return {}
+    return summarize({name: samples for name, samples in latencies.items() if samples}, queries, errors, elapsed)
+
+
+async def run_client(base_url: str, transport: httpx.AsyncBaseTransport | None, manifest: dict, requests: int,
+                     concurrency: int, warmup: int) -> dict:
+    context = ScenarioContext(root_path=APP_CONFIG["root_path"], volumes=manifest["volumes"],
+                              password=manifest["password"], ticket=TEST_DATA["ticket"],
+                              employee=TEST_DATA["employee"])
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits, timeout=60) as client:
+        response = await client.post(context.root_path + "/token",
+                                     data={"username": TEST_DATA["admin_user"]["username"],
+                                           "password": TEST_DATA["admin_user"]["password"]})
+        response.raise_for_status()
+        context.headers = {"Authorization": "Bearer " + response.json()["access_token"]}
+        if warmup:  # Caches, prepared statements, lazy imports
+            await run_scenarios(client, context, warmup, concurrency, record=False)
+        return await run_scenarios(client, context, requests, concurrency)
+
+
+@contextlib.contextmanager
+def uvicorn_server(db_path: pathlib.Path, port: int, workers: int):
+    env = {**os.environ, "DATABASE_URL": get_database_url(db_path)}
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                               "--workers", str(workers), "--log-level", "warning"], env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                if httpx.get(base_url + "/favicon.ico").status_code == 200:
+                    break
+            except httpx.TransportError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("uvicorn did not start")
+                time.sleep(0.1)
+        yield base_url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run_benchmark(args) -> int:
+    with open(f"{args.db}.json") as manifest_file:
+        manifest = json.load(manifest_file)
+
+    if args.target == "asgi":
+        # In-process: one event loop shared by the client and the app, like a single uvicorn worker
+        os.environ["DATABASE_URL"] = get_database_url(args.db)
+        from main import app
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)  # Server errors counted as 5xx
+        result = asyncio.run(run_client("http://benchmark", transport, manifest, args.requests, args.concurrency,
+                                        args.warmup))
+    else:
+        with uvicorn_server(args.db, args.port, args.workers) as base_url:
+            result = asyncio.run(run_client(base_url, None, manifest, args.requests, args.concurrency, args.warmup))
+
+    result["meta"] = {"target": args.target, "workers": args.workers if args.target == "uvicorn" else 1,
+                      "concurrency": args.concurrency, "volumes": manifest["volumes"]}
+    print_report(result)
+    if args.save_baseline:
+        save_baseline(args.save_baseline, result)
+        print(f"baseline saved: {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get("meta") != result["meta"]:
+            print(f"WARNING: baseline was measured with other settings: {baseline.get('meta')}")
+        regressions = compare(result, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmark.suite", description="API load-test and benchmark suite")
+    parser.add_argument("--db", type=pathlib.Path,
+                        default=pathlib.Path(f"{get_project_root()}{BENCHMARK['database_path']}"))
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="create benchmark database with given volumes")
+    for table, count in BENCHMARK["volumes"].items():
+        seed_parser.add_argument(f"--{table}", type=int, default=count)
+    seed_parser.add_argument("--batch-size", type=int, default=10000)
+
+    run_parser = commands.add_parser("run", help="replay weighted scenarios and report latency per endpoint")
+    run_parser.add_argument("--target", choices=["asgi", "uvicorn"], default="asgi")
+    run_parser.add_argument("--requests", type=int, default=5000)
+    run_parser.add_argument("--concurrency", type=int, default=32)
+    run_parser.add_argument("--warmup", type=int, default=200)
+    run_parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    run_parser.add_argument("--port", type=int, default=8766)
+    run_parser.add_argument("--save-baseline", help="write results as JSON baseline")
+    run_parser.add_argument("--compare", help="JSON baseline to compare with, exit code 1 on regression")
+    run_parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 / throughput change")
+
+    args = parser.parse_args()
+    if args.command == "seed":
+        seed_database(args.db, {table: getattr(args, table) for table in BENCHMARK["volumes"]}, args.batch_size)
+        return 0
+    return run_benchmark(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
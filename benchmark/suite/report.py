@@ -0,0 +1,63 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import json
+import statistics
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: dict, queries: dict, errors: dict, elapsed: float) -> dict:
+    # Latencies in milliseconds per scenario, queries: SQL statements per request from Server-Timing header.
+    # Typical (median) query count is compared: occasional extra queries (principal cache miss) are not a change.
+    scenarios = {}
+    for name, samples in latencies.items():
+        scenarios[name] = {"requests": len(samples), "errors": errors.get(name, 0),
+                           "rps": round(len(samples) / elapsed, 1),
+                           "p50": round(percentile(samples, 50), 2), "p95": round(percentile(samples, 95), 2),
+                           "p99": round(percentile(samples, 99), 2),
+                           "queries": statistics.median_low(queries[name]) if queries.get(name) else None}
+    total = sum(len(samples) for samples in latencies.values())
+    return {"total": {"requests": total, "errors": sum(errors.values()), "elapsed": round(elapsed, 2),
+                      "rps": round(total / elapsed, 1)},
+            "scenarios": scenarios}
+
+
+def print_report(result: dict) -> None:
+    total = result["total"]
+    print(f"requests={total['requests']} errors={total['errors']} elapsed={total['elapsed']}s "
+          f"throughput={total['rps']} req/s")
+    print(f"{'endpoint':<30} {'n':>6} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>7}")
+    for name, stats in sorted(result["scenarios"].items()):
+        query_count = stats["queries"] if stats["queries"] is not None else "-"
+        print(f"{name:<30} {stats['requests']:>6} {stats['errors']:>5} {stats['rps']:>8} {stats['p50']:>8} "
+              f"{stats['p95']:>8} {stats['p99']:>8} {query_count:>7}")
+
+
+def save_baseline(path: str, result: dict) -> None:
+    with open(path, "w") as baseline_file:
+        json.dump(result, baseline_file, indent=2)
+
+
+# Regressions against a baseline of the same target and volumes: more SQL queries per request (independent of the
+# machine), total throughput lower or endpoint p95 higher than the tolerance allows
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    if result["total"]["rps"] < baseline["total"]["rps"] * (1 - tolerance):
+        regressions.append(f"throughput {result['total']['rps']} req/s < baseline {baseline['total']['rps']} req/s")
+    for name, stats in result["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        if stats["queries"] is not None and base["queries"] is not None and stats["queries"] > base["queries"]:
+            regressions.append(f"{name}: {stats['queries']} queries per request > baseline {base['queries']}")
+        if stats["p95"] > base["p95"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {stats['p95']} ms > baseline {base['p95']} ms")
+    return regressions
@@ -0,0 +1,114 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import itertools
+import random
+import time
+from dataclasses import dataclass, field
+import httpx
+
+
+def get_username(number: int) -> str:
+    # Usernames are letters only (schemas.json): number in base 26, "bencha", "benchb", ..., "benchba", ...
+    letters = ""
+    while True:
+        number, digit = divmod(number, 26)
+        letters = chr(ord("a") + digit) + letters
+        if not number:
+            return "bench" + letters
+
+
+# State shared by the scenarios of one run: ids of seeded rows, admin token and a sequence for unique values
+@dataclass
+class ScenarioContext:
+    root_path: str
+    volumes: dict
+    password: str
+    ticket: dict
+    employee: dict
+    headers: dict = field(default_factory=dict)
+    rng: random.Random = field(default_factory=lambda: random.Random(42))
+    sequence: itertools.count = field(default_factory=itertools.count)
+    run_id: int = field(default_factory=lambda: int(time.time()) % 10 ** 6)  # New rows differ from earlier runs
+
+    def employee_id(self) -> int:
+        return self.rng.randint(1, self.volumes["employees"])
+
+    def ticket_id(self) -> int:
+        return self.rng.randint(1, self.volumes["tickets"])
+
+    def employee_body(self, employee_id: int | None = None) -> dict:
+        # Unique phone / email: new employees get run id and sequence, updated ones keep the seeded values
+        body = self.employee.copy()
+        if employee_id is None:
+            number = next(self.sequence)
+            body["phone"] = f"+37{self.run_id:06d}{number:07d}"
+            body["email"] = f"bench.{self.run_id}.{number}@example.com"
+        else:
+            body["phone"], body["email"] = f"+39{employee_id:010d}", f"employee{employee_id}@example.com"
+        return body
+
+
+# Scenario: async function (client, context) -> response, named by the endpoint it measures
+async def login(client: httpx.AsyncClient, context: ScenarioContext) -> httpx.Response:
+    username = get_username(context.rng.randint(1, context.volumes["users"])) if context.volumes["users"] else "admin"
+    return await client.post(context.root_path + "/token",
+                             data={"username": username, "password": context.password})
+
+
+async def read_me(client: httpx.AsyncClient, context: ScenarioContext) -> httpx.Response:
+    return await client.get(context.root_path + "/me", headers=context.headers)
+
+
+async def list_tickets(client: httpx.AsyncClient, context: ScenarioContext) -> httpx.Response:
+    return await client.get(context.root_path + "/ticket/", params={"limit": 100}, headers=context.headers)
+
+
+async def read_ticket(client: httpx.AsyncClient, context: ScenarioContext) -> httpx.Response:
+    return await client.get(context.root_path + f"/ticket/{context.ticket_id()}", headers=context.headers)
+
+
+async def create_ticket(client: httpx.AsyncClient, context: ScenarioContext) -> httpx.Response:
+    return await client.post(context.root_path + f"/ticket/{context.employee_id()}", json=context.ticket,
+                             headers=context.headers)
+
+
+async def update_ticket(client: httpx.AsyncClient, context: ScenarioContext) -> httpx.Response:
+    return await client.put(context.root_path + f"/ticket/{context.ticket_id()}", json=context.ticket,
+                            headers=context.headers)
+
+
+async def list_employees(client: httpx.AsyncClient, context: ScenarioContext) -> httpx.Response:
+    return await client.get(context.root_path + "/employee/", params={"limit": 100}, headers=context.headers)
+
+
+async def read_employee(client: httpx.AsyncClient, context: ScenarioContext) -> httpx.Response:
+    return await client.get(context.root_path + f"/employee/{context.employee_id()}", headers=context.headers)
+
+
+async def create_employee(client: httpx.AsyncClient, context: ScenarioContext) -> httpx.Response:
+    return await client.post(context.root_path + "/employee/", json=context.employee_body(), headers=context.headers)
+
+
+async def update_employee(client: httpx.AsyncClient, context: ScenarioContext) -> httpx.Response:
+    employee_id = context.employee_id()
+    return await client.put(context.root_path + f"/employee/{employee_id}", json=context.employee_body(employee_id),
+                            headers=context.headers)
+
+
+# Keys of "benchmark.scenarios" weights in test_main.json
+SCENARIOS = {
+    "POST /token": login,
+    "GET /me": read_me,
+    "GET /ticket/": list_tickets,
+    "GET /ticket/{ticket_id}": read_ticket,
+    "POST /ticket/{employee_id}": create_ticket,
+    "PUT /ticket/{ticket_id}": update_ticket,
+    "GET /employee/": list_employees,
+    "GET /employee/{employee_id}": read_employee,
+    "POST /employee/": create_employee,
+    "PUT /employee/{employee_id}": update_employee,
+}
@@ -0,0 +1,88 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import json
+import random
+import time
+from datetime import date
+from passlib.context import CryptContext
+from sqlalchemy import insert
+from sql_app import migrations, models
+from sql_app.database import engine
+from sql_app.hashing import get_pwd_context_options
+from util import get_config
+from .scenarios import get_username
+
+APP_CONFIG = get_config()
+PWD_CONTEXT = CryptContext(**get_pwd_context_options(APP_CONFIG["auth"]["PWD_CONTEXT"]))
+
+USER_ROLES = ["manager", "support"]  # Seeded users, the admin user of test_main.json is added too
+
+
+def batches(rows, batch_size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Rows are copies of test_main.json records (valid for the response schemas) with unique phone / email / username
+def user_rows(count: int, user: dict, hashed_password: str, created: int):
+    for number in range(1, count + 1):
+        yield {**user, "username": get_username(number), "phone": f"+38{number:010d}",
+               "email": f"bench{number}@example.com", "role": [USER_ROLES[number % len(USER_ROLES)]],
+               "hashed_password": hashed_password, "created": created}
+
+
+def employee_rows(count: int, employee: dict, created: int):
+    for number in range(1, count + 1):
+        yield {**employee, "phone": f"+39{number:010d}", "email": f"employee{number}@example.com",
+               "created": created}
+
+
+def ticket_rows(count: int, ticket: dict, users: int, employees: int, started: int):
+    rng = random.Random(42)  # Same data set on every seed
+    for number in range(1, count + 1):
+        yield {**ticket, "employee_id": rng.randint(1, employees), "owner_id": rng.randint(1, users + 1),
+               "created": started + number}
+
+
+# Fills an empty database (DATABASE_URL is set by the caller before sql_app is imported). Rows are inserted by
+# executemany in batches, one password hash is shared by all users: hashing 10k Argon2 passwords would take minutes.
+def seed(volumes: dict, test_data: dict, password: str, batch_size: int = 10000) -> dict:
+    migrations.prepare_database(engine, auto_migrate=True)
+    hashed_password = PWD_CONTEXT.hash(password)
+    now = int(time.time())
+    started = now - volumes["tickets"]  # Tickets are created one per second until now
+    user = {key: test_data["user"][key] for key in ("first_name", "last_name", "disabled", "login_denied")}
+    employee = {**test_data["employee"], "birthday": date.fromisoformat(test_data["employee"]["birthday"])}
+
+    timings = {}
+    with engine.begin() as connection:
+        began = time.perf_counter()
+        connection.execute(insert(models.User.__table__), [{
+            **user, "username": test_data["admin_user"]["username"], "phone": "+370000000000",
+            "email": "admin@example.com", "role": ["admin"],
+            "hashed_password": PWD_CONTEXT.hash(test_data["admin_user"]["password"]), "created": now}])
+        for table, rows in ((models.User.__table__, user_rows(volumes["users"], user, hashed_password, now)),
+                            (models.Employee.__table__, employee_rows(volumes["employees"], employee, now)),
+                            (models.Ticket.__table__, ticket_rows(volumes["tickets"], test_data["ticket"],
+                                                                  volumes["users"], volumes["employees"], started))):
+            for batch in batches(rows, batch_size):
+                connection.execute(insert(table), batch)
+            timings[table.name] = round(time.perf_counter() - began, 2)
+            began = time.perf_counter()
+    return timings
+
+
+def write_manifest(path: str, volumes: dict, password: str) -> None:
+    # Volumes and password of the seeded users, read by the runner to pick existing ids and log in
+    with open(path, "w") as manifest_file:
+        json.dump({"volumes": volumes, "password": password}, manifest_file, indent=2)
@@ -4,21 +4,40 @@ Author: Volodymyr Letiahin
 Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
 License: MIT
 """
-from fastapi import Depends, FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import BackgroundTasks, Body, Depends, FastAPI, Form, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import Annotated
-from sqlalchemy.orm import Session
-from util import get_config, get_permissions, raise_http_error
-from sql_app import crud, models, schemas, auth
-from sql_app.database import engine, get_db
+from typing import Annotated, Literal
+from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from util import get_config, get_project_root, raise_http_error
+from sql_app import crud, schemas, auth, migrations, export, conditional, metrics, timing, logs, ratelimit
+from sql_app.database import engine, async_engine, get_async_db
+from sql_app.openapi_cache import install_openapi_cache
+from sql_app.pagination import set_next_cursor
+from sql_app.serialization import json_list_response, USER_ROW, EMPLOYEE_ROW, TICKET_ROW
 
 APP_CONFIG = get_config()  # Project config data
-PERMISSIONS = get_permissions()  # Project access permission data
-models.Base.metadata.create_all(bind=engine)  # Create all empty tables by "if not exist" condition
+migrations.prepare_database(engine, auto_migrate=APP_CONFIG["database"]["auto_migrate"])  # Schema version check
+metrics.instrument_pool(async_engine)
 
-app = FastAPI(root_path=APP_CONFIG["root_path"],
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_listeners = logs.start_queue_logging()  # Per worker: file and console writes move to a background thread
+    sweeper = asyncio.create_task(auth.sweep_refresh_tokens(
+        APP_CONFIG["auth"]["REFRESH_TOKEN"]["sweep_interval_minutes"] * 60))
+    yield
+    sweeper.cancel()
+    logs.stop_queue_logging(log_listeners)
+    metrics.mark_process_dead()  # Worker stops: its live gauges leave the aggregate of /metrics
+
+
+app = FastAPI(lifespan=lifespan,
+              root_path=APP_CONFIG["root_path"],
               title=APP_CONFIG["api_docs"]["title"],
               version=APP_CONFIG["api_docs"]["version"],
               summary=APP_CONFIG["api_docs"]["summary"],
@@ -35,8 +54,12 @@ app.add_middleware(
     allow_origins=APP_CONFIG["cors"]["allow_origins"],
     allow_credentials=APP_CONFIG["cors"]["allow_credentials"],
     allow_methods=APP_CONFIG["cors"]["allow_methods"],
-    allow_headers=APP_CONFIG["cors"]["allow_headers"]
+    allow_headers=APP_CONFIG["cors"]["allow_headers"],
+    expose_headers=APP_CONFIG["cors"]["expose_headers"]
 )
+app.add_middleware(logs.AccessLogMiddleware)
+app.add_middleware(timing.ServerTimingMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)  # Outermost: latency of the whole request, CORS included
 
 
 @app.get('/favicon.ico', include_in_schema=False)  # Exclude request from DOCS schema
@@ -52,30 +75,43 @@ async def favicon():
 # The OAuth2 specification dictates that for a password flow the data should be collected using form data
 # (instead of JSON) and that it should have the specific fields `username` and `password`.
 @app.post("/token", tags=["Authentication"])
-async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-                                 db: Session = Depends(get_db)
+async def login_for_access_token(request: Request, form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+                                 background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_async_db)
                                  ) -> schemas.AuthToken:
-    db_user = crud.get_user_by_username(db, username=form_data.username)
-    user = auth.authenticate_user(db_user, form_data.password)
+    # Throttled client IP or username is rejected before the user lookup and the password hash
+    await ratelimit.LOGIN_RATE_LIMITER.check(request.client.host if request.client else None, form_data.username)
+
+    db_user = await crud.get_user_by_username(db, username=form_data.username)
+    user = await auth.authenticate_user(db_user, form_data.password, background_tasks)
 
     if not user:
+        await ratelimit.LOGIN_RATE_LIMITER.login_failed(form_data.username)
         raise_http_error(APP_CONFIG["raise_error"]["incorrect_user_name_or_password"])
 
-    access_token_expires = auth.timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = auth.create_access_token(
-        data={"sub": user.username, "scopes": form_data.scopes},
-        expires_delta=access_token_expires,
-    )
-    return schemas.AuthToken(access_token=access_token, token_type="bearer")
+    await ratelimit.LOGIN_RATE_LIMITER.login_succeeded(form_data.username)
+    return await auth.create_tokens(db, user_id=user.id, username=user.username, scopes=form_data.scopes)
+
+
+# Refresh token grant: new access token without the password (and its Argon2 verify). Refresh token is rotated:
+# response carries a new one, the presented one can't be used again (a second use revokes all tokens of the login).
+@app.post("/token/refresh", tags=["Authentication"])
+async def refresh_access_token(refresh_token: Annotated[str, Form()],
+                               db: AsyncSession = Depends(get_async_db)) -> schemas.AuthToken:
+    return await auth.refresh_tokens(db, refresh_token)
 
 
 @app.get("/me", response_model=schemas.UserResponse, tags=["Authentication"])
-async def read_about_me(current_user: Annotated[schemas.UserResponse, Depends(auth.get_current_user)]):
-    return current_user
+async def read_about_me(current_user: Annotated[schemas.AuthPrincipal, Depends(auth.get_current_user)],
+                        db: AsyncSession = Depends(get_async_db)):
+    # Principal keeps authorization data only, so full User profile is read from database
+    db_user = await crud.get_user_by_id(db, user_id=current_user.id)
+    if db_user is None:
+        raise_http_error(APP_CONFIG["raise_error"]["incorrect_user_name_or_password"])
+    return db_user
 
 
 @app.get("/status", tags=["Authentication"])
-async def read_my_status(current_user: Annotated[schemas.UserResponse, Depends(auth.get_current_active_user)]):
+async def read_my_status(current_user: Annotated[schemas.AuthPrincipal, Depends(auth.get_current_active_user)]):
     return {"status": "ok"}
 
 
@@ -83,34 +119,74 @@ async def read_my_status(current_user: Annotated[schemas.UserResponse, Depends(a
 # Need to choose optional attribute scopes=["status"] under Login process, then scope list added to JWT token
 # It is just example - in fact we don't need use scope Security for this project...
 @app.get("/token/scope_example", tags=["Authentication"])
-async def read_scope_example(current_user: Annotated[schemas.UserResponse, auth.Security(auth.get_current_active_user,
+async def read_scope_example(current_user: Annotated[schemas.AuthPrincipal, auth.Security(auth.get_current_active_user,
                                                                                   scopes=["scope_example"])]):
     return {"status": "Access allowed base on token 'scopes': ['scope_example']"}
 
 
+""" Monitoring ---------------------------------------------------------------------------------------------------- """
+
+
+# Prometheus text format, aggregated over all worker processes: per route / method / status request counts and
+# latency histograms, requests in progress, database pool, Argon2 hash time and load (see sql_app/metrics.py)
+@app.get("/metrics", tags=["Monitoring"])
+async def read_metrics(permission: bool = Depends(auth.RBAC(endpoint="GET_metrics"))):
+    content, media_type = metrics.render_metrics()
+    return Response(content=content, media_type=media_type)
+
+
 """ USER ------------------------------------------------------------------------------------------------------- """
 
 
 # Create (POST)
 @app.post("/user/", response_model=schemas.UserResponse, tags=["User"])
-async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db),
-                      permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["POST_user"]))):
-    return crud.create_user(db=db, user=user)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db),
+                      permission: bool = Depends(auth.RBAC(endpoint="POST_user"))):
+    return await crud.create_user(db=db, user=user)
 
 
 # Read (GET) ALL
+# Pagination: by "skip" & "limit" or by opaque "cursor" & "limit" (next page cursor is returned in X-Next-Cursor header)
+# List responses are dumped straight from rows by json_list_response() (response_model documents the same JSON)
+# Filters of all lists: created_after / updated_since, ISO date-time or Unix timestamp (UTC if no timezone given)
+# Conditional GET: lists and records carry ETag, request with If-None-Match of the current one gets 304 Not Modified
+# after a cheap version query, without loading or serializing the rows (see sql_app/conditional.py)
 @app.get("/user/", response_model=list[schemas.UserResponse], tags=["User"])
-async def read_all_users(skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"],
-                         db: Session = Depends(get_db),
-                         permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["GET_user"]))):
-    return crud.get_users(db, skip=skip, limit=limit)
+async def read_all_users(request: Request, skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"],
+                         cursor: str | None = None, created_after: datetime | None = None,
+                         updated_since: datetime | None = None,
+                         db: AsyncSession = Depends(get_async_db),
+                         permission: bool = Depends(auth.RBAC(endpoint="GET_user"))):
+    if conditional.is_conditional(request):
+        version = await crud.get_users_version(db, skip=skip, limit=limit, cursor=cursor,
+                                               created_after=created_after, updated_since=updated_since)
+        not_modified = conditional.not_modified(request, version)
+        if not_modified is not None:
+            return not_modified
+
+    items = await crud.get_users(db, skip=skip, limit=limit, cursor=cursor,
+                                 created_after=created_after, updated_since=updated_since)
+    response = json_list_response(USER_ROW, items)
+    set_next_cursor(response, items, limit)
+    return conditional.set_validators(response, conditional.rows_version(items))
+
+
+# Export (GET) ALL -> whole table streamed as NDJSON or CSV in batches, optionally gzip compressed
+@app.get("/user/export", tags=["User"])
+async def export_users(request: Request,
+                       export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+                       gzip: bool = False, created_after: datetime | None = None,
+                       updated_since: datetime | None = None,
+                       permission: bool = Depends(auth.RBAC(endpoint="GET_user_export"))):
+    return export.export_response("users", export_format, gzip, created_after, updated_since,
+                                  request.headers.get("Accept-Encoding", ""))
 
 
 # Read (GET)
 @app.get("/user/{user_id}", response_model=schemas.UserResponse, tags=["User"])
-async def read_user_by_id(user_id: int, db: Session = Depends(get_db),
-                          permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["GET_user_user_id"]))):
-    db_user = crud.get_user_by_id(db, user_id=user_id)
+async def read_user_by_id(user_id: int, db: AsyncSession = Depends(get_async_db),
+                          permission: bool = Depends(auth.RBAC(endpoint="GET_user_user_id"))):
+    db_user = await crud.get_user_by_id(db, user_id=user_id)
     if db_user is None:
         raise_http_error(APP_CONFIG["raise_error"]["user_not_found"])
     return db_user
@@ -118,9 +194,9 @@ async def read_user_by_id(user_id: int, db: Session = Depends(get_db),
 
 # Read (GET)
 @app.get("/user/username/{username}", response_model=schemas.UserResponse, tags=["User"])
-async def read_user_by_username(username: str, db: Session = Depends(get_db),
-                          permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["GET_user_username"]))):
-    db_user = crud.get_user_by_username(db=db, username=username)
+async def read_user_by_username(username: str, db: AsyncSession = Depends(get_async_db),
+                          permission: bool = Depends(auth.RBAC(endpoint="GET_user_username"))):
+    db_user = await crud.get_user_by_username(db=db, username=username)
     if db_user is None:
         raise_http_error(APP_CONFIG["raise_error"]["user_not_found"])
     return db_user
@@ -128,9 +204,9 @@ async def read_user_by_username(username: str, db: Session = Depends(get_db),
 
 # Read (GET)
 @app.get("/user/phone/{phone}", response_model=schemas.UserResponse, tags=["User"])
-async def read_user_by_phone(phone: str, db: Session = Depends(get_db),
-                          permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["GET_user_phone"]))):
-    db_user = crud.get_user_by_phone(db=db, phone=phone)
+async def read_user_by_phone(phone: str, db: AsyncSession = Depends(get_async_db),
+                          permission: bool = Depends(auth.RBAC(endpoint="GET_user_phone"))):
+    db_user = await crud.get_user_by_phone(db=db, phone=phone)
     if db_user is None:
         raise_http_error(APP_CONFIG["raise_error"]["user_not_found"])
     return db_user
@@ -138,9 +214,9 @@ async def read_user_by_phone(phone: str, db: Session = Depends(get_db),
 
 # Read (GET)
 @app.get("/user/email/{email}", response_model=schemas.UserResponse, tags=["User"])
-async def read_user_by_email(email: str, db: Session = Depends(get_db),
-                          permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["GET_user_email"]))):
-    db_user = crud.get_user_by_email(db=db, email=email)
+async def read_user_by_email(email: str, db: AsyncSession = Depends(get_async_db),
+                          permission: bool = Depends(auth.RBAC(endpoint="GET_user_email"))):
+    db_user = await crud.get_user_by_email(db=db, email=email)
     if db_user is None:
         raise_http_error(APP_CONFIG["raise_error"]["user_not_found"])
     return db_user
@@ -148,72 +224,76 @@ async def read_user_by_email(email: str, db: Session = Depends(get_db),
 
 # Update (PUT)
 @app.put("/user/{user_id}", response_model=schemas.UserResponse, tags=["User"])
-async def update_user_by_id(user_id: int, user: schemas.UserBase, db: Session = Depends(get_db),
-                            permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["PUT_user_user_id"]))):
-    return crud.update_user(db=db, user_id=user_id, user=user)
+async def update_user_by_id(user_id: int, user: schemas.UserBase, db: AsyncSession = Depends(get_async_db),
+                            permission: bool = Depends(auth.RBAC(endpoint="PUT_user_user_id"))):
+    return await crud.update_user(db=db, user_id=user_id, user=user)
 
 
 # Delete (DELETE)
 @app.delete("/user/{user_id}", tags=["User"])
-async def delete_user_by_id(user_id: int, db: Session = Depends(get_db),
-                            permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["DELETE_user_user_id"]))):
-    return crud.delete_user(db=db, user_id=user_id)
+async def delete_user_by_id(user_id: int, db: AsyncSession = Depends(get_async_db),
+                            permission: bool = Depends(auth.RBAC(endpoint="DELETE_user_user_id"))):
+    return await crud.delete_user(db=db, user_id=user_id)
 
 
 # Update attribute (PATCH)
 @app.patch("/user/password", tags=["User"])
 async def change_my_password(user: schemas.UserPasswordAttr,
-                             current_user: Annotated[schemas.UserResponse, Depends(auth.get_current_user)],
-                             db: Session = Depends(get_db),
-                             permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["PATCH_user_password"]))):
-    return crud.update_user_password(db=db, user_id=current_user.id, user=user)
+                             current_user: Annotated[schemas.AuthPrincipal, Depends(auth.get_current_user)],
+                             db: AsyncSession = Depends(get_async_db),
+                             permission: bool = Depends(auth.RBAC(endpoint="PATCH_user_password"))):
+    return await crud.update_user_password(db=db, user_id=current_user.id, user=user)
 
 
 # Update attribute (PATCH)
 @app.patch("/user/{user_id}/contacts", response_model=schemas.UserResponse, tags=["User"])
-async def update_user_contacts_by_id(user_id: int, user: schemas.UserContactsAttr, db: Session = Depends(get_db),
-                            permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["PATCH_user_user_id_contacts"]))):
-    return crud.update_user(db=db, user_id=user_id, user=user)
+async def update_user_contacts_by_id(user_id: int, user: schemas.UserContactsAttr,
+                                     db: AsyncSession = Depends(get_async_db),
+                            permission: bool = Depends(auth.RBAC(endpoint="PATCH_user_user_id_contacts"))):
+    return await crud.update_user(db=db, user_id=user_id, user=user)
 
 
 # Update attribute (PATCH)
 @app.patch("/user/{user_id}/password", tags=["User"])
-async def update_user_password_by_id(user_id: int, user: schemas.UserPasswordAttr, db: Session = Depends(get_db),
+async def update_user_password_by_id(user_id: int, user: schemas.UserPasswordAttr,
+                                     db: AsyncSession = Depends(get_async_db),
                                      permission: bool = Depends(
-                                         auth.RBAC(acl=PERMISSIONS["PATCH_user_user_id_password"]))):
-    return crud.update_user_password(db=db, user_id=user_id, user=user)
+                                         auth.RBAC(endpoint="PATCH_user_user_id_password"))):
+    return await crud.update_user_password(db=db, user_id=user_id, user=user)
 
 
 # Update attribute (PATCH)
 @app.patch("/user/{user_id}/username", response_model=schemas.UserResponse, tags=["User"])
-async def update_user_username_by_id(user_id: int, user: schemas.UserUsernameAttr, db: Session = Depends(get_db),
+async def update_user_username_by_id(user_id: int, user: schemas.UserUsernameAttr,
+                                     db: AsyncSession = Depends(get_async_db),
                                      permission: bool = Depends(
-                                         auth.RBAC(acl=PERMISSIONS["PATCH_user_user_id_username"]))):
-    return crud.update_user(db=db, user_id=user_id, user=user)
+                                         auth.RBAC(endpoint="PATCH_user_user_id_username"))):
+    return await crud.update_user(db=db, user_id=user_id, user=user)
 
 
 # Update attribute (PATCH)
 @app.patch("/user/{user_id}/role", response_model=schemas.UserResponse, tags=["User"])
-async def update_user_role_by_id(user_id: int, user: schemas.UserRoleAttr, db: Session = Depends(get_db),
-                                 permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["PATCH_user_user_id_role"]))):
-    return crud.update_user(db=db, user_id=user_id, user=user)
+async def update_user_role_by_id(user_id: int, user: schemas.UserRoleAttr, db: AsyncSession = Depends(get_async_db),
+                                 permission: bool = Depends(auth.RBAC(endpoint="PATCH_user_user_id_role"))):
+    return await crud.update_user(db=db, user_id=user_id, user=user)
 
 
 # Update attribute (PATCH)
 @app.patch("/user/{user_id}/disabled", response_model=schemas.UserResponse, tags=["User"])
-async def update_user_disabled_by_id(user_id: int, user: schemas.UserDisabledAttr, db: Session = Depends(get_db),
+async def update_user_disabled_by_id(user_id: int, user: schemas.UserDisabledAttr,
+                                     db: AsyncSession = Depends(get_async_db),
                                      permission: bool = Depends(
-                                         auth.RBAC(acl=PERMISSIONS["PATCH_user_user_id_disabled"]))):
-    return crud.update_user(db=db, user_id=user_id, user=user)
+                                         auth.RBAC(endpoint="PATCH_user_user_id_disabled"))):
+    return await crud.update_user(db=db, user_id=user_id, user=user)
 
 
 # Update attribute (PATCH)
 @app.patch("/user/{user_id}/login_denied", response_model=schemas.UserResponse, tags=["User"])
 async def update_user_login_denied_by_id(user_id: int, user: schemas.UserLoginDeniedAttr,
-                                         db: Session = Depends(get_db),
+                                         db: AsyncSession = Depends(get_async_db),
                                          permission: bool = Depends(
-                                             auth.RBAC(acl=PERMISSIONS["PATCH_user_user_id_login_denied"]))):
-    return crud.update_user(db=db, user_id=user_id, user=user)
+                                             auth.RBAC(endpoint="PATCH_user_user_id_login_denied"))):
+    return await crud.update_user(db=db, user_id=user_id, user=user)
 
 
 """ EMPLOYEE ---------------------------------------------------------------------------------------------------- """
@@ -221,102 +301,225 @@ async def update_user_login_denied_by_id(user_id: int, user: schemas.UserLoginDe
 
 # Create (POST)
 @app.post("/employee/", response_model=schemas.EmployeeResponse, tags=["Employee"])
-async def create_employee(employee: schemas.EmployeeCreate, db: Session = Depends(get_db),
-                          permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["POST_employee"]))):
-    return crud.create_employee(db=db, employee=employee)
+async def create_employee(employee: schemas.EmployeeCreate, db: AsyncSession = Depends(get_async_db),
+                          permission: bool = Depends(auth.RBAC(endpoint="POST_employee"))):
+    return await crud.create_employee(db=db, employee=employee)
+
+
+# Create (POST) BULK -> request is validated as a whole (422, as single item requests), items are created one
+# chunk after another: an item failing in the database (phone already registered) doesn't reject the batch
+@app.post("/employee/bulk", response_model=schemas.BulkResponse, tags=["Employee"])
+async def create_employees_bulk(employees: Annotated[list[schemas.EmployeeCreate],
+                                                     Body(max_length=APP_CONFIG["BULK_REQUEST_ITEMS_LIMIT"])],
+                                db: AsyncSession = Depends(get_async_db),
+                                permission: bool = Depends(auth.RBAC(endpoint="POST_employee_bulk"))):
+    return await crud.create_employees_bulk(db=db, employees=employees)
 
 
 # Read (GET) ALL
 @app.get("/employee/", response_model=list[schemas.EmployeeResponse], tags=["Employee"])
-async def read_all_employees(skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"],
-                             db: Session = Depends(get_db),
-                             permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["GET_employee"]))):
-    return crud.get_employees(db, skip=skip, limit=limit)
+# Embedded tickets: all by default, skipped by include_tickets=false or capped per employee by tickets_limit
+async def read_all_employees(request: Request, skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"],
+                             cursor: str | None = None, include_tickets: bool = True, tickets_limit: int | None = None,
+                             created_after: datetime | None = None, updated_since: datetime | None = None,
+                             db: AsyncSession = Depends(get_async_db),
+                             permission: bool = Depends(auth.RBAC(endpoint="GET_employee"))):
+    include_tickets = crud.tickets_included(include_tickets, tickets_limit)
+    if conditional.is_conditional(request):
+        version = await crud.get_employees_version(db, skip=skip, limit=limit, cursor=cursor,
+                                                   include_tickets=include_tickets, tickets_limit=tickets_limit,
+                                                   created_after=created_after, updated_since=updated_since)
+        not_modified = conditional.not_modified(request, version)
+        if not_modified is not None:
+            return not_modified
+
+    items = await crud.get_employees(db, skip=skip, limit=limit, cursor=cursor,
+                                     include_tickets=include_tickets, tickets_limit=tickets_limit,
+                                     created_after=created_after, updated_since=updated_since)
+    response = json_list_response(EMPLOYEE_ROW, items)
+    set_next_cursor(response, items, limit)
+    return conditional.set_validators(response, conditional.rows_version(items, "tickets" if include_tickets else None))
+
+
+# Export (GET) ALL -> whole table streamed as NDJSON or CSV in batches (without embedded tickets)
+@app.get("/employee/export", tags=["Employee"])
+async def export_employees(request: Request,
+                           export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+                           gzip: bool = False, created_after: datetime | None = None,
+                           updated_since: datetime | None = None,
+                           permission: bool = Depends(auth.RBAC(endpoint="GET_employee_export"))):
+    return export.export_response("employees", export_format, gzip, created_after, updated_since,
+                                  request.headers.get("Accept-Encoding", ""))
+
+
+# Search (GET) -> ranked full-text search, every word matches as prefix: "smi kyi" finds "Smith" in "Kyiv"
+@app.get("/employee/search", response_model=list[schemas.EmployeeResponse], tags=["Employee"])
+async def search_employees(q: str, skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"],
+                           include_tickets: bool = True, tickets_limit: int | None = None,
+                           db: AsyncSession = Depends(get_async_db),
+                           permission: bool = Depends(auth.RBAC(endpoint="GET_employee_search"))):
+    items = await crud.search_employees(db, query=q, skip=skip, limit=limit,
+                                        include_tickets=include_tickets, tickets_limit=tickets_limit)
+    return json_list_response(EMPLOYEE_ROW, items)
 
 
 # Read (GET)
 @app.get("/employee/{employee_id}", response_model=schemas.EmployeeResponse, tags=["Employee"])
-async def read_employee(employee_id: int, db: Session = Depends(get_db),
-                        permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["GET_employee_employee_id"]))):
-    db_employee = crud.get_employee(db, employee_id=employee_id)
+async def read_employee(employee_id: int, request: Request, response: Response, include_tickets: bool = True,
+                        tickets_limit: int | None = None, db: AsyncSession = Depends(get_async_db),
+                        permission: bool = Depends(auth.RBAC(endpoint="GET_employee_employee_id"))):
+    # Last-Modified only without embedded tickets: deleted ticket changes the response without newer timestamp
+    include_tickets = crud.tickets_included(include_tickets, tickets_limit)
+    if conditional.is_conditional(request):
+        version = await crud.get_employee_version(db, employee_id=employee_id,
+                                                  include_tickets=include_tickets, tickets_limit=tickets_limit)
+        not_modified = conditional.not_modified(request, version, last_modified=not include_tickets)
+        if not_modified is not None:
+            return not_modified
+
+    db_employee = await crud.get_employee(db, employee_id=employee_id,
+                                          include_tickets=include_tickets, tickets_limit=tickets_limit)
     if db_employee is None:
         raise_http_error(APP_CONFIG["raise_error"]["employee_not_found"])
 
+    version = conditional.rows_version([db_employee], "tickets" if include_tickets else None)
+    conditional.set_validators(response, version, last_modified=not include_tickets)
     return db_employee
 
 
 # Update (PUT)
 @app.put("/employee/{employee_id}", response_model=schemas.EmployeeResponse, tags=["Employee"])
-async def update_employee(employee_id: int, employee: schemas.EmployeeUpdate, db: Session = Depends(get_db),
-                          permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["PUT_employee_employee_id"]))):
-    return crud.update_employee(db=db, employee_id=employee_id, employee=employee)
+async def update_employee(employee_id: int, employee: schemas.EmployeeUpdate, db: AsyncSession = Depends(get_async_db),
+                          permission: bool = Depends(auth.RBAC(endpoint="PUT_employee_employee_id"))):
+    return await crud.update_employee(db=db, employee_id=employee_id, employee=employee)
 
 
 # Delete (DELETE)
 @app.delete("/employee/{employee_id}", tags=["Employee"])
-async def delete_employee(employee_id: int, db: Session = Depends(get_db),
-                          permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["DELETE_employee_employee_id"]))):
-    return crud.delete_employee(db=db, employee_id=employee_id)
+async def delete_employee(employee_id: int, db: AsyncSession = Depends(get_async_db),
+                          permission: bool = Depends(auth.RBAC(endpoint="DELETE_employee_employee_id"))):
+    return await crud.delete_employee(db=db, employee_id=employee_id)
 
 
 """ Ticket ---------------------------------------------------------------------------------------------------- """
 
 
+# Create (POST) BULK -> declared before "/ticket/{employee_id}" route, which would catch "bulk" as employee_id
+@app.post("/ticket/bulk", response_model=schemas.BulkResponse, tags=["Ticket"])
+async def create_tickets_bulk(current_user: Annotated[schemas.AuthPrincipal, Depends(auth.get_current_user)],
+                              tickets: Annotated[list[schemas.TicketBulkCreate],
+                                                 Body(max_length=APP_CONFIG["BULK_REQUEST_ITEMS_LIMIT"])],
+                              db: AsyncSession = Depends(get_async_db),
+                              permission: bool = Depends(auth.RBAC(endpoint="POST_ticket_bulk"))):
+    return await crud.create_tickets_bulk(db=db, tickets=tickets, user_id=current_user.id)
+
+
 # Create (POST)
 @app.post("/ticket/{employee_id}", response_model=schemas.TicketResponse, tags=["Ticket"])
-async def create_ticket_for_employee(current_user: Annotated[schemas.UserResponse, Depends(auth.get_current_user)],
-                                     employee_id: int, ticket: schemas.TicketCreate, db: Session = Depends(get_db),
-                                     permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["POST_ticket"]))):
-    db_employee = crud.get_employee(db, employee_id=employee_id)
+async def create_ticket_for_employee(current_user: Annotated[schemas.AuthPrincipal, Depends(auth.get_current_user)],
+                                     employee_id: int, ticket: schemas.TicketCreate,
+                                     db: AsyncSession = Depends(get_async_db),
+                                     permission: bool = Depends(auth.RBAC(endpoint="POST_ticket"))):
+    db_employee = await crud.get_employee(db, employee_id=employee_id, include_tickets=False)
     if db_employee is None:
         raise_http_error(APP_CONFIG["raise_error"]["employee_not_found"])
 
-    return crud.create_ticket(db=db, ticket=ticket, user_id=current_user.id, employee_id=employee_id)
+    return await crud.create_ticket(db=db, ticket=ticket, user_id=current_user.id, employee_id=employee_id)
 
 
 # Read (GET) ALL
 @app.get("/ticket/", response_model=list[schemas.TicketResponse], tags=["Ticket"])
-async def read_all_tickets(skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"],
-                           db: Session = Depends(get_db),
-                           permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["GET_ticket"]))):
-    items = crud.get_tickets(db, skip=skip, limit=limit)
-    return items
+async def read_all_tickets(request: Request, skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"],
+                           cursor: str | None = None, created_after: datetime | None = None,
+                           updated_since: datetime | None = None,
+                           db: AsyncSession = Depends(get_async_db),
+                           permission: bool = Depends(auth.RBAC(endpoint="GET_ticket"))):
+    if conditional.is_conditional(request):
+        version = await crud.get_tickets_version(db, skip=skip, limit=limit, cursor=cursor,
+                                                 created_after=created_after, updated_since=updated_since)
+        not_modified = conditional.not_modified(request, version)
+        if not_modified is not None:
+            return not_modified
+
+    items = await crud.get_tickets(db, skip=skip, limit=limit, cursor=cursor,
+                                   created_after=created_after, updated_since=updated_since)
+    response = json_list_response(TICKET_ROW, items)
+    set_next_cursor(response, items, limit)
+    return conditional.set_validators(response, conditional.rows_version(items))
+
+
+# Export (GET) ALL -> whole table streamed as NDJSON or CSV in batches, optionally gzip compressed
+@app.get("/ticket/export", tags=["Ticket"])
+async def export_tickets(request: Request,
+                         export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+                         gzip: bool = False, created_after: datetime | None = None,
+                         updated_since: datetime | None = None,
+                         permission: bool = Depends(auth.RBAC(endpoint="GET_ticket_export"))):
+    return export.export_response("tickets", export_format, gzip, created_after, updated_since,
+                                  request.headers.get("Accept-Encoding", ""))
+
+
+# Search (GET) -> ranked full-text search by title and description, every word matches as prefix
+@app.get("/ticket/search", response_model=list[schemas.TicketResponse], tags=["Ticket"])
+async def search_tickets(q: str, skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"],
+                         db: AsyncSession = Depends(get_async_db),
+                         permission: bool = Depends(auth.RBAC(endpoint="GET_ticket_search"))):
+    items = await crud.search_tickets(db, query=q, skip=skip, limit=limit)
+    return json_list_response(TICKET_ROW, items)
 
 
 # Read (GET)
 @app.get("/ticket/{ticket_id}", response_model=schemas.TicketResponse, tags=["Ticket"])
-async def read_ticket(ticket_id: int, db: Session = Depends(get_db),
-                      permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["GET_ticket"]))):
-    db_ticket = crud.get_ticket(db, ticket_id=ticket_id)
+async def read_ticket(ticket_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db),
+                      permission: bool = Depends(auth.RBAC(endpoint="GET_ticket"))):
+    db_ticket = await crud.get_ticket(db, ticket_id=ticket_id)
     if db_ticket is None:
         raise_http_error(APP_CONFIG["raise_error"]["ticket_not_found"])
 
+    # One row is the whole response: version comes from it, 304 saves serialization of the response
+    version = conditional.rows_version([db_ticket])
+    not_modified = conditional.not_modified(request, version, last_modified=True)
+    if not_modified is not None:
+        return not_modified
+    conditional.set_validators(response, version, last_modified=True)
     return db_ticket
 
 
 # Read (GET) MY
 @app.get("/ticket/my/", response_model=list[schemas.TicketResponse], tags=["Ticket"])
-async def read_my_tickets(current_user: Annotated[schemas.UserResponse, Depends(auth.get_current_user)],
-                          skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"],
-                          db: Session = Depends(get_db),
-                          permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["GET_ticket"]))):
-    items = crud.get_my_tickets(db, skip=skip, limit=limit, owner_id=current_user.id)
-    return items
+async def read_my_tickets(current_user: Annotated[schemas.AuthPrincipal, Depends(auth.get_current_user)],
+                          request: Request, skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"],
+                          cursor: str | None = None, created_after: datetime | None = None,
+                          updated_since: datetime | None = None,
+                          db: AsyncSession = Depends(get_async_db),
+                          permission: bool = Depends(auth.RBAC(endpoint="GET_ticket"))):
+    if conditional.is_conditional(request):
+        version = await crud.get_my_tickets_version(db, skip=skip, limit=limit, cursor=cursor,
+                                                    owner_id=current_user.id, created_after=created_after,
+                                                    updated_since=updated_since)
+        not_modified = conditional.not_modified(request, version)
+        if not_modified is not None:
+            return not_modified
+
+    items = await crud.get_my_tickets(db, skip=skip, limit=limit, cursor=cursor, owner_id=current_user.id,
+                                      created_after=created_after, updated_since=updated_since)
+    response = json_list_response(TICKET_ROW, items)
+    set_next_cursor(response, items, limit)
+    return conditional.set_validators(response, conditional.rows_version(items))
 
 
 # Update (PUT)
 @app.put("/ticket/{ticket_id}", response_model=schemas.TicketResponse, tags=["Ticket"])
-async def update_ticket(ticket_id: int, ticket: schemas.TicketUpdate, db: Session = Depends(get_db),
-                        permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["PUT_ticket_ticket_id"]))):
-    db_ticket = crud.get_ticket(db, ticket_id=ticket_id)
-    if db_ticket is None:
-        raise_http_error(APP_CONFIG["raise_error"]["ticket_not_found"])
-
-    return crud.update_ticket(db=db, db_ticket=db_ticket, ticket=ticket)
+async def update_ticket(ticket_id: int, ticket: schemas.TicketUpdate, db: AsyncSession = Depends(get_async_db),
+                        permission: bool = Depends(auth.RBAC(endpoint="PUT_ticket_ticket_id"))):
+    return await crud.update_ticket(db=db, ticket_id=ticket_id, ticket=ticket)
 
 
 # Delete (DELETE)
 @app.delete("/ticket/{ticket_id}", tags=["Ticket"])
-async def delete_employee(ticket_id: int, db: Session = Depends(get_db),
-                          permission: bool = Depends(auth.RBAC(acl=PERMISSIONS["DELETE_ticket_ticket_id"]))):
-    return crud.delete_ticket(db=db, ticket_id=ticket_id)
+async def delete_employee(ticket_id: int, db: AsyncSession = Depends(get_async_db),
+                          permission: bool = Depends(auth.RBAC(endpoint="DELETE_ticket_ticket_id"))):
+    return await crud.delete_ticket(db=db, ticket_id=ticket_id)
+
+
+install_openapi_cache(app, cache_path=f"{get_project_root()}{APP_CONFIG['api_docs']['cache_path']}")  # After routes
@@ -10,8 +10,10 @@ sys.path.append(PROJECT_ROOT)  #  Add to PYTHONPATH
 # Add Project Package(s) based on PYTHONPATH
 try:
     from util import get_setup, get_config, get_current_time_utc
-    from sql_app.models import User
-    from sql_app.database import get_db
+    from sql_app.models import Base, User
+    from sql_app.database import get_db, engine
+    from sql_app import migrations
+    from sql_app.hashing import get_pwd_context_options
 except Exception as error:
     print("Exception:", error)
     print("Current PROJECT_ROOT:", PROJECT_ROOT)
@@ -19,9 +21,8 @@ except Exception as error:
 
 APP_CONFIG = get_config()
 SUCCESSFUL_MESSAGE = "Password for Username 'user_name' successfully updated: "
-FAILURE_MESSAGE = "Password for Username 'user_name' NOT updated!"
-PWD_CONTEXT = CryptContext(schemes=APP_CONFIG["auth"]["PWD_CONTEXT"]["schemes"],
-                           deprecated=APP_CONFIG["auth"]["PWD_CONTEXT"]["deprecated"])
+CREATED_MESSAGE = "Username 'user_name' not found and successfully created with password: "
+PWD_CONTEXT = CryptContext(**get_pwd_context_options(APP_CONFIG["auth"]["PWD_CONTEXT"]))
 
 
 def get_password_hash(plain_password: str) -> str:
@@ -39,10 +40,17 @@ def update_users_passwords(db: Session = get_db):
         plain_password = user["password"]
         hashed_password = get_password_hash(plain_password)
 
-        # Check if User exists
+        # Check if User exists, create missing default User (e.g. in a new empty PostgreSQL database)
         db_user = get_user_by_name(db=db, username=username)
         if db_user is None:
-            print(FAILURE_MESSAGE)
+            db_user = User(username=username, first_name=user["first_name"], last_name=user["last_name"],
+                           phone=user["phone"], email=user["email"], role=user["role"], disabled=False,
+                           login_denied=False, hashed_password=hashed_password,
+                           created=get_current_time_utc("TIME"))
+            db.add(db_user)
+            db.commit()
+
+            print(CREATED_MESSAGE.replace("user_name", username) + plain_password)
         else:
             # Set new password
             db_user.hashed_password = hashed_password
@@ -59,5 +67,9 @@ def update_users_passwords(db: Session = get_db):
     print(">>> User password update completed successfully!")
 
 
+# Create tables in a new database (DATABASE_URL or "database.url" in config.json), existing tables are not touched
+Base.metadata.create_all(bind=engine)
+migrations.upgrade(engine)
+
 # calling next() on your generator to get a session out of the generator - FastAPI do this initially
 update_users_passwords(db=next(get_db()))
@@ -4,50 +4,102 @@ Author: Volodymyr Letiahin
 Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
 License: MIT
 """
+import asyncio
+import functools
+import hashlib
+import hmac
+import logging
+import secrets
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
 from pydantic import ValidationError
-from fastapi import Depends, Security
+from fastapi import BackgroundTasks, Depends, HTTPException, Request, Security
 from fastapi.security import OAuth2PasswordBearer, SecurityScopes
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import jwt
 from jwt.exceptions import InvalidTokenError
-from passlib.context import CryptContext
 from util import get_config, raise_http_error
-from .schemas import UserResponse, AuthTokenData
+from .schemas import AuthToken, AuthTokenData, AuthPrincipal
 from . import crud
-from .database import get_db
+from .cache import PRINCIPAL_CACHE
+from .database import get_async_db, AsyncSessionLocal
+from .hashing import PasswordHashPool, get_pwd_context_options
+from .metrics import PASSWORD_HASH_DURATION
+from .permissions import PERMISSION_STORE
 
 APP_CONFIG = get_config()
+LOGGER = logging.getLogger(__name__)
 SECRET_KEY = APP_CONFIG["auth"]["SECRET_KEY"]
 ALGORITHM = APP_CONFIG["auth"]["ALGORITHM"]
 ACCESS_TOKEN_EXPIRE_MINUTES = APP_CONFIG["auth"]["ACCESS_TOKEN_EXPIRE_MINUTES"]
-PWD_CONTEXT = CryptContext(schemes=APP_CONFIG["auth"]["PWD_CONTEXT"]["schemes"],
-                           deprecated=APP_CONFIG["auth"]["PWD_CONTEXT"]["deprecated"])
 OAUTH2_SCHEME = OAuth2PasswordBearer(
     tokenUrl=APP_CONFIG["auth"]["OAUTH2_SCHEME"]["tokenUrl"],
     scopes=APP_CONFIG["auth"]["OAUTH2_SCHEME"]["scopes"]
 )
+PASSWORD_HASH_POOL = PasswordHashPool(
+    max_workers=APP_CONFIG["auth"]["PASSWORD_HASH_POOL"]["max_workers"],
+    max_queue_size=APP_CONFIG["auth"]["PASSWORD_HASH_POOL"]["max_queue_size"],
+    retry_after=APP_CONFIG["auth"]["PASSWORD_HASH_POOL"]["retry_after"]
+)
+# Cached principals keep role masks compiled by the current matrix: drop them when permissions.json is reloaded
+PERMISSION_STORE.reload_listeners.append(PRINCIPAL_CACHE.clear)
+
+
+# Password context is created by the first hash / verify: passlib and its backends take ~15 ms to import,
+# which every worker start would pay even if it never checks a password
+@functools.cache
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(**get_pwd_context_options(APP_CONFIG["auth"]["PWD_CONTEXT"]))
+
+
+# Run in PASSWORD_HASH_POOL threads: timed there, so the histogram shows the hash cost without the queue wait
+def verify_password_sync(plain_password, hashed_password):
+    with PASSWORD_HASH_DURATION.labels("verify").time():
+        return get_pwd_context().verify(plain_password, hashed_password)
+
 
+def get_password_hash_sync(password):
+    with PASSWORD_HASH_DURATION.labels("hash").time():
+        return get_pwd_context().hash(password)
 
-def verify_password(plain_password, hashed_password):
-    return PWD_CONTEXT.verify(plain_password, hashed_password)
 
+async def verify_password(plain_password, hashed_password):
+    return await PASSWORD_HASH_POOL.run(verify_password_sync, plain_password, hashed_password)
 
-def get_password_hash(password):
-    return PWD_CONTEXT.hash(password)
+
+async def get_password_hash(password):
+    return await PASSWORD_HASH_POOL.run(get_password_hash_sync, password)
+
+
+async def rehash_password(user_id: int, password: str, old_hash: str):
+    # Background task after the login response: hash of old parameters (or deprecated scheme) is replaced by
+    # the current PWD_CONTEXT one. Skipped if the hash pool is full, the next login tries again
+    try:
+        new_hash = await get_password_hash(password)
+    except HTTPException:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            await crud.update_password_hash(db, user_id, old_hash, new_hash)
+    except Exception as error:  # Database busy or unavailable: next login tries again
+        LOGGER.error(f"Password rehash of user {user_id} failed: {error}")
 
 
-def authenticate_user(db_user, password: str):
+async def authenticate_user(db_user, password: str, background_tasks: BackgroundTasks | None = None):
     if not db_user:  # Check if User exist
         return False
 
-    if not verify_password(password, db_user.hashed_password):  # heck if User password is valid
+    if not await verify_password(password, db_user.hashed_password):  # heck if User password is valid
         return False
 
     if db_user.login_denied:  # Check if User login allowed
         raise_http_error(APP_CONFIG["raise_error"]["user_login_denied"])
 
+    # Password is known only now: hash made with other Argon2 parameters is upgraded after the response is sent
+    if background_tasks is not None and get_pwd_context().needs_update(db_user.hashed_password):
+        background_tasks.add_task(rehash_password, db_user.id, password, db_user.hashed_password)
+
     return db_user
 
 
@@ -59,10 +111,46 @@ def create_access_token(data: dict, expires_delta: timedelta):  # timedelta | No
     return encoded_jwt
 
 
+# Refresh token: 256 random bits, database keeps HMAC-SHA256 of it keyed by SECRET_KEY and truncated to 16 bytes,
+# so a leaked table gives no usable tokens. Renewal costs one HMAC (microseconds), not an Argon2 verify.
+def hash_refresh_token(refresh_token: str) -> bytes:
+    return hmac.new(SECRET_KEY.encode(), refresh_token.encode(), hashlib.sha256).digest()[:16]
+
+
+async def create_tokens(db: AsyncSession, user_id: int, username: str, scopes: list[str],
+                        family_id: int | None = None) -> AuthToken:
+    access_token = create_access_token(data={"sub": username, "scopes": scopes},
+                                       expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    refresh_token = secrets.token_urlsafe(32)
+    await crud.create_refresh_token(db, hash_refresh_token(refresh_token), user_id, scopes, family_id)
+    return AuthToken(access_token=access_token, token_type="bearer", refresh_token=refresh_token)
+
+
+async def refresh_tokens(db: AsyncSession, refresh_token: str) -> AuthToken:
+    # Rotation: presented refresh token is used up, a new one of the same family is returned with the access token
+    new_refresh_token = secrets.token_urlsafe(32)
+    username, scopes = await crud.rotate_refresh_token(db, hash_refresh_token(refresh_token),
+                                                       hash_refresh_token(new_refresh_token))
+    access_token = create_access_token(data={"sub": username, "scopes": scopes},
+                                       expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    return AuthToken(access_token=access_token, token_type="bearer", refresh_token=new_refresh_token)
+
+
+async def sweep_refresh_tokens(interval_seconds: float):
+    # Background task of every worker (lifespan): deletes expired refresh tokens, concurrent sweeps are harmless
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            async with AsyncSessionLocal() as db:
+                await crud.delete_expired_refresh_tokens(db)
+        except Exception as error:  # Database busy or unavailable: next round
+            LOGGER.error(f"Refresh token sweep failed: {error}")
+
+
 # User has valid token
-async def get_current_user(security_scopes: SecurityScopes,
+async def get_current_user(security_scopes: SecurityScopes, request: Request,
                            token: Annotated[str, Depends(OAUTH2_SCHEME)],
-                           db: Session = Depends(get_db)):
+                           db: AsyncSession = Depends(get_async_db)):
 
     # A server using HTTP authentication will respond with a 401 Unauthorized response to a request for a protected
     # resource. This response must include at least one WWW-Authenticate header and at least one challenge,
@@ -83,17 +171,27 @@ async def get_current_user(security_scopes: SecurityScopes,
         token_scopes = payload.get("scopes", [])
         token_data = AuthTokenData(scopes=token_scopes, username=username)
 
-        # Try to get User from database by username
-        db_user = crud.get_user_by_username(db=db, username=token_data.username)
-        if db_user is None:
-            raise_http_error(APP_CONFIG["raise_error"]["incorrect_user_name_or_password"], headers=exception_headers)
+        # Try to get User from principal cache first, then from database by username
+        principal = PRINCIPAL_CACHE.get(token_data.username)
+        if principal is None:
+            generation = PRINCIPAL_CACHE.generation
+            db_user = await crud.get_user_by_username(db=db, username=token_data.username)
+            if db_user is None:
+                raise_http_error(APP_CONFIG["raise_error"]["incorrect_user_name_or_password"],
+                                 headers=exception_headers)
+            matrix = PERMISSION_STORE.matrix
+            principal = AuthPrincipal(id=db_user.id, username=db_user.username, role=db_user.role or [],
+                                      disabled=db_user.disabled, login_denied=db_user.login_denied,
+                                      role_mask=matrix.role_mask(db_user.role), permissions_version=matrix.version)
+            PRINCIPAL_CACHE.put(principal, generation)
 
         # Security SCOPE validation
         for scope in security_scopes.scopes:
             if scope not in token_data.scopes:
                 raise_http_error(APP_CONFIG["raise_error"]["not_enough_permissions"], headers=exception_headers)
 
-        return db_user
+        request.state.user_id = principal.id  # For the access log
+        return principal
 
     except (InvalidTokenError, ValidationError) as token_error:
         if str(token_error) == "Signature has expired":  # ValidationError respond
@@ -103,20 +201,25 @@ async def get_current_user(security_scopes: SecurityScopes,
 
 
 # User has valid token and NOT disabled
-async def get_current_active_user(current_user: Annotated[UserResponse, Security(get_current_user)]):
+async def get_current_active_user(current_user: Annotated[AuthPrincipal, Security(get_current_user)]):
     if current_user.disabled:
         raise_http_error(APP_CONFIG["raise_error"]["user_disabled"])
     return current_user
 
 
-# Role-based access control (RBAC) model where endpoint access permission (ACL) validated with User's roles
+# Role-based access control (RBAC) model where endpoint access permission (ACL) validated with User's roles:
+# endpoint key from permissions.json (like "POST_user") is checked against User's role mask by single integer AND.
+# The mask is checked against the matrix it was compiled by: when permissions.json was reloaded in between, the mask
+# is compiled again from the same matrix snapshot the check uses.
 class RBAC:
-    def __init__(self, acl: list[str]) -> None:
-        self.acl = acl
-
-    def __call__(self, user: UserResponse = Depends(get_current_active_user)) -> bool:
-        for permission in self.acl:
-            if permission in user.role:
-                return True
+    def __init__(self, endpoint: str) -> None:
+        PERMISSION_STORE.require(endpoint)  # Fail fast on unknown endpoint key, keep it in reloaded permissions
+        self.endpoint = endpoint
+
+    def __call__(self, user: AuthPrincipal = Depends(get_current_active_user)) -> bool:
+        matrix = PERMISSION_STORE.matrix
+        role_mask = user.role_mask if user.permissions_version == matrix.version else matrix.role_mask(user.role)
+        if matrix.allows(self.endpoint, role_mask):
+            return True
 
         raise_http_error(APP_CONFIG["raise_error"]["not_enough_permissions"])
@@ -0,0 +1,121 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from util import get_config, get_project_root
+from .schemas import AuthPrincipal
+
+APP_CONFIG = get_config()
+
+
+# TTL + LRU cache of authenticated principals (id, role, disabled, login_denied) keyed by token "sub" (username).
+# It removes the per-request SELECT from get_current_user. Writes to users must call invalidate() explicitly:
+# the entry is dropped in the current process, and the mtime of a shared stamp file is bumped, so the other uvicorn
+# worker processes notice the change by an os.stat() of a lookup and drop their cached principals too. The stamp is
+# checked at most once per stamp_check_ms (not a syscall per request): other workers see a change that much later.
+# Generation counts drops: a principal loaded before an invalidate() / clear() is not put into the cache after it.
+class PrincipalCache:
+    def __init__(self, max_size: int, ttl_seconds: float, stamp_path: str, stamp_check_seconds: float) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.stamp_path = stamp_path
+        self.stamp_check_seconds = stamp_check_seconds
+        self._entries: OrderedDict[str, tuple[float, AuthPrincipal]] = OrderedDict()  # username -> (expire, value)
+        self._usernames: dict[int, str] = {}  # user id -> username
+        self._stamp = self._read_stamp()
+        self._stamp_checked = time.monotonic()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        # Read before loading a principal from the database, passed to put()
+        return self._generation
+
+    def _read_stamp(self) -> int:
+        try:
+            return os.stat(self.stamp_path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _drop(self, username: str) -> None:
+        _, principal = self._entries.pop(username)
+        self._usernames.pop(principal.id, None)
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._usernames.clear()
+        self._generation += 1
+
+    def get(self, username: str) -> AuthPrincipal | None:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._stamp_checked >= self.stamp_check_seconds:
+                self._stamp_checked = now
+                stamp = self._read_stamp()
+                if stamp != self._stamp:  # Users were changed by another process
+                    self._clear()
+                    self._stamp = stamp
+
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+
+            if entry[0] < now:
+                self._drop(username)
+                return None
+
+            self._entries.move_to_end(username)
+            return entry[1]
+
+    def put(self, principal: AuthPrincipal, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:  # Invalidated while it was loaded: may be stale
+                return
+            if principal.username in self._entries:
+                self._drop(principal.username)
+            self._entries[principal.username] = (time.monotonic() + self.ttl_seconds, principal)
+            self._usernames[principal.id] = principal.username
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            username = self._usernames.get(user_id)
+            if username is not None:
+                self._drop(username)
+            self._generation += 1
+
+            # Stamp bumped by another worker since the last check: its changes are dropped here too, before this
+            # worker's own stamp hides them
+            file_stamp = self._read_stamp()
+            if file_stamp != self._stamp:
+                self._clear()
+
+            # Bump shared stamp strictly forward, so other workers can't miss it because of the file time resolution
+            stamp = max(time.time_ns(), file_stamp + 1)
+            try:
+                os.utime(self.stamp_path, ns=(stamp, stamp))
+            except FileNotFoundError:
+                open(self.stamp_path, "a").close()
+                os.utime(self.stamp_path, ns=(stamp, stamp))
+            self._stamp = stamp
+            self._stamp_checked = time.monotonic()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+
+PRINCIPAL_CACHE = PrincipalCache(
+    max_size=APP_CONFIG["auth"]["PRINCIPAL_CACHE"]["max_size"],
+    ttl_seconds=APP_CONFIG["auth"]["PRINCIPAL_CACHE"]["ttl_seconds"],
+    stamp_path=f"{get_project_root()}{APP_CONFIG['auth']['PRINCIPAL_CACHE']['stamp_path']}",
+    stamp_check_seconds=APP_CONFIG["auth"]["PRINCIPAL_CACHE"]["stamp_check_ms"] / 1000
+)
@@ -0,0 +1,77 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import calendar
+import hashlib
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Request, Response
+from .models import TIME_FORMAT
+
+# Conditional GET: responses carry ETag (and Last-Modified for single records) derived from the version of the rows
+# they are built from, so polling clients revalidate by If-None-Match / If-Modified-Since and get "304 Not Modified".
+# Version of a set of rows is (count, max id, last change = max of "updated", else "created", sum of row versions),
+# with the same of embedded tickets appended. Every change of the representation changes it: update increments
+# the row's "version" (also twice within the second "updated" is stored with), insert brings a new max id, delete
+# lowers the count or brings a next row (new max id) into the page.
+# Revalidation reads the version by one aggregate query (crud.get_*_version), the rows aren't loaded or serialized.
+# Last-Modified is not sent for lists and embedded tickets: deleted row changes content without newer timestamp.
+CACHE_CONTROL = "private, no-cache"  # Per-user responses, cache may keep them but must revalidate every time
+
+
+def rows_version(rows, nested: str | None = None) -> tuple:
+    # Version of loaded rows, equal to the version read by crud.get_version() for the same rows
+    version = (len(rows), max((row.id for row in rows), default=None),
+               max((row.updated or row.created for row in rows), default=None), sum(row.version for row in rows))
+    if nested is not None:
+        version += rows_version([item for row in rows for item in getattr(row, nested)])
+    return version
+
+
+def make_etag(version: tuple) -> str:
+    # Weak ETag: version identifies content, not the exact bytes (timestamps have one-second resolution)
+    return f'W/"{hashlib.blake2b(repr(version).encode(), digest_size=12).hexdigest()}"'
+
+
+def get_validator_headers(version: tuple, last_modified: bool = False) -> dict:
+    headers = {"ETag": make_etag(version), "Cache-Control": CACHE_CONTROL}
+    if last_modified and version[2] is not None:
+        headers["Last-Modified"] = formatdate(calendar.timegm(time.strptime(version[2], TIME_FORMAT)), usegmt=True)
+    return headers
+
+
+def is_conditional(request: Request) -> bool:
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def is_not_modified(request: Request, headers: dict) -> bool:
+    # RFC 9110: If-None-Match wins, If-Modified-Since is evaluated only without it
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etags = [etag.strip().removeprefix("W/") for etag in if_none_match.split(",")]
+        return "*" in etags or headers["ETag"].removeprefix("W/") in etags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or "Last-Modified" not in headers:
+        return False
+    try:
+        return parsedate_to_datetime(headers["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):  # Invalid date is ignored
+        return False
+
+
+def not_modified(request: Request, version: tuple, last_modified: bool = False) -> Response | None:
+    # "304 Not Modified" response (no body) if client's copy is current, None if response must be built.
+    # Empty version (missing record or empty page) is never "not modified": 404 or "[]" is built as usual.
+    headers = get_validator_headers(version, last_modified)
+    if version[0] and is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+def set_validators(response: Response, version: tuple, last_modified: bool = False) -> Response:
+    response.headers.update(get_validator_headers(version, last_modified))
+    return response
@@ -4,32 +4,146 @@ Author: Volodymyr Letiahin
 Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
 License: MIT
 """
-from sqlalchemy.orm import Session
+import logging
+import secrets
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import select, func, insert, update, delete, exc, true
+from sqlalchemy.orm import selectinload, noload, aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.responses import JSONResponse
 from . import models, schemas, database
 from .auth import get_password_hash
-from util import get_config, get_permissions, raise_http_error, get_current_time_utc
+from .cache import PRINCIPAL_CACHE
+from .pagination import decode_cursor
+from .permissions import PERMISSION_STORE
+from .search import search_query
+from util import get_config, raise_http_error, get_current_time_utc
 
 APP_CONFIG = get_config()
-PERMISSIONS = get_permissions()
+LOGGER = logging.getLogger(__name__)
+
+
+def filter_by_time(query, model, created_after: datetime | None = None, updated_since: datetime | None = None):
+    # Time filters compare epoch integers by "created" / "updated" index (naive datetime is taken as UTC)
+    if created_after is not None:
+        query = query.filter(model.created > created_after)
+    if updated_since is not None:
+        query = query.filter(model.updated >= updated_since)
+    return query
+
+
+def paginate(query, model, skip: int, limit: int, cursor: str | None,
+             created_after: datetime | None = None, updated_since: datetime | None = None):
+    query = filter_by_time(query, model, created_after, updated_since)
+
+    # Cursor (keyset) pagination seeks by primary key index, skip (offset) pagination is kept for compatibility
+    query = query.order_by(model.id)
+    if cursor is not None:
+        query = query.filter(model.id > decode_cursor(cursor))
+    else:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+
+def page_query(model, skip: int, limit: int, cursor: str | None, created_after: datetime | None,
+               updated_since: datetime | None, *criteria):
+    # Page of a list endpoint: same query for the rows (get_*) and for their version (get_*_version)
+    limit = min(limit, APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"])
+    return paginate(select(model).filter(*criteria), model, skip, limit, cursor, created_after, updated_since)
+
+
+""" Versions (conditional GET) ---------------------------------------------------------------------------------- """
+
+
+def version_columns(rows) -> list:
+    # (count, max id, last change, sum of row versions) of rows, see sql_app/conditional.py
+    return [func.count(rows.c.id), func.max(rows.c.id), func.max(func.coalesce(rows.c.updated, rows.c.created)),
+            func.coalesce(func.sum(rows.c.version), 0)]
+
+
+async def get_version(db: AsyncSession, query, model, include_tickets: bool = False,
+                      tickets_limit: int | None = None) -> tuple:
+    # Version of rows selected by query (and of their embedded tickets) by one aggregate query over id / created /
+    # updated / version columns: no ORM objects are loaded. Equal to conditional.rows_version() of the loaded rows.
+    rows = query.with_only_columns(model.id, model.created, model.updated, model.version).cte("version_rows")
+    version = select(*version_columns(rows)).subquery()
+    if not include_tickets:
+        return tuple((await db.execute(select(version))).one())
+
+    if tickets_limit is None:
+        tickets = (select(models.Ticket.id, models.Ticket.created, models.Ticket.updated, models.Ticket.version)
+                   .filter(models.Ticket.employee_id.in_(select(rows.c.id))).subquery())
+    else:
+        ranked = ranked_tickets(select(rows.c.id))
+        tickets = select(ranked.c.id, ranked.c.created, ranked.c.updated, ranked.c.version)
+        tickets = tickets.filter(ranked.c.rank <= tickets_limit)
+        tickets = tickets.subquery()
+    tickets_version = select(*version_columns(tickets)).subquery()
+    return tuple((await db.execute(select(version, tickets_version).join_from(version, tickets_version, true()))).one())
+
+
+""" Bulk --------------------------------------------------------------------------------------------------------- """
+
+
+def bulk_error_result(index: int, error: exc.IntegrityError) -> schemas.BulkItemResult:
+    error_key = database.UNIQUE_FIELD_ERRORS.get(database.parse_unique_violation(error),
+                                                  "error_processing_database_request")
+    return schemas.BulkItemResult(index=index, **APP_CONFIG["raise_error"][error_key])
+
+
+async def bulk_insert(db: AsyncSession, model, rows: list[tuple[int, dict]], results: dict):
+    # Chunk is one transaction with one multi-row INSERT ... RETURNING id (no per-row commit and refresh).
+    # If any row of the chunk violates a constraint, the chunk is rolled back and its rows are inserted one by one
+    # (one transaction per row), so only the bad rows fail and the rest of the batch goes on.
+    chunk_size = APP_CONFIG["BULK_INSERT_CHUNK_SIZE"]
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            created_ids = (await db.scalars(insert(model).returning(model.id, sort_by_parameter_order=True),
+                                            [row for _, row in chunk])).all()
+            await db.commit()
+        except exc.IntegrityError:
+            await db.rollback()
+            created_ids = []
+            for index, row in chunk:
+                try:
+                    created_ids.append(await db.scalar(insert(model).values(**row).returning(model.id)))
+                    await db.commit()
+                except exc.IntegrityError as error:
+                    await db.rollback()
+                    created_ids.append(None)
+                    results[index] = bulk_error_result(index, error)
+
+        for (index, _), created_id in zip(chunk, created_ids):
+            if created_id is not None:
+                results[index] = schemas.BulkItemResult(index=index, id=created_id, status_code=200)
+
+
+def bulk_response(results: dict) -> schemas.BulkResponse:
+    items = [results[index] for index in sorted(results)]
+    created = sum(1 for item in items if item.id is not None)
+    return schemas.BulkResponse(created=created, failed=len(items) - created, items=items)
+
 
 """ Users -------------------------------------------------------------------------------------------------------- """
 
 
-def get_user_by_id(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user_by_id(db: AsyncSession, user_id: int):
+    return await db.scalar(select(models.User).filter(models.User.id == user_id).limit(1))
 
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
+async def get_user_by_username(db: AsyncSession, username: str):
+    return await db.scalar(select(models.User).filter(models.User.username == username).limit(1))
 
 
-def get_user_by_phone(db: Session, phone: str):
-    return db.query(models.User).filter(models.User.phone == phone).first()
+async def get_user_by_phone(db: AsyncSession, phone: str):
+    return await db.scalar(select(models.User).filter(models.User.phone == phone).limit(1))
 
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.scalar(select(models.User).filter(models.User.email == email).limit(1))
 
 
 def validate_user_role(user: schemas.UserCreate):
@@ -39,18 +153,18 @@ def validate_user_role(user: schemas.UserCreate):
         user.role = list(set(user.role))
         user.role.sort(reverse=False)
         for role in user.role:
-            if role not in PERMISSIONS["rbac_roles"]:
+            if role not in PERMISSION_STORE.matrix.rbac_roles:
                 raise_http_error(APP_CONFIG["raise_error"]["unknown_role"])
 
     return user
 
 
-def create_user(db: Session, user: schemas.UserCreate):
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
     # Validate User's role(s)
     user = validate_user_role(user=user)
 
     # Create hashed password based on PWD_CONTEXT
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
 
     # We can do record setup in a short way like:
     # https://docs.pydantic.dev/latest/concepts/serialization/#advanced-include-and-exclude
@@ -67,78 +181,251 @@ def create_user(db: Session, user: schemas.UserCreate):
     #                       hashed_password=hashed_password,
     #                       created=util.get_current_time_utc("TIME"))
 
-    db_user = database.create_db_record(db=db, db_record=db_user)
+    db_user = await database.create_db_record(db=db, db_record=db_user)
     return db_user
 
 
-def update_user(db: Session, user_id, user):
-    # Check if User exists
-    db_user = get_user_by_id(db, user_id=user_id)
-    if db_user is None:
-        raise_http_error(APP_CONFIG["raise_error"]["user_not_found"])
-
+async def update_user(db: AsyncSession, user_id, user):
     # Validate User's role(s)
     user = validate_user_role(user=user)
 
-    # Update User record in database
-    db_employee = database.update_db_record(db=db, db_record=db_user, payload=user)
-    return db_employee
+    # Update User record in database (404 if User doesn't exist)
+    db_user = await database.update_db_record(db=db, model=models.User, record_id=user_id, payload=user,
+                                              not_found_error="user_not_found")
 
+    # Cached principal may keep old username, role or flags
+    PRINCIPAL_CACHE.invalidate(user_id)
+    if db_user.disabled or db_user.login_denied:
+        await revoke_refresh_tokens(db, user_id)
+    return db_user
 
-def update_user_password(db: Session, user_id, user):
-    # Check if User exists
-    db_user = get_user_by_id(db=db, user_id=user_id)
-    if db_user is None:
-        raise_http_error(APP_CONFIG["raise_error"]["user_not_found"])
 
-    # Set new password
-    db_user.hashed_password = get_password_hash(user.password)  # Create hashed password based on PWD_CONTEXT
+async def update_password_hash(db: AsyncSession, user_id, old_hash: str, new_hash: str) -> bool:
+    # Rehash of the same password with new Argon2 parameters (auth.rehash_password): not a password change, so
+    # update time-date, sessions and the principal cache stay. Applied only if the hash is still the verified one
+    # (a password changed meanwhile wins), False otherwise
+    result = await db.execute(update(models.User)
+                              .where(models.User.id == user_id, models.User.hashed_password == old_hash)
+                              .values(hashed_password=new_hash))
+    await db.commit()
+    return result.rowcount == 1
+
+
+def get_refresh_token_expires() -> int:
+    return get_current_time_utc("UNIX") + APP_CONFIG["auth"]["REFRESH_TOKEN"]["expire_days"] * 86400
+
+
+async def create_refresh_token(db: AsyncSession, token_hash: bytes, user_id: int, scopes: list[str],
+                               family_id: int | None = None):
+    # Login starts a new family (random id: no extra statement to read an id back), rotation continues it
+    await db.execute(insert(models.RefreshToken).values(
+        token_hash=token_hash, family_id=family_id if family_id is not None else secrets.randbits(62),
+        user_id=user_id, scopes=scopes, used=False, expires=get_refresh_token_expires()))
+    await db.commit()
+
+
+async def revoke_refresh_tokens(db: AsyncSession, user_id: int):
+    await db.execute(delete(models.RefreshToken).where(models.RefreshToken.user_id == user_id))
+    await db.commit()
+
+
+async def revoke_refresh_token_family(db: AsyncSession, family_id: int):
+    await db.execute(delete(models.RefreshToken).where(models.RefreshToken.family_id == family_id))
+    await db.commit()
+
+
+async def rotate_refresh_token(db: AsyncSession, token_hash: bytes, new_token_hash: bytes):
+    # Refresh grant: one indexed lookup of the token with its user flags, then the token is marked used and its
+    # successor is inserted. Used token presented again means it was copied: the whole family is revoked.
+    # Returns (username, scopes) for the new access token.
+    row = (await db.execute(
+        select(models.RefreshToken.id, models.RefreshToken.family_id, models.RefreshToken.user_id,
+               models.RefreshToken.scopes, models.RefreshToken.used,
+               models.User.username, models.User.disabled, models.User.login_denied)
+        .join(models.User, models.User.id == models.RefreshToken.user_id)
+        .where(models.RefreshToken.token_hash == token_hash,
+               models.RefreshToken.expires > get_current_time_utc("UNIX")))).first()
+    if row is None:
+        raise_http_error(APP_CONFIG["raise_error"]["invalid_refresh_token"])
+
+    if row.used:
+        LOGGER.warning(f"Refresh token reuse detected, token family of user id {row.user_id} revoked")
+        await revoke_refresh_token_family(db, row.family_id)
+        raise_http_error(APP_CONFIG["raise_error"]["invalid_refresh_token"])
+
+    if row.disabled or row.login_denied:
+        await revoke_refresh_tokens(db, row.user_id)
+        raise_http_error(APP_CONFIG["raise_error"]["user_disabled" if row.disabled else "user_login_denied"])
+
+    # Concurrent renewal with the same token: only one UPDATE wins, the other request is a reuse
+    result = await db.execute(update(models.RefreshToken)
+                              .where(models.RefreshToken.id == row.id, ~models.RefreshToken.used)
+                              .values(used=True))
+    if result.rowcount == 0:
+        await db.rollback()
+        await revoke_refresh_token_family(db, row.family_id)
+        raise_http_error(APP_CONFIG["raise_error"]["invalid_refresh_token"])
+
+    await create_refresh_token(db, new_token_hash, row.user_id, row.scopes, family_id=row.family_id)
+    return row.username, row.scopes
+
+
+async def delete_expired_refresh_tokens(db: AsyncSession) -> int:
+    # Sweeper: expired tokens (used ones included) by the expires index
+    result = await db.execute(delete(models.RefreshToken)
+                              .where(models.RefreshToken.expires <= get_current_time_utc("UNIX")))
+    await db.commit()
+    return result.rowcount
+
+
+async def update_user_password(db: AsyncSession, user_id, user):
+    # Set new password (hashed based on PWD_CONTEXT) and update time-date by one UPDATE, 404 if User doesn't exist.
+    # Existence is checked first: an unknown id must not cost an Argon2 hash (and a slot of the hash pool)
+    if await db.scalar(select(models.User.id).filter(models.User.id == user_id).limit(1)) is None:
+        raise_http_error(APP_CONFIG["raise_error"]["user_not_found"])
+    hashed_password = await get_password_hash(user.password)
+    result = await db.execute(update(models.User).where(models.User.id == user_id)
+                              .values(hashed_password=hashed_password, updated=get_current_time_utc("TIME")))
+    if result.rowcount == 0:
+        await db.rollback()
+        raise_http_error(APP_CONFIG["raise_error"]["user_not_found"])
 
-    # Set update time-date
-    db_user.updated = get_current_time_utc("TIME")
+    # Sessions of the old password end: refresh tokens are revoked in the same transaction
+    await db.execute(delete(models.RefreshToken).where(models.RefreshToken.user_id == user_id))
 
     # Update database
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    PRINCIPAL_CACHE.invalidate(user_id)
 
     return JSONResponse(content={"message": APP_CONFIG["message"]["password_changed_successfully"]})
 
 
-def delete_user(db: Session, user_id):
-    # Check if User exists
-    db_user = get_user_by_id(db, user_id=user_id)
-    if db_user is None:
-        raise_http_error(APP_CONFIG["raise_error"]["user_not_found"])
-
-    # Delete User in database
-    db.delete(db_user)
-    db.commit()
+async def delete_user(db: AsyncSession, user_id):
+    # Keep User's Tickets with empty owner (as ORM delete of the loaded User did before), then delete User.
+    # Tickets are changed, so their update time-date is set too (new ETag of ticket reads)
+    await db.execute(update(models.Ticket).where(models.Ticket.owner_id == user_id)
+                     .values(owner_id=None, updated=get_current_time_utc("TIME")))
+    await db.execute(delete(models.RefreshToken).where(models.RefreshToken.user_id == user_id))
+    await database.delete_db_record(db=db, model=models.User, record_id=user_id, not_found_error="user_not_found")
+    PRINCIPAL_CACHE.invalidate(user_id)
 
     return JSONResponse(content={"message": APP_CONFIG["message"]["user_deleted_successfully"]})
 
 
-def get_users(db: Session, skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"]):
-    if limit > APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"]:
-        limit = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"]
-    return db.query(models.User).offset(skip).limit(limit).all()
+async def get_users(db: AsyncSession, skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"],
+                    cursor: str | None = None, created_after: datetime | None = None,
+                    updated_since: datetime | None = None):
+    query = page_query(models.User, skip, limit, cursor, created_after, updated_since)
+    return (await db.scalars(query)).all()
+
+
+async def get_users_version(db: AsyncSession, skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"],
+                            cursor: str | None = None, created_after: datetime | None = None,
+                            updated_since: datetime | None = None) -> tuple:
+    query = page_query(models.User, skip, limit, cursor, created_after, updated_since)
+    return await get_version(db, query, models.User)
 
 
 """ Employees -------------------------------------------------------------------------------------------------- """
 
 
-def get_employee(db: Session, employee_id: int):
-    return db.query(models.Employee).filter(models.Employee.id == employee_id).first()
+# Employee.tickets is part of EmployeeResponse: with AsyncSession it must be loaded with the query (no lazy IO).
+# Tickets of all employees of the page are loaded by one batched "WHERE employee_id IN (...)" query (no N+1),
+# or skipped (include_tickets=False), or capped per employee (tickets_limit) by one ranked window query.
+def employee_tickets_option(include_tickets: bool, tickets_limit: int | None):
+    if include_tickets and tickets_limit is None:
+        return selectinload(models.Employee.tickets)
+    return noload(models.Employee.tickets)  # Empty list, or filled by load_limited_tickets() afterward
+
+
+def tickets_included(include_tickets: bool, tickets_limit: int | None) -> bool:
+    return include_tickets and (tickets_limit is None or tickets_limit > 0)
+
+
+def ranked_tickets(employee_ids):
+    # Tickets of the employees numbered by id within every employee: "rank <= tickets_limit" caps them
+    return (select(models.Ticket,
+                   func.row_number().over(partition_by=models.Ticket.employee_id,
+                                          order_by=models.Ticket.id).label("rank"))
+            .filter(models.Ticket.employee_id.in_(employee_ids))
+            .subquery())
+
+
+async def load_limited_tickets(db: AsyncSession, db_employees, tickets_limit: int):
+    ranked = ranked_tickets([db_employee.id for db_employee in db_employees])
+    ranked_ticket = aliased(models.Ticket, ranked)
+    db_tickets = await db.scalars(select(ranked_ticket)
+                                  .filter(ranked.c.rank <= tickets_limit)
+                                  .order_by(ranked.c.employee_id, ranked.c.id))
+
+    tickets_by_employee = defaultdict(list)
+    for db_ticket in db_tickets:
+        tickets_by_employee[db_ticket.employee_id].append(db_ticket)
+    for db_employee in db_employees:
+        set_committed_value(db_employee, "tickets", tickets_by_employee[db_employee.id])
+
+
+async def get_employee(db: AsyncSession, employee_id: int, include_tickets: bool = True,
+                       tickets_limit: int | None = None):
+    include_tickets = tickets_included(include_tickets, tickets_limit)
+
+    db_employee = await db.scalar(select(models.Employee)
+                                  .options(employee_tickets_option(include_tickets, tickets_limit))
+                                  .filter(models.Employee.id == employee_id).limit(1))
+    if db_employee is not None and include_tickets and tickets_limit is not None:
+        await load_limited_tickets(db, [db_employee], tickets_limit)
+    return db_employee
+
 
+async def get_employee_version(db: AsyncSession, employee_id: int, include_tickets: bool = True,
+                               tickets_limit: int | None = None) -> tuple:
+    query = select(models.Employee).filter(models.Employee.id == employee_id).limit(1)
+    return await get_version(db, query, models.Employee, tickets_included(include_tickets, tickets_limit),
+                             tickets_limit)
 
-def get_employees(db: Session, skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"]):
+
+async def get_employees(db: AsyncSession, skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"],
+                        cursor: str | None = None, include_tickets: bool = True, tickets_limit: int | None = None,
+                        created_after: datetime | None = None, updated_since: datetime | None = None):
+    include_tickets = tickets_included(include_tickets, tickets_limit)
+
+    query = page_query(models.Employee, skip, limit, cursor, created_after, updated_since)
+    db_employees = (await db.scalars(query.options(employee_tickets_option(include_tickets, tickets_limit)))).all()
+    if db_employees and include_tickets and tickets_limit is not None:
+        await load_limited_tickets(db, db_employees, tickets_limit)
+    return db_employees
+
+
+async def get_employees_version(db: AsyncSession, skip: int = 0,
+                                limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"], cursor: str | None = None,
+                                include_tickets: bool = True, tickets_limit: int | None = None,
+                                created_after: datetime | None = None, updated_since: datetime | None = None) -> tuple:
+    query = page_query(models.Employee, skip, limit, cursor, created_after, updated_since)
+    return await get_version(db, query, models.Employee, tickets_included(include_tickets, tickets_limit),
+                             tickets_limit)
+
+
+async def search_employees(db: AsyncSession, query: str, skip: int = 0,
+                           limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"], include_tickets: bool = True,
+                           tickets_limit: int | None = None):
     if limit > APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"]:
         limit = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"]
-    return db.query(models.Employee).offset(skip).limit(limit).all()
+    include_tickets = tickets_included(include_tickets, tickets_limit)
+
+    # Ranked results are paginated by skip & limit (rank order has no keyset cursor)
+    query = search_query(models.Employee, query, db.bind.dialect.name)
+    if query is None:
+        return []
+    query = query.options(employee_tickets_option(include_tickets, tickets_limit)).offset(skip).limit(limit)
+    db_employees = (await db.scalars(query)).all()
+    if db_employees and include_tickets and tickets_limit is not None:
+        await load_limited_tickets(db, db_employees, tickets_limit)
+    return db_employees
 
 
-def create_employee(db: Session, employee: schemas.EmployeeCreate):
+async def create_employee(db: AsyncSession, employee: schemas.EmployeeCreate):
     # We can do record setup in a short way like:
-    db_employee = models.Employee(**employee.model_dump(), created=get_current_time_utc("TIME"))
+    db_employee = models.Employee(**employee.model_dump(), tickets=[])  # New Employee has no Tickets yet
     # Also we can do record setup in a long way but more clearly in detail like:
     # db_employee = models.Employee(first_name=employee.first_name,
     #                               last_name=employee.last_name,
@@ -151,32 +438,35 @@ def create_employee(db: Session, employee: schemas.EmployeeCreate):
     #                               address=employee.address,
     #                               created=util.get_current_time_utc("TIME"))
 
-    db.add(db_employee)
-    db.commit()
-    db.refresh(db_employee)
+    db_employee = await database.create_db_record(db=db, db_record=db_employee)
     return db_employee
 
 
-def update_employee(db: Session, employee_id, employee):
-    # Check if Employee exists
-    db_employee = get_employee(db, employee_id=employee_id)
-    if db_employee is None:
-        raise_http_error(APP_CONFIG["raise_error"]["employee_not_found"])
+async def create_employees_bulk(db: AsyncSession, employees: list[schemas.EmployeeCreate]):
+    results = {}
+    created = get_current_time_utc("TIME")
+    rows = [(index, {**employee.model_dump(), "created": created}) for index, employee in enumerate(employees)]
+    await bulk_insert(db, models.Employee, rows, results)
+    return bulk_response(results)
 
-    # Update Employee record in database
-    db_employee = database.update_db_record(db, db_employee, employee)
-    return db_employee
 
+async def update_employee(db: AsyncSession, employee_id, employee):
+    # Update Employee record in database (404 if Employee doesn't exist)
+    db_employee = await database.update_db_record(db=db, model=models.Employee, record_id=employee_id,
+                                                  payload=employee, not_found_error="employee_not_found")
+
+    # EmployeeResponse includes Tickets: loaded by one query (UPDATE ... RETURNING can't load relationships)
+    await db.refresh(db_employee, attribute_names=["tickets"])
+    return db_employee
 
-def delete_employee(db: Session, employee_id: int):
-    # Check if Employee exists
-    db_employee = get_employee(db, employee_id=employee_id)
-    if db_employee is None:
-        raise_http_error(APP_CONFIG["raise_error"]["employee_not_found"])
 
-    # Delete Employee in database
-    db.delete(db_employee)
-    db.commit()
+async def delete_employee(db: AsyncSession, employee_id: int):
+    # Keep Employee's Tickets with empty employee (as ORM delete of the loaded Employee did before), then delete.
+    # Tickets are changed, so their update time-date is set too (new ETag of ticket reads)
+    await db.execute(update(models.Ticket).where(models.Ticket.employee_id == employee_id)
+                     .values(employee_id=None, updated=get_current_time_utc("TIME")))
+    await database.delete_db_record(db=db, model=models.Employee, record_id=employee_id,
+                                    not_found_error="employee_not_found")
 
     # Response Model - Return Type
     # https://fastapi.tiangolo.com/tutorial/response-model/?h=#response-model-return-type
@@ -186,47 +476,92 @@ def delete_employee(db: Session, employee_id: int):
 """ Tickets ---------------------------------------------------------------------------------------------------- """
 
 
-def create_ticket(db: Session, ticket: schemas.TicketCreate, user_id: int, employee_id: int):
+async def create_ticket(db: AsyncSession, ticket: schemas.TicketCreate, user_id: int, employee_id: int):
     db_item = models.Ticket(**ticket.model_dump(),
                             owner_id=user_id,
-                            employee_id=employee_id,
-                            created=get_current_time_utc("TIME"))
-    db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+                            employee_id=employee_id)
+    db_item = await database.create_db_record(db=db, db_record=db_item)
     return db_item
 
 
-def get_tickets(db: Session, skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"]):
-    if limit > APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"]:
-        limit = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"]
-    return db.query(models.Ticket).offset(skip).limit(limit).all()
+async def create_tickets_bulk(db: AsyncSession, tickets: list[schemas.TicketBulkCreate], user_id: int):
+    results = {}
+
+    # Employees of the batch are checked by one query (SQLite doesn't enforce FOREIGN KEY by default)
+    employee_ids = {ticket.employee_id for ticket in tickets}
+    existing_ids = set()
+    if employee_ids:
+        existing_ids = set(await db.scalars(select(models.Employee.id).filter(models.Employee.id.in_(employee_ids))))
 
+    rows = []
+    created = get_current_time_utc("TIME")
+    for index, ticket in enumerate(tickets):
+        if ticket.employee_id in existing_ids:
+            rows.append((index, {**ticket.model_dump(), "owner_id": user_id, "created": created}))
+        else:
+            results[index] = schemas.BulkItemResult(index=index, **APP_CONFIG["raise_error"]["employee_not_found"])
 
-def get_ticket(db: Session, ticket_id: int):
-    return db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
+    await bulk_insert(db, models.Ticket, rows, results)
+    return bulk_response(results)
 
 
-def get_my_tickets(db: Session, owner_id: int, skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"]):
+async def get_tickets(db: AsyncSession, skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"],
+                      cursor: str | None = None, created_after: datetime | None = None,
+                      updated_since: datetime | None = None):
+    query = page_query(models.Ticket, skip, limit, cursor, created_after, updated_since)
+    return (await db.scalars(query)).all()
+
+
+async def get_tickets_version(db: AsyncSession, skip: int = 0, limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"],
+                              cursor: str | None = None, created_after: datetime | None = None,
+                              updated_since: datetime | None = None) -> tuple:
+    query = page_query(models.Ticket, skip, limit, cursor, created_after, updated_since)
+    return await get_version(db, query, models.Ticket)
+
+
+async def search_tickets(db: AsyncSession, query: str, skip: int = 0,
+                         limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"]):
     if limit > APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"]:
         limit = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"]
-    return db.query(models.Ticket).filter(models.Ticket.owner_id == owner_id).offset(skip).limit(limit).all()
 
+    # Ranked results are paginated by skip & limit (rank order has no keyset cursor)
+    query = search_query(models.Ticket, query, db.bind.dialect.name)
+    if query is None:
+        return []
+    return (await db.scalars(query.offset(skip).limit(limit))).all()
 
-def update_ticket(db: Session, db_ticket, ticket: schemas.TicketUpdate):
-    # Update Ticket record in database
-    db_ticket = database.update_db_record(db=db, db_record=db_ticket, payload=ticket)
-    return db_ticket
 
+async def get_ticket(db: AsyncSession, ticket_id: int):
+    return await db.scalar(select(models.Ticket).filter(models.Ticket.id == ticket_id).limit(1))
+
+
+async def get_my_tickets(db: AsyncSession, owner_id: int, skip: int = 0,
+                         limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"], cursor: str | None = None,
+                         created_after: datetime | None = None, updated_since: datetime | None = None):
+    query = page_query(models.Ticket, skip, limit, cursor, created_after, updated_since,
+                       models.Ticket.owner_id == owner_id)
+    return (await db.scalars(query)).all()
+
+
+async def get_my_tickets_version(db: AsyncSession, owner_id: int, skip: int = 0,
+                                 limit: int = APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"], cursor: str | None = None,
+                                 created_after: datetime | None = None,
+                                 updated_since: datetime | None = None) -> tuple:
+    query = page_query(models.Ticket, skip, limit, cursor, created_after, updated_since,
+                       models.Ticket.owner_id == owner_id)
+    return await get_version(db, query, models.Ticket)
+
+
+async def update_ticket(db: AsyncSession, ticket_id: int, ticket: schemas.TicketUpdate):
+    # Update Ticket record in database (404 if Ticket doesn't exist)
+    db_ticket = await database.update_db_record(db=db, model=models.Ticket, record_id=ticket_id, payload=ticket,
+                                                not_found_error="ticket_not_found")
+    return db_ticket
 
-def delete_ticket(db: Session, ticket_id: int):
-    # Check if Ticket exists
-    db_ticket = get_ticket(db, ticket_id=ticket_id)
-    if db_ticket is None:
-        raise_http_error(APP_CONFIG["raise_error"]["ticket_not_found"])
 
-    # Delete Ticket in database
-    db.delete(db_ticket)
-    db.commit()
+async def delete_ticket(db: AsyncSession, ticket_id: int):
+    # Delete Ticket in database (404 if Ticket doesn't exist)
+    await database.delete_db_record(db=db, model=models.Ticket, record_id=ticket_id,
+                                    not_found_error="ticket_not_found")
 
     return JSONResponse(content={"message": APP_CONFIG["message"]["ticket_deleted_successfully"]})
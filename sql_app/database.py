@@ -4,20 +4,128 @@ Author: Volodymyr Letiahin
 Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
 License: MIT
 """
-from sqlalchemy import create_engine, exc
-from sqlalchemy.orm import sessionmaker, declarative_base, Session
+import json
+import logging
+import os
+import random
+import re
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from sqlalchemy import create_engine, event, exc, update, delete
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from util import get_project_root, get_config, raise_http_error, get_current_time_utc
 
 APP_CONFIG = get_config()
-SQLALCHEMY_DB_PATH = f"sqlite:////{get_project_root()}{APP_CONFIG['sqlite_db_path']}"
 
-# connect_args is needed only for SQLite. It's not needed for other databases!
-engine = create_engine(SQLALCHEMY_DB_PATH, connect_args={"check_same_thread": False})
+# Database DSN: DATABASE_URL environment variable (handy to run the tests against another database),
+# then "database.url" from config.json, then SQLite database file from "sqlite_db_path"
+SQLALCHEMY_DB_URL = make_url(os.environ.get("DATABASE_URL") or APP_CONFIG["database"]["url"] or
+                             f"sqlite:////{get_project_root()}{APP_CONFIG['sqlite_db_path']}")
+DB_BACKEND = SQLALCHEMY_DB_URL.get_backend_name()  # "sqlite", "postgresql", ...
+# Supported backends: UNIQUE violations are mapped to API errors for these only (see parse_unique_violation)
+ASYNC_DB_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+if DB_BACKEND not in ASYNC_DB_DRIVERS:
+    raise ValueError(f"Unsupported database backend '{DB_BACKEND}', supported: {', '.join(ASYNC_DB_DRIVERS)}")
+SQLALCHEMY_DB_PATH = SQLALCHEMY_DB_URL.set(drivername=DB_BACKEND)  # Default (synchronous) driver of the backend
+SQLALCHEMY_ASYNC_DB_PATH = SQLALCHEMY_DB_URL.set(drivername=f"{DB_BACKEND}+{ASYNC_DB_DRIVERS[DB_BACKEND]}")
+
+if DB_BACKEND == "sqlite":
+    # connect_args is needed only for SQLite. SQLite file connections don't go stale, so pool settings are not used.
+    SYNC_ENGINE_OPTIONS = {"connect_args": {"check_same_thread": False}}
+    ASYNC_ENGINE_OPTIONS = {}
+else:
+    # Server database: connection pool settings from config.json size the pool of API requests (async engine).
+    # The synchronous engine runs the schema migration at start and the setup scripts, one connection at a time:
+    # SQLAlchemy defaults (pool_size 5) are enough and it doesn't take a share of the configured connection budget.
+    SYNC_ENGINE_OPTIONS = {"pool_pre_ping": APP_CONFIG["database"]["pool_pre_ping"]}
+    ASYNC_ENGINE_OPTIONS = {"pool_size": APP_CONFIG["database"]["pool_size"],
+                            "max_overflow": APP_CONFIG["database"]["max_overflow"],
+                            "pool_timeout": APP_CONFIG["database"]["pool_timeout"],
+                            "pool_recycle": APP_CONFIG["database"]["pool_recycle"],
+                            "pool_pre_ping": APP_CONFIG["database"]["pool_pre_ping"]}
+
+# Synchronous engine is used for schema creation and by the setup scripts only.
+engine = create_engine(SQLALCHEMY_DB_PATH, **SYNC_ENGINE_OPTIONS)
+
+# Asynchronous engine is used by API requests: the async driver (aiosqlite runs every SQLite call in its own thread)
+# lets a slow query await instead of blocking the event loop (and all other in-flight requests of the worker).
+async_engine = create_async_engine(SQLALCHEMY_ASYNC_DB_PATH, **ASYNC_ENGINE_OPTIONS)
+
+
+# SQLite tuning profile from config.json applied on every new connection. Default profile: WAL journal (readers
+# don't block the writer and vice versa, so uvicorn workers stop serializing on file locks), synchronous=NORMAL
+# (safe with WAL, no fsync per commit), memory-mapped I/O, bigger page cache, temp tables in memory and busy_timeout
+# (wait for a lock instead of failing at once with "database is locked").
+def set_sqlite_pragmas(dbapi_connection, connection_record=None):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in APP_CONFIG["sqlite_pragmas"].items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+
+if DB_BACKEND == "sqlite":
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+
+
+# Per-request SQL statistics: the request middleware (sql_app/timing.py) puts a fresh SQLStats into the context of the
+# request task, cursor events of the API engine add every statement and its time to it (the context follows the
+# request into SQLAlchemy's async greenlets). Statements slower than slow_query_ms are logged with the route and the
+# shape of parameters (types only, values may be personal data), sampled by slow_query_sample_rate.
+@dataclass
+class SQLStats:
+    scope: dict  # ASGI scope of the request, the route is found by routing after the stats are created
+    queries: int = 0
+    duration: float = 0.0  # Seconds
+
+
+REQUEST_SQL_STATS: ContextVar[SQLStats | None] = ContextVar("request_sql_stats", default=None)
+SLOW_QUERY_LOGGER = logging.getLogger("sql_app.slow_query")
+LOGGER = logging.getLogger(__name__)
+
+
+def get_parameters_shape(parameters, executemany: bool):
+    if executemany:
+        return {"rows": len(parameters), "row": get_parameters_shape(parameters[0], False) if parameters else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_started"].pop()
+    stats = REQUEST_SQL_STATS.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.duration += duration
+
+    if (duration * 1000 >= APP_CONFIG["sql_timing"]["slow_query_ms"]
+            and random.random() < APP_CONFIG["sql_timing"]["slow_query_sample_rate"]):
+        from .metrics import get_route_label  # Not at import time: the metrics module prepares Prometheus files
+        SLOW_QUERY_LOGGER.warning(json.dumps({
+            "event": "slow_query", "route": get_route_label(stats.scope) if stats is not None else "-",
+            "duration_ms": round(duration * 1000, 3), "statement": statement,
+            "parameters": get_parameters_shape(parameters, executemany)}))
+
+
+event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+event.listen(async_engine.sync_engine, "after_cursor_execute", after_cursor_execute)
 
 # Dependency -> We need to have an independent database session/connection (SessionLocal) per request, use the same
 # session through all the request and then close it after the request is finished. And then a new session will be
 # created for the next request.
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: attributes stay loaded after commit, so response serialization never triggers lazy IO
+AsyncSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=async_engine)
 Base = declarative_base()
 
 
@@ -29,55 +137,99 @@ def get_db() -> SessionLocal():
         db.close()
 
 
-def update_db_record(db: Session, db_record, payload):
-    # Set new field(s) value(s) and not override existence DB field(s)
-    for field_name in payload.model_fields_set:
-        setattr(db_record, field_name, getattr(payload, field_name))
+async def get_async_db() -> AsyncSession:
+    async with AsyncSessionLocal() as db:
+        yield db
+
 
-    # Set update time-date
-    db_record.updated = get_current_time_utc("TIME")
+# Write paths take one statement per write: no SELECT before UPDATE/DELETE (missing record is found by the empty
+# RETURNING / zero rowcount) and no refresh SELECT after commit (expire_on_commit=False keeps the sent values).
+async def update_db_record(db: AsyncSession, model, record_id: int, payload, not_found_error: str):
+    # Set new field(s) value(s) and not override existence DB field(s), set update time-date
+    values = {field_name: getattr(payload, field_name) for field_name in payload.model_fields_set}
+    values["updated"] = get_current_time_utc("TIME")
 
-    # Update record in database
+    # Update record in database: UPDATE ... WHERE id = ? RETURNING ...
     try:
-        db.commit()
-        db.refresh(db_record)
-        return db_record
+        db_record = await db.scalar(update(model).where(model.id == record_id).values(**values).returning(model))
+        await db.commit()
 
     except exc.IntegrityError as error:
-        database_error_handler(db=db, error=error)
+        await database_error_handler(db=db, error=error)
+
+    if db_record is None:
+        raise_http_error(APP_CONFIG["raise_error"][not_found_error])
+    return db_record
 
 
-def create_db_record(db: Session, db_record):
+async def create_db_record(db: AsyncSession, db_record):
     # Set created time-date
     db_record.created = get_current_time_utc("TIME")
 
-    # Create record in database
+    # Create record in database: primary key comes back from the INSERT itself
     try:
         db.add(db_record)
-        db.commit()
-        db.refresh(db_record)
+        await db.commit()
         return db_record
 
     except exc.IntegrityError as error:
-        database_error_handler(db=db, error=error)
+        await database_error_handler(db=db, error=error)
+
+
+async def delete_db_record(db: AsyncSession, model, record_id: int, not_found_error: str):
+    # Delete record in database: DELETE ... WHERE id = ?
+    result = await db.execute(delete(model).where(model.id == record_id))
+    if result.rowcount == 0:
+        await db.rollback()
+        raise_http_error(APP_CONFIG["raise_error"][not_found_error])
+    await db.commit()
+
 
+# UNIQUE field errors: (table, column) -> raise_error key in config.json
+UNIQUE_FIELD_ERRORS = {
+    ("users", "username"): "username_already_registered",
+    ("users", "phone"): "phone_already_registered",
+    ("users", "email"): "email_already_registered",
+    ("employees", "phone"): "phone_already_registered",
+    ("employees", "email"): "email_already_registered",
+}
 
-def database_error_handler(db: Session, error: exc.IntegrityError):
+
+def parse_unique_violation(error: exc.IntegrityError) -> tuple[str, str] | None:
+    # Returns (table, column) of violated UNIQUE constraint in a dialect-neutral way
+    orig = error.orig
+
+    # SQLite: "UNIQUE constraint failed: users.username"
+    message = str(orig.args[0]) if orig.args else str(orig)
+    if message.startswith("UNIQUE constraint failed: "):
+        table, _, column = message.removeprefix("UNIQUE constraint failed: ").split(",")[0].strip().partition(".")
+        return table, column
+
+    # PostgreSQL: SQLSTATE 23505 unique_violation with detail "Key (username)=(admin) already exists."
+    # asyncpg error is wrapped by SQLAlchemy adapter (original in __cause__), psycopg2 error has "diag"
+    if (getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)) == "23505":
+        cause = orig.__cause__ or orig
+        diag = getattr(orig, "diag", None)
+        table = getattr(cause, "table_name", None) or getattr(diag, "table_name", None)
+        detail = getattr(cause, "detail", None) or getattr(diag, "message_detail", None) or message
+        key = re.search(r"Key \((\w+)", detail)
+        if table and key:
+            return table, key.group(1)
+
+    return None
+
+
+async def database_error_handler(db: AsyncSession, error: exc.IntegrityError):
     # Session.rollback() method will be called so that the transaction is rolled back immediately,
     # before propagating the exception outward.
-    db.rollback()
-
-    parsed_error = str(error.orig.args[0])
+    await db.rollback()
 
     # Manage UNIQUE field errors
-    if parsed_error == "UNIQUE constraint failed: users.username":
-        raise_http_error(APP_CONFIG["raise_error"]["username_already_registered"])
-    elif parsed_error == "UNIQUE constraint failed: users.phone":
-        raise_http_error(APP_CONFIG["raise_error"]["phone_already_registered"])
-    elif parsed_error == "UNIQUE constraint failed: users.email":
-        raise_http_error(APP_CONFIG["raise_error"]["email_already_registered"])
+    error_key = UNIQUE_FIELD_ERRORS.get(parse_unique_violation(error))
+    if error_key is not None:
+        raise_http_error(APP_CONFIG["raise_error"][error_key])
 
     # Another error(s)
     else:
-        print("SQLAlchemy IntegrityError:", parsed_error)
+        LOGGER.error("SQLAlchemy IntegrityError: %s", error.orig)
         raise_http_error(APP_CONFIG["raise_error"]["error_processing_database_request"])
@@ -0,0 +1,87 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+import pydantic_core
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from . import models, schemas
+from .crud import filter_by_time
+from .database import async_engine
+from util import get_config
+
+APP_CONFIG = get_config()
+
+# Streaming export of a whole table: rows are read by server-side cursor in batches of EXPORT_BATCH_SIZE and every
+# batch is encoded and sent as one chunk of chunked transfer, so memory use doesn't depend on table size.
+# Exported fields are the response schema fields stored in the table itself (Employee.tickets are not exported).
+# Streaming body is sent after the request dependencies are closed (database session of get_async_db() included),
+# so export reads through its own connection.
+EXPORTS = {
+    "users": (models.User, schemas.UserResponse),
+    "employees": (models.Employee, schemas.EmployeeResponse),
+    "tickets": (models.Ticket, schemas.TicketResponse),
+}
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def export_columns(model, schema) -> list:
+    return [model.__table__.c[name] for name in schema.model_fields if name in model.__table__.c]
+
+
+def encode_ndjson(rows, names: list[str]) -> bytes:
+    return b"".join(pydantic_core.to_json(dict(zip(names, row))) + b"\n" for row in rows)
+
+
+def encode_csv(rows, names: list[str], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(names)
+    # Lists (User.role) as JSON, dates as ISO strings, None as empty field
+    writer.writerows([json.dumps(value) if isinstance(value, list) else value for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+
+async def export_chunks(query, names: list[str], export_format: str, compress: bool):
+    gzip = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+
+    header = True
+    async with async_engine.connect() as connection:
+        result = await connection.stream(query.execution_options(yield_per=APP_CONFIG["EXPORT_BATCH_SIZE"]))
+        async for rows in result.partitions():
+            chunk = encode_csv(rows, names, header) if export_format == "csv" else encode_ndjson(rows, names)
+            header = False
+            yield gzip.compress(chunk) if gzip else chunk
+
+    if header and export_format == "csv":  # Empty export: CSV header only
+        chunk = encode_csv([], names, header)
+        yield gzip.compress(chunk) if gzip else chunk
+    if gzip:
+        yield gzip.flush()
+
+
+def export_response(name: str, export_format: str = "ndjson", compress: bool = False,
+                    created_after: datetime | None = None, updated_since: datetime | None = None,
+                    accept_encoding: str = "") -> StreamingResponse:
+    model, schema = EXPORTS[name]
+    columns = export_columns(model, schema)
+    query = filter_by_time(select(*columns), model, created_after, updated_since).order_by(model.id)
+
+    headers = {"Content-Disposition": f'attachment; filename="{name}.{export_format}"'}
+    if compress:
+        # Transfer compression (HTTP client decompresses body transparently) is sent to clients accepting gzip only,
+        # checked as Starlette GZipMiddleware does. Encoding depends on Accept-Encoding: caches must key on it too
+        headers["Vary"] = "Accept-Encoding"
+        compress = "gzip" in accept_encoding
+        if compress:
+            headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(export_chunks(query, [column.name for column in columns], export_format, compress),
+                             media_type=MEDIA_TYPES[export_format], headers=headers)
@@ -0,0 +1,134 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from util import SETTINGS, get_config, raise_http_error
+from .metrics import PASSWORD_HASH_IN_FLIGHT, PASSWORD_HASH_QUEUE_DEPTH
+
+APP_CONFIG = get_config()
+
+
+# Argon2 hash/verify burns tens of milliseconds of CPU per call. argon2-cffi releases the GIL while hashing, so running
+# it in a dedicated thread pool keeps the event loop (and all other in-flight requests of the worker) responsive.
+# The pool is bounded: when all worker threads are busy and the waiting queue is full, the request is rejected at once
+# with 429 + Retry-After instead of piling up, so a login burst can't starve regular API traffic.
+# Jobs in flight and the queue depth are exported as gauges (/metrics): a growing queue is the warning before 429s.
+class PasswordHashPool:
+    def __init__(self, max_workers: int, max_queue_size: int, retry_after: int) -> None:
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._pending = 0  # Jobs submitted and not finished yet (running + queued), changed in event loop thread only
+
+    @property
+    def in_flight(self) -> int:
+        return self._pending
+
+    @property
+    def queue_depth(self) -> int:
+        # Jobs waiting for a free worker thread
+        return max(0, self._pending - self.max_workers)
+
+    async def run(self, func, *args):
+        if self._pending >= self.max_workers + self.max_queue_size:
+            raise_http_error(APP_CONFIG["raise_error"]["too_many_password_requests"],
+                             headers={"Retry-After": str(self.retry_after)})
+
+        self._change_pending(1)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._change_pending(-1)
+
+    def _change_pending(self, delta: int) -> None:
+        # Gauges are changed by the difference (not set): they sum up pools of the process and workers of the server
+        queue_depth = self.queue_depth
+        self._pending += delta
+        PASSWORD_HASH_IN_FLIGHT.inc(delta)
+        PASSWORD_HASH_QUEUE_DEPTH.inc(self.queue_depth - queue_depth)
+
+
+def get_pwd_context_options(pwd_context_config: dict) -> dict:
+    # passlib CryptContext arguments of config.json "auth.PWD_CONTEXT": Argon2 parameters as argon2__<name>
+    return {"schemes": pwd_context_config["schemes"], "deprecated": pwd_context_config["deprecated"],
+            **{f"argon2__{name}": value for name, value in pwd_context_config["argon2"].items()}}
+
+
+# Argon2 calibration for this host (RFC 9106 way: memory first, then passes). Memory cost is the strongest defence
+# against GPU cracking, so it is the largest power of two (KiB) whose single pass verify fits target_ms, not below
+# min_memory_kib; then time_cost grows while verify still fits. Stored hashes keep working with any parameters:
+# a hash with old ones is rehashed on the next successful login (auth.authenticate_user).
+def measure_verify_ms(time_cost: int, memory_cost: int, parallelism: int, samples: int) -> float:
+    from passlib.hash import argon2  # Deferred, as auth.get_pwd_context(): server workers never calibrate
+
+    handler = argon2.using(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+    hashed = handler.hash("calibration-Password@1")
+    durations = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        handler.verify("calibration-Password@1", hashed)
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations)
+
+
+def calibrate(target_ms: float, parallelism: int, min_memory_kib: int, max_memory_kib: int,
+              samples: int = 5) -> tuple[dict, float]:
+    memory_cost = max_memory_kib
+    verify_ms = measure_verify_ms(1, memory_cost, parallelism, samples)
+    while verify_ms > target_ms and memory_cost // 2 >= min_memory_kib:
+        memory_cost //= 2
+        verify_ms = measure_verify_ms(1, memory_cost, parallelism, samples)
+
+    time_cost = 1
+    while True:
+        next_verify_ms = measure_verify_ms(time_cost + 1, memory_cost, parallelism, samples)
+        if next_verify_ms > target_ms:
+            break
+        time_cost, verify_ms = time_cost + 1, next_verify_ms
+    return {"time_cost": time_cost, "memory_cost": memory_cost, "parallelism": parallelism}, verify_ms
+
+
+def write_argon2_config(config_path: str, parameters: dict) -> None:
+    # config.json is read once per process: running workers use new parameters after restart
+    with open(config_path) as config_file:
+        config = json.load(config_file)
+    config["auth"]["PWD_CONTEXT"]["argon2"] = parameters
+    with open(f"{config_path}.tmp", "w") as config_file:
+        json.dump(config, config_file, indent=2, ensure_ascii=False)
+        config_file.write("\n")
+    os.replace(f"{config_path}.tmp", config_path)
+
+
+if __name__ == "__main__":
+    # Run from the project root folder: python -m sql_app.hashing --target-ms 50 --write
+
+    parser = argparse.ArgumentParser(description="Calibrate Argon2 parameters to a target verify latency")
+    parser.add_argument("--target-ms", type=float, default=50)
+    parser.add_argument("--parallelism", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--min-memory-mib", type=int, default=19, help="floor of memory cost (OWASP minimum)")
+    parser.add_argument("--max-memory-mib", type=int, default=256)
+    parser.add_argument("--samples", type=int, default=5, help="verify runs per measurement (median)")
+    parser.add_argument("--write", action="store_true", help="save parameters to config/config.json")
+    args = parser.parse_args()
+
+    current = APP_CONFIG["auth"]["PWD_CONTEXT"]["argon2"]
+    current_ms = measure_verify_ms(current["time_cost"], current["memory_cost"], current["parallelism"], args.samples)
+    print(f"current parameters {current}: verify {current_ms:.1f} ms")
+    parameters, verify_ms = calibrate(args.target_ms, args.parallelism, args.min_memory_mib * 1024,
+                                      args.max_memory_mib * 1024, args.samples)
+    print(f"calibrated parameters {parameters}: verify {verify_ms:.1f} ms (target {args.target_ms} ms)")
+    if verify_ms > args.target_ms:
+        print("WARNING: target is below the verify time of the minimum memory cost")
+    if args.write:
+        write_argon2_config(str(SETTINGS.config_path / "config.json"), parameters)
+        print("saved to config/config.json, restart the server to apply")
@@ -0,0 +1,88 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import json
+import logging
+import queue
+import random
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from .database import REQUEST_SQL_STATS
+from .metrics import get_route_label
+from util import get_config
+
+APP_CONFIG = get_config()
+
+# Structured access log: one JSON line per request to the "sql_app.access" logger (own file of log.ini).
+# Error responses (status >= 400) are always logged, successful ones are sampled by success_sample_rate.
+ACCESS_LOGGER = logging.getLogger("sql_app.access")
+
+
+# Non-blocking logging: handlers configured by log.ini (uvicorn --log-config) are moved behind a QueueHandler, so a
+# log call only formats the record and puts it into a queue, file and console I/O (and rotation) is done by
+# QueueListener thread. Covers root logger and every logger with own handlers (like "sql_app.access").
+def start_queue_logging() -> list[tuple[logging.Logger, QueueHandler, QueueListener]]:
+    listeners = []
+    loggers = [logging.getLogger(), *[logger for logger in logging.root.manager.loggerDict.values()
+                                      if isinstance(logger, logging.Logger)]]
+    for logger in loggers:
+        handlers = [handler for handler in logger.handlers if not isinstance(handler, QueueHandler)]
+        if not handlers:
+            continue
+        log_queue = queue.SimpleQueue()
+        for handler in handlers:
+            logger.removeHandler(handler)
+        queue_handler = QueueHandler(log_queue)
+        logger.addHandler(queue_handler)
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        listeners.append((logger, queue_handler, listener))
+    return listeners
+
+
+def stop_queue_logging(listeners: list[tuple[logging.Logger, QueueHandler, QueueListener]]) -> None:
+    # Server shutdown: writes queued records, stops the threads and gives the handlers back to their loggers
+    for logger, queue_handler, listener in listeners:
+        listener.stop()
+        logger.removeHandler(queue_handler)
+        for handler in listener.handlers:
+            logger.addHandler(handler)
+
+
+# Pure ASGI middleware inside ServerTimingMiddleware: SQL statistics of the request are in the context.
+# User id is stored to request state by auth.get_current_user() (None for anonymous and rejected tokens).
+class AccessLogMiddleware:
+    def __init__(self, app) -> None:
+        self.app = app
+        self.enabled = APP_CONFIG["access_log"]["enabled"]
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500  # Unhandled exception: no response was started
+
+        async def send_with_status(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - started
+            if status_code >= 400 or random.random() < APP_CONFIG["access_log"]["success_sample_rate"]:
+                stats = REQUEST_SQL_STATS.get()
+                ACCESS_LOGGER.info(json.dumps({
+                    "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                    "method": scope["method"], "route": get_route_label(scope), "status": status_code,
+                    "duration_ms": round(duration * 1000, 3), "user_id": scope.get("state", {}).get("user_id"),
+                    "queries": stats.queries if stats is not None else None,
+                    "db_ms": round(stats.duration * 1000, 3) if stats is not None else None}))
@@ -0,0 +1,110 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import os
+import time
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from .metrics_dir import MULTIPROCESS_DIR  # Sets PROMETHEUS_MULTIPROC_DIR, keep it before prometheus_client
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# Prometheus metrics shared by all uvicorn worker processes (multiprocess mode, see sql_app/metrics_dir.py).
+# Gauges use "livesum": only live processes count, a stopped worker is dropped by mark_process_dead().
+
+UNMATCHED_ROUTE = "unmatched"  # Label of unknown paths: raw paths would give a new time series per scanned URL
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency",
+                                  ["method", "route", "status"])
+HTTP_REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests in progress", ["method"],
+                                  multiprocess_mode="livesum")
+DB_POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Database connections checked out from the pool")
+DB_POOL_CONNECTIONS = Counter("db_pool_connections_total", "New database connections opened by the pool")
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Database connections in use", multiprocess_mode="livesum")
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Database connections opened over pool_size",
+                         multiprocess_mode="livesum")
+PASSWORD_HASH_IN_FLIGHT = Gauge("password_hash_in_flight", "Argon2 hash / verify jobs running or queued",
+                                multiprocess_mode="livesum")
+PASSWORD_HASH_QUEUE_DEPTH = Gauge("password_hash_queue_depth", "Argon2 jobs waiting for a free hash thread",
+                                  multiprocess_mode="livesum")
+PASSWORD_HASH_DURATION = Histogram("password_hash_duration_seconds", "Argon2 hash / verify time", ["operation"],
+                                   buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+
+def get_route_label(scope: dict) -> str:
+    # Route template ("/ticket/{ticket_id}") set by routing, plain path of routes without parameters (docs)
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if "endpoint" in scope:
+        return scope["path"]
+    return UNMATCHED_ROUTE
+
+
+# Pure ASGI middleware (no BaseHTTPMiddleware: it would wrap every request into extra tasks and streams)
+class MetricsMiddleware:
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500  # Unhandled exception: no response was started
+
+        async def send_with_status(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - started
+            in_progress.dec()
+            labels = (method, get_route_label(scope), str(status_code))
+            HTTP_REQUESTS.labels(*labels).inc()
+            HTTP_REQUEST_DURATION.labels(*labels).observe(duration)
+
+
+def instrument_pool(async_engine: AsyncEngine) -> None:
+    # Pool events of the engine used by API requests (pool type depends on the database, e.g. NullPool for SQLite)
+    pool = async_engine.sync_engine.pool
+
+    def on_connect(dbapi_connection, connection_record):
+        DB_POOL_CONNECTIONS.inc()
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKOUTS.inc()
+        DB_POOL_CHECKED_OUT.inc()
+        if hasattr(pool, "overflow"):
+            DB_POOL_OVERFLOW.set(max(0, pool.overflow()))
+
+    def on_checkin(dbapi_connection, connection_record):
+        DB_POOL_CHECKED_OUT.dec()
+
+    event.listen(async_engine.sync_engine, "connect", on_connect)
+    event.listen(async_engine.sync_engine, "checkout", on_checkout)
+    event.listen(async_engine.sync_engine, "checkin", on_checkin)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    # Samples of all worker processes in the text exposition format, with its content type
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=MULTIPROCESS_DIR)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    # Worker shutdown: drop its live gauges from the aggregate
+    multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,18 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import os
+from util import get_config, get_project_root
+
+APP_CONFIG = get_config()
+
+# Prometheus metrics shared by all uvicorn worker processes: in multiprocess mode every process writes its samples
+# to memory-mapped files of PROMETHEUS_MULTIPROC_DIR and /metrics (served by any worker) sums them up. prometheus_client
+# reads the variable when it is imported, so this module must be imported before it (see sql_app/metrics.py).
+# Clear the directory before the server starts (not per worker), see README.
+MULTIPROCESS_DIR = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR",
+                                         f"{get_project_root()}{APP_CONFIG['metrics']['multiprocess_dir']}")
+os.makedirs(MULTIPROCESS_DIR, exist_ok=True)
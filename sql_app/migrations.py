@@ -0,0 +1,196 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import logging
+from sqlalchemy import Column, Integer, MetaData, Table, exc, func, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateTable
+from . import models, search
+
+# Schema migrations: create_all() only creates missing tables, it never changes existing ones. Every change of
+# an existing schema is a numbered migration below, applied once in order. Applied version is kept in the
+# "schema_version" table (one row). Migrations are idempotent ("IF EXISTS" / "checkfirst"), so a new database
+# created by create_all() with the current models passes through them without changes.
+# A new table is a migration too (create it with checkfirst): server start skips create_all() on a database that
+# already has the current schema version (see prepare_database()).
+LOGGER = logging.getLogger(__name__)
+MODEL_TABLES = (models.User.__table__, models.Employee.__table__, models.Ticket.__table__)
+schema_metadata = MetaData()
+schema_version = Table("schema_version", schema_metadata, Column("version", Integer, nullable=False))
+
+
+def drop_unused_indexes(connection: Connection):
+    # Single-column indexes on columns no query filters or orders by (models.py before index plan)
+    for index_name in ("ix_users_first_name", "ix_users_last_name", "ix_users_created", "ix_users_updated",
+                       "ix_employees_first_name", "ix_employees_last_name", "ix_employees_nick_name",
+                       "ix_employees_birthday", "ix_employees_country", "ix_employees_city", "ix_employees_address",
+                       "ix_employees_created", "ix_employees_updated",
+                       "ix_tickets_title", "ix_tickets_description", "ix_tickets_status", "ix_tickets_created",
+                       "ix_tickets_updated"):
+        connection.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+
+    # Composite indexes of the real ticket query shapes
+    for index in models.Ticket.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def rebuild_timestamps(connection: Connection, table: Table, new_metadata: MetaData):
+    if connection.dialect.name == "sqlite":
+        new_table = table.to_metadata(new_metadata, name=f"{table.name}__new")
+        connection.execute(CreateTable(new_table))  # Table only, indexes are created after rename
+        # Columns of the old table only: columns added by later migrations get their defaults
+        old_names = {column["name"] for column in inspect(connection).get_columns(table.name)}
+        old_columns = [column for column in table.columns if column.name in old_names]
+        names = ", ".join(column.name for column in old_columns)
+        values = ", ".join(f"CAST(strftime('%s', {column.name}) AS INTEGER)"
+                           if column.name in ("created", "updated") else column.name for column in old_columns)
+        connection.execute(text(f"INSERT INTO {new_table.name} ({names}) SELECT {values} FROM {table.name}"))
+        connection.execute(text(f"DROP TABLE {table.name}"))
+        connection.execute(text(f"ALTER TABLE {new_table.name} RENAME TO {table.name}"))
+    else:
+        for column_name in ("created", "updated"):
+            connection.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {column_name} TYPE BIGINT "
+                                    f"USING EXTRACT(EPOCH FROM {column_name}::timestamp)::bigint"))
+
+
+def timestamps_to_epoch(connection: Connection):
+    # "created" / "updated" from "YYYY-MM-DD HH:MM:SS" strings (written by the server, assumed UTC) to integer
+    # Unix epoch seconds. SQLite can't change column type: table is rebuilt (create new table, copy rows with
+    # converted values, drop old table, rename new one, create indexes). Server databases use ALTER COLUMN.
+    new_metadata = MetaData()  # Copy of all model tables: foreign keys of the new table must find referred tables
+    for table in MODEL_TABLES:
+        table.to_metadata(new_metadata)
+
+    for table in MODEL_TABLES:
+        # Indexes to have after migration: existing ones (models may declare UNIQUE indexes, which old tables never
+        # had and old data may violate) and new created / updated indexes of the list filters
+        index_names = {index["name"] for index in inspect(connection).get_indexes(table.name)}
+        index_names.update((f"ix_{table.name}_created", f"ix_{table.name}_updated"))
+
+        columns = {column["name"]: column["type"] for column in inspect(connection).get_columns(table.name)}
+        if columns["created"].python_type is not int:  # Table is not created by current models
+            rebuild_timestamps(connection, table, new_metadata)
+
+        for index in table.indexes:
+            if index.name in index_names:
+                index.create(connection, checkfirst=True)
+
+
+def full_text_search(connection: Connection):
+    # FTS5 tables and sync triggers of /employee/search and /ticket/search (SQLite only, others use ILIKE).
+    # NOTE: a later SQLite table rebuild drops triggers of the table, it must call create_fts_indexes() again.
+    if connection.dialect.name == "sqlite":
+        search.create_fts_indexes(connection)
+
+
+def refresh_tokens(connection: Connection):
+    models.RefreshToken.__table__.create(connection, checkfirst=True)
+
+
+def row_versions(connection: Connection):
+    # "version" column of conditional GET (see models.ROW_VERSION_INCREMENT); tables rebuilt by timestamps_to_epoch()
+    # or created by current models have it already
+    for table in MODEL_TABLES:
+        if "version" not in {column["name"] for column in inspect(connection).get_columns(table.name)}:
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+
+def get_unique_value(column_name: str, value: str, record_id: int) -> str:
+    # Duplicate made unique by the record id: "+380501112233" -> "+38050111223317", "a.b@c.d" -> "a.b.17@c.d"
+    if column_name == "email":
+        local_part, _, domain = value.rpartition("@")
+        return f"{local_part}.{record_id}@{domain}"
+    suffix = str(record_id)
+    return f"{value[:20 - len(suffix)]}{suffix}"
+
+
+def unique_employee_contacts(connection: Connection):
+    # UNIQUE indexes of employees.phone / email, which create_all() gives new databases (and the API answers 409 by)
+    # but older tables never had. Duplicates are kept by the oldest employee, newer ones get the value made unique
+    # by their id (logged, to be corrected by hand): the records and their tickets stay.
+    employees = models.Employee.__table__
+    existing_indexes = {index["name"]: index for index in inspect(connection).get_indexes(employees.name)}
+    for index in employees.indexes:
+        if not index.unique or existing_indexes.get(index.name, {}).get("unique"):
+            continue
+        column = index.columns[0]
+        duplicates = select(column).group_by(column).having(func.count() > 1)
+        first_ids = select(func.min(employees.c.id)).group_by(column)
+        for record_id, value in connection.execute(select(employees.c.id, column).filter(
+                column.in_(duplicates), employees.c.id.not_in(first_ids)).order_by(employees.c.id)):
+            unique_value = get_unique_value(column.name, value, record_id)
+            connection.execute(update(employees).where(employees.c.id == record_id).values({column: unique_value}))
+            LOGGER.warning(f"Employee {record_id}: duplicate {column.name} '{value}' changed to '{unique_value}'")
+
+        if index.name in existing_indexes:  # Non-unique index of an older model
+            connection.execute(text(f"DROP INDEX {index.name}"))
+        index.create(connection)
+
+
+MIGRATIONS = [
+    drop_unused_indexes,  # 1
+    timestamps_to_epoch,  # 2
+    full_text_search,  # 3
+    refresh_tokens,  # 4
+    row_versions,  # 5
+    unique_employee_contacts,  # 6
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(connection: Connection) -> int:
+    schema_metadata.create_all(connection)
+    return connection.scalar(select(schema_version.c.version)) or 0
+
+
+def upgrade(engine: Engine) -> int:
+    with engine.begin() as connection:
+        if connection.dialect.name == "sqlite":
+            # pysqlite runs DDL outside of transaction: explicit BEGIN makes migration atomic, IMMEDIATE takes write
+            # lock at once, so workers starting at the same time apply migrations one after another
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        version = get_schema_version(connection)
+        for migration in MIGRATIONS[version:]:
+            migration(connection)
+
+        if version == 0:
+            connection.execute(schema_version.insert().values(version=SCHEMA_VERSION))
+        elif version < SCHEMA_VERSION:
+            connection.execute(schema_version.update().values(version=SCHEMA_VERSION))
+
+    return SCHEMA_VERSION
+
+
+def read_schema_version(engine: Engine) -> int:
+    # One SELECT, no DDL and no write lock (0 if database has no schema_version table yet)
+    try:
+        with engine.connect() as connection:
+            return connection.scalar(select(schema_version.c.version)) or 0
+    except exc.OperationalError:  # SQLite: no such table
+        return 0
+    except exc.ProgrammingError:  # PostgreSQL: undefined table
+        return 0
+
+
+def prepare_database(engine: Engine, auto_migrate: bool) -> int:
+    # Server start: database with the current (or newer, during rolling deploy) schema version is used as is, so
+    # workers don't run create_all() table checks and don't wait for each other on the migration write lock.
+    # Older schema is upgraded here if auto_migrate is on, otherwise start fails: run "python -m sql_app.migrations"
+    version = read_schema_version(engine)
+    if version >= SCHEMA_VERSION:
+        return version
+    if not auto_migrate:
+        raise RuntimeError(f"Database schema version {version} is older than {SCHEMA_VERSION}, "
+                           f"run 'python -m sql_app.migrations' from the project root folder")
+
+    models.Base.metadata.create_all(bind=engine)  # Create all empty tables by "if not exist" condition
+    return upgrade(engine)  # Bring existing tables up to the current schema version
+
+
+if __name__ == "__main__":
+    from .database import engine as db_engine
+    models.Base.metadata.create_all(bind=db_engine)
+    print(f"Database schema version: {upgrade(db_engine)}")
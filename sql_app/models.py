@@ -4,31 +4,69 @@ Author: Volodymyr Letiahin
 Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
 License: MIT
 """
-from sqlalchemy import Column, ForeignKey, Integer, String, MetaData
+from datetime import datetime, timezone
+from sqlalchemy import BigInteger, Boolean, Column, Date, ForeignKey, Index, Integer, JSON, LargeBinary, String
+from sqlalchemy import MetaData, literal_column
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 from .database import Base
-from sqlalchemy.dialects.sqlite import BOOLEAN, INTEGER, JSON, VARCHAR
 
 metadata_obj = MetaData()
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# "version" column of users / employees / tickets: 1 on insert, +1 by every UPDATE statement (ORM or Core, also
+# bulk ones). "updated" has one-second resolution, version tells apart writes within the same second (ETags).
+ROW_VERSION_INCREMENT = literal_column("version") + 1
+
+
+# "created" / "updated" columns: stored as integer Unix epoch seconds (UTC), so range filters and ordering compare
+# integers by index regardless of server timezone. Python side keeps "YYYY-MM-DD HH:MM:SS" UTC string, the format
+# API has always returned. Bound value may be such string, naive (UTC) or aware datetime, or epoch integer.
+class UTCTimestamp(TypeDecorator):
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        if isinstance(value, str):
+            value = datetime.strptime(value, TIME_FORMAT)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return datetime.fromtimestamp(value, timezone.utc).strftime(TIME_FORMAT)
+
+
+# Index plan follows the real query shapes (see sql_app/migrations.py for the history):
+#   users: lookup by username (login), phone and email -> UNIQUE indexes, everything else by primary key
+#   employees: read by primary key and keyset pages "id > ? ORDER BY id" -> primary key, phone/email UNIQUE
+#   tickets: "owner_id = ? AND id > ? ORDER BY id" (my tickets) and "employee_id IN (...) ORDER BY id"
+#            (Employee.tickets) -> composite (owner_id, id) and (employee_id, id) indexes
+#   all lists: "created > ?" (created_after) and "updated >= ?" (updated_since) filters -> created, updated indexes
+# Every other index only slows down inserts and updates.
 
 
 class User(Base):
     __tablename__ = "users"  # Set relevant table name or skip this string if class name is equal table name
     metadata_obj = metadata_obj  # Create table if not exist
 
-    id = Column(INTEGER, primary_key=True, autoincrement=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     username = Column(String(16), index=True, unique=True)
-    first_name = Column(String(64), index=True)
-    last_name = Column(String(64), index=True)
+    first_name = Column(String(64))
+    last_name = Column(String(64))
     phone = Column(String(20), index=True, unique=True)
     email = Column(String(64), index=True, unique=True)
     role = Column(JSON())
-    disabled = Column(BOOLEAN, default=False)
-    login_denied = Column(BOOLEAN, default=False)
-    hashed_password = Column(VARCHAR(64))
+    disabled = Column(Boolean, default=False)
+    login_denied = Column(Boolean, default=False)
+    hashed_password = Column(String(128))  # Argon2 hash is ~100 characters (SQLite never checked the length)
 
-    created = Column(VARCHAR(19), index=True)
-    updated = Column(VARCHAR(19), index=True)
+    created = Column(UTCTimestamp, index=True)
+    updated = Column(UTCTimestamp, index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=ROW_VERSION_INCREMENT)
 
     tickets = relationship("Ticket", back_populates="owner")  # Set table relation
 
@@ -38,18 +76,19 @@ class Employee(Base):
     metadata_obj = metadata_obj  # Create table if not exist
 
     id = Column(Integer, primary_key=True)
-    first_name = Column(String(64), index=True)
-    last_name = Column(String(64), index=True)
-    nick_name = Column(String(20), index=True)
+    first_name = Column(String(64))
+    last_name = Column(String(64))
+    nick_name = Column(String(20))
     phone = Column(String(20), index=True, unique=True)
     email = Column(String(64), index=True, unique=True)
-    birthday = Column(String(10), index=True)
-    country = Column(String(64), index=True)
-    city = Column(String(64), index=True)
-    address = Column(String(254), index=True)
+    birthday = Column(Date)  # Stored as ISO "YYYY-MM-DD" text by SQLite, as DATE by server databases
+    country = Column(String(64))
+    city = Column(String(64))
+    address = Column(String(254))
 
-    created = Column(String(19), index=True)
-    updated = Column(String(19), index=True)
+    created = Column(UTCTimestamp, index=True)
+    updated = Column(UTCTimestamp, index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=ROW_VERSION_INCREMENT)
 
     tickets = relationship("Ticket", back_populates="employee")  # Set table relation
 
@@ -59,14 +98,36 @@ class Ticket(Base):
     metadata_obj = metadata_obj  # Create table if not exist
 
     id = Column(Integer, primary_key=True)
-    title = Column(String(32), index=True)
-    description = Column(String(64), index=True)
-    status = Column(String(16), index=True)
+    title = Column(String(32))
+    description = Column(String(64))
+    status = Column(String(16))
     employee_id = Column(Integer, ForeignKey("employees.id"))
     owner_id = Column(Integer, ForeignKey("users.id"))
 
-    created = Column(String(19), index=True)
-    updated = Column(String(19), index=True)
+    created = Column(UTCTimestamp, index=True)
+    updated = Column(UTCTimestamp, index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=ROW_VERSION_INCREMENT)
+
+    __table_args__ = (
+        Index("ix_tickets_owner_id_id", "owner_id", "id"),
+        Index("ix_tickets_employee_id_id", "employee_id", "id"),
+    )
 
     employee = relationship("Employee", back_populates="tickets")  # Set table relation
     owner = relationship("User", back_populates="tickets")  # Set table relation
+
+
+# Refresh tokens are opaque random strings, only HMAC of the token is stored (16 bytes, unique index: renewal is one
+# indexed lookup). Tokens of one login chain share family_id; a rotated token is kept with used=True until it
+# expires, so a second use of it (stolen token replayed) is detected and revokes the whole family.
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    metadata_obj = metadata_obj  # Create table if not exist
+
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(LargeBinary(16), index=True, unique=True)
+    family_id = Column(BigInteger, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    scopes = Column(JSON())
+    used = Column(Boolean, default=False)
+    expires = Column(UTCTimestamp, index=True)  # Expired tokens are deleted by the sweeper using this index
@@ -0,0 +1,86 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import hashlib
+import json
+import os
+import threading
+import fastapi
+import pydantic
+import starlette
+from fastapi import FastAPI
+from util import get_project_root
+from .permissions import PERMISSION_STORE
+
+# FastAPI builds the OpenAPI document on the first /openapi.json (docs) request: every route and schema is walked
+# (~50 ms of CPU), again by every worker after every restart. The document depends on the code and config only, so
+# it is cached in a file keyed by a hash of the files it is built from (all application modules: routes, schemas and
+# the dependencies they declare live there) plus FastAPI / Starlette / pydantic versions: after the first build every
+# worker just loads it. A missing or stale document is built in a background thread at start,
+# so the first docs request doesn't wait for it either. Roles and endpoints of the document come from
+# permissions.json: its hot reload (PERMISSION_STORE) drops the document of the process and takes a new cache key.
+OPENAPI_SOURCES = ("main.py", "util.py", "sql_app/*.py", "config/config.json", "config/schemas.json")
+
+
+def get_cache_key() -> str:
+    digest = hashlib.sha256(f"fastapi {fastapi.__version__} starlette {starlette.__version__} "
+                            f"pydantic {pydantic.__version__}".encode())
+    project_root = get_project_root()
+    for pattern in OPENAPI_SOURCES:
+        for source in sorted(project_root.glob(pattern)):
+            digest.update(source.relative_to(project_root).as_posix().encode() + b"\0")  # Added or renamed module
+            digest.update(source.read_bytes())
+    with open(PERMISSION_STORE.path, "rb") as permissions_file:  # The file the store reloads from
+        digest.update(permissions_file.read())
+    return digest.hexdigest()
+
+
+def load_cached_openapi(cache_path: str, cache_key: str) -> dict | None:
+    try:
+        with open(cache_path) as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+    return cache["openapi"] if cache.get("key") == cache_key else None
+
+
+def store_cached_openapi(cache_path: str, cache_key: str, openapi_schema: dict) -> None:
+    # Written to a temporary file and renamed: workers starting at the same time never read a half-written file
+    temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, "w") as cache_file:
+            json.dump({"key": cache_key, "openapi": openapi_schema}, cache_file)
+        os.replace(temporary_path, cache_path)
+    except OSError:  # Cache is optional: the document is built again by the next process
+        pass
+
+
+def install_openapi_cache(app: FastAPI, cache_path: str) -> None:
+    # Call after all routes are declared
+    build_openapi = app.openapi  # FastAPI default: builds the document once per process
+    cache_key = get_cache_key()
+
+    def invalidate() -> None:
+        nonlocal cache_key
+        cache_key = get_cache_key()
+        app.openapi_schema = None
+
+    def openapi() -> dict:
+        if app.openapi_schema is None:
+            cached_openapi = load_cached_openapi(cache_path, cache_key)
+            if cached_openapi is not None:
+                app.openapi_schema = cached_openapi
+            else:
+                # Server from root_path, as FastAPI adds it on the first /openapi.json request
+                if app.root_path and app.root_path_in_servers and {"url": app.root_path} not in app.servers:
+                    app.servers.insert(0, {"url": app.root_path})
+                store_cached_openapi(cache_path, cache_key, build_openapi())
+        return app.openapi_schema
+
+    app.openapi = openapi
+    PERMISSION_STORE.reload_listeners.append(invalidate)
+    if load_cached_openapi(cache_path, cache_key) is None:
+        threading.Thread(target=openapi, name="openapi-build", daemon=True).start()
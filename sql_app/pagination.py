@@ -0,0 +1,44 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import base64
+import binascii
+import json
+from fastapi import Response
+from util import get_config, raise_http_error
+
+APP_CONFIG = get_config()
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Keyset (cursor) pagination: list is ordered by primary key and the next page is read by "WHERE id > :last_id",
+# so database seeks by index instead of walking and discarding all skipped rows like OFFSET does.
+# Cursor is opaque for clients: URL-safe base64 of a small JSON document with the last returned id.
+
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))["id"]
+        if isinstance(last_id, int) and not isinstance(last_id, bool):
+            return last_id
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        pass
+
+    raise_http_error(APP_CONFIG["raise_error"]["invalid_cursor"])
+
+
+def get_page_limit(limit: int) -> int:
+    return min(limit, APP_CONFIG["BODY_RESPONSE_ITEMS_LIMIT"])
+
+
+def set_next_cursor(response: Response, items: list, limit: int) -> None:
+    # Full page means there may be more items: return cursor pointing after the last one
+    if items and len(items) >= get_page_limit(limit):
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(items[-1].id)
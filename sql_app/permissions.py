@@ -0,0 +1,110 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable
+from util import get_config, get_permissions, get_json_file_content, get_project_root
+
+APP_CONFIG = get_config()
+LOGGER = logging.getLogger(__name__)
+
+
+# permissions.json compiled once into bitmasks: every role gets its own bit, every endpoint key ("POST_user",
+# "GET_ticket", ...) gets the OR of the bits of the roles allowed to call it. User's role list is compiled into
+# a mask once (and cached with the principal), so the access check is a single integer AND per request.
+# version tells matrices of one store apart: a mask compiled by an older matrix must be compiled again.
+class PermissionMatrix:
+    def __init__(self, permissions: dict, version: int = 0) -> None:
+        self.version = version
+        acl_lists = {key: value for key, value in permissions.items() if isinstance(value, list)}
+        self.rbac_roles: list[str] = list(permissions["rbac_roles"])
+
+        # Known roles first, then any role mentioned in endpoint ACL only (still matched as before)
+        self.roles: list[str] = list(dict.fromkeys(
+            permissions["rbac_roles"] + [role for acl in acl_lists.values() for role in acl]))
+        self.role_bits: dict[str, int] = {role: 1 << index for index, role in enumerate(self.roles)}
+        self.endpoint_masks: dict[str, int] = {key: self.role_mask(acl) for key, acl in acl_lists.items()
+                                               if key != "rbac_roles"}
+
+    def role_mask(self, roles: list[str] | None) -> int:
+        mask = 0
+        for role in roles or []:
+            mask |= self.role_bits.get(role, 0)
+        return mask
+
+    def endpoint_mask(self, endpoint: str) -> int:
+        return self.endpoint_masks[endpoint]
+
+    def allows(self, endpoint: str, role_mask: int) -> bool:
+        return self.endpoint_masks[endpoint] & role_mask != 0
+
+
+# Hot reload of permissions.json without a restart. File mtime is checked by os.stat() on access, at most once per
+# check_interval seconds, so every uvicorn worker picks a change up on its own (as the principal cache stamp file).
+# New content is compiled into a new PermissionMatrix first and swapped in by one reference assignment: a request
+# sees either the old or the new matrix, never a half-built one. Content that doesn't parse or misses an endpoint
+# key used by a route is rejected, the previous matrix stays in use (rewrite the file to try again).
+class PermissionStore:
+    def __init__(self, path: str, permissions: dict, check_interval: float) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self.required_endpoints: set[str] = set()
+        self.reload_listeners: list[Callable[[], None]] = []
+        self._matrix = PermissionMatrix(permissions)
+        self._mtime = self._read_mtime()
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _read_mtime(self) -> int:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    @property
+    def matrix(self) -> PermissionMatrix:
+        if time.monotonic() - self._checked >= self.check_interval:
+            self.reload_if_changed()
+        return self._matrix
+
+    def require(self, endpoint: str) -> None:
+        self._matrix.endpoint_mask(endpoint)  # Fail fast on unknown endpoint key
+        self.required_endpoints.add(endpoint)
+
+    def reload_if_changed(self) -> bool:
+        with self._lock:
+            self._checked = time.monotonic()
+            mtime = self._read_mtime()
+            if mtime == self._mtime:
+                return False
+            self._mtime = mtime
+            return self.reload()
+
+    def reload(self) -> bool:
+        try:
+            matrix = PermissionMatrix(get_json_file_content(self.path), version=self._matrix.version + 1)
+            missing = self.required_endpoints - matrix.endpoint_masks.keys()
+            if missing:
+                raise KeyError(f"missing endpoint keys {sorted(missing)}")
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            LOGGER.error(f"permissions.json reload rejected, previous permissions kept: {error}")
+            return False
+
+        self._matrix = matrix
+        for listener in self.reload_listeners:  # E.g. drop cached principals with role masks of the old matrix
+            listener()
+        LOGGER.info("permissions.json reloaded")
+        return True
+
+
+PERMISSION_STORE = PermissionStore(
+    path=f"{get_project_root()}/config/permissions.json",
+    permissions=get_permissions(),
+    check_interval=APP_CONFIG["auth"]["PERMISSIONS_RELOAD"]["check_interval"]
+)
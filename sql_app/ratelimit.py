@@ -0,0 +1,169 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import asyncio
+import logging
+import math
+import sqlite3
+import threading
+import time
+from util import get_config, get_project_root, raise_http_error
+
+APP_CONFIG = get_config()
+LOGGER = logging.getLogger(__name__)
+
+# Token bucket: refills continuously up to capacity, takes at most one token of debt (hammering a rejected key
+# doesn't push its recovery further than one refill step). Update and read of the bucket is one atomic statement.
+TAKE_TOKEN = """
+INSERT INTO login_buckets (key, tokens, updated, failures) VALUES (:key, :capacity - 1, :now, :failure)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = max(min(:capacity, tokens + (:now - updated) * :rate) - 1, -1),
+    updated = :now,
+    failures = failures + :failure
+RETURNING tokens, failures
+"""
+READ_TOKENS = """
+SELECT min(:capacity, tokens + (:now - updated) * :rate), locked_until FROM login_buckets WHERE key = :key
+"""
+# Lockout of a username: every next lockout lasts twice as long (up to max_lockout), failures start over.
+# Only the statement that still sees the failures over the threshold locks: concurrent workers lock once.
+LOCK_USERNAME = """
+UPDATE login_buckets SET
+    locked_until = :now + min(:lockout * (1 << min(lockouts, 30)), :max_lockout),
+    lockouts = lockouts + 1,
+    failures = 0
+WHERE key = :key AND failures >= :lockout_failures
+RETURNING locked_until - :now
+"""
+
+
+# Login throttling shared by all uvicorn workers of the server: per client IP bucket takes a token on every /token
+# request, per username bucket is checked before the user lookup and takes a token on every failed password, so
+# a rejected request costs one SQLite statement instead of an Argon2 verify. Buckets live in a small SQLite file
+# of their own (WAL, no fsync: losing counters on power loss is fine), apart from the API database writes.
+# SQLite calls run in a thread, never on the event loop, and wait at most busy_timeout_ms for a lock held by another
+# worker: a busy or broken counter file lets the login through (fail open) instead of stalling it.
+# Consecutive failed passwords of a username are counted until a successful login; at lockout_failures the username
+# is locked for lockout seconds, doubled by every next lockout (lockouts are remembered for state_ttl). The lock is
+# temporary on purpose: anyone can send wrong passwords for any username, users.login_denied stays admin's decision.
+# Usernames are case-sensitive (users.username), so are their buckets. Idle buckets are swept after state_ttl.
+class LoginRateLimiter:
+    def __init__(self, db_path: str, ip_limit: dict, username_limit: dict, lockout_failures: int,
+                 lockout_seconds: float, max_lockout_seconds: float, state_ttl_seconds: float,
+                 busy_timeout_ms: int = 50, enabled: bool = True) -> None:
+        self.db_path = db_path
+        self.ip_limit = (ip_limit["capacity"], ip_limit["refill_per_minute"] / 60)  # (capacity, tokens per second)
+        self.username_limit = (username_limit["capacity"], username_limit["refill_per_minute"] / 60)
+        self.lockout_failures = lockout_failures
+        self.lockout_seconds = lockout_seconds
+        self.max_lockout_seconds = max_lockout_seconds
+        self.state_ttl_seconds = state_ttl_seconds
+        self.busy_timeout_ms = busy_timeout_ms
+        self.enabled = enabled
+        self._connection = None  # Opened by the first login, not at import
+        self._lock = threading.Lock()
+        self._swept = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            connection.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(login_buckets)")}
+            if columns and "locked_until" not in columns:  # Counters of an older version: disposable
+                connection.execute("DROP TABLE login_buckets")
+            connection.execute("CREATE TABLE IF NOT EXISTS login_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+                               "updated REAL NOT NULL, failures INTEGER NOT NULL DEFAULT 0, "
+                               "locked_until REAL NOT NULL DEFAULT 0, lockouts INTEGER NOT NULL DEFAULT 0)")
+            self._connection = connection
+        return self._connection
+
+    def _execute(self, statement: str, parameters: dict):
+        # Runs in a worker thread; None if the counter file is busy or broken (the login is let through)
+        try:
+            with self._lock:
+                connection = self._connect()
+                now = parameters["now"]
+                if now - self._swept > 60:  # Sweep idle buckets at most once a minute per worker
+                    self._swept = now
+                    connection.execute("DELETE FROM login_buckets WHERE updated < ? AND locked_until < ?",
+                                       (now - self.state_ttl_seconds, now))
+                return connection.execute(statement, parameters).fetchone()
+        except sqlite3.Error as error:
+            LOGGER.warning(f"Login rate limit skipped: {error}")
+            return None
+
+    def _reject(self, retry_after: float) -> None:
+        raise_http_error(APP_CONFIG["raise_error"]["too_many_login_attempts"],
+                         headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+    def _check(self, client_ip: str | None, username: str) -> float | None:
+        now = time.time()
+        capacity, rate = self.ip_limit
+        row = self._execute(TAKE_TOKEN, {"key": f"ip:{client_ip}", "capacity": capacity, "rate": rate,
+                                         "now": now, "failure": 0})
+        if row is not None and row[0] < 0:
+            return (1 - row[0]) / rate
+
+        capacity, rate = self.username_limit
+        row = self._execute(READ_TOKENS, {"key": f"user:{username}", "capacity": capacity, "rate": rate, "now": now})
+        if row is not None and row[1] > now:
+            return row[1] - now
+        if row is not None and row[0] < 1:
+            return (1 - row[0]) / rate
+        return None
+
+    def _login_failed(self, username: str) -> None:
+        now = time.time()
+        capacity, rate = self.username_limit
+        row = self._execute(TAKE_TOKEN, {"key": f"user:{username}", "capacity": capacity, "rate": rate,
+                                         "now": now, "failure": 1})
+        if row is None or not 0 < self.lockout_failures <= row[1]:
+            return
+        row = self._execute(LOCK_USERNAME, {"key": f"user:{username}", "now": now, "lockout": self.lockout_seconds,
+                                            "max_lockout": self.max_lockout_seconds,
+                                            "lockout_failures": self.lockout_failures})
+        if row is not None:
+            LOGGER.warning(f"Login of username '{username}' locked for {row[0]:.0f}s after "
+                           f"{self.lockout_failures} failed passwords")
+
+    async def check(self, client_ip: str | None, username: str) -> None:
+        # Before the user lookup and password verify: 429 + Retry-After if client IP or username bucket is empty
+        # or the username is locked
+        if not self.enabled:
+            return
+        retry_after = await asyncio.to_thread(self._check, client_ip, username)
+        if retry_after is not None:
+            self._reject(retry_after)
+
+    async def login_failed(self, username: str) -> None:
+        # Wrong password or unknown username: takes a token of the username, locks it at lockout_failures
+        if self.enabled:
+            await asyncio.to_thread(self._login_failed, username)
+
+    async def login_succeeded(self, username: str) -> None:
+        # Consecutive failures end: username starts over with a full bucket and no lockout history
+        if self.enabled:
+            await asyncio.to_thread(self._execute, "DELETE FROM login_buckets WHERE key = :key",
+                                    {"key": f"user:{username}", "now": time.time()})
+
+    def reset(self) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM login_buckets")
+
+
+LOGIN_RATE_LIMITER = LoginRateLimiter(
+    db_path=f"{get_project_root()}{APP_CONFIG['auth']['LOGIN_RATE_LIMIT']['db_path']}",
+    ip_limit=APP_CONFIG["auth"]["LOGIN_RATE_LIMIT"]["ip"],
+    username_limit=APP_CONFIG["auth"]["LOGIN_RATE_LIMIT"]["username"],
+    lockout_failures=APP_CONFIG["auth"]["LOGIN_RATE_LIMIT"]["lockout_failures"],
+    lockout_seconds=APP_CONFIG["auth"]["LOGIN_RATE_LIMIT"]["lockout_minutes"] * 60,
+    max_lockout_seconds=APP_CONFIG["auth"]["LOGIN_RATE_LIMIT"]["max_lockout_minutes"] * 60,
+    state_ttl_seconds=APP_CONFIG["auth"]["LOGIN_RATE_LIMIT"]["state_ttl_minutes"] * 60,
+    busy_timeout_ms=APP_CONFIG["auth"]["LOGIN_RATE_LIMIT"]["busy_timeout_ms"],
+    enabled=APP_CONFIG["auth"]["LOGIN_RATE_LIMIT"]["enabled"]
+)
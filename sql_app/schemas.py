@@ -6,6 +6,7 @@ License: MIT
 """
 from datetime import date
 from pydantic import BaseModel, Field, model_validator
+from typing import Any
 from typing_extensions import Self
 import re
 import util
@@ -32,6 +33,7 @@ PERMISSIONS = util.get_permissions()
 class AuthToken(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
 
 
 class AuthTokenData(BaseModel):
@@ -39,6 +41,17 @@ class AuthTokenData(BaseModel):
     scopes: list[str] = []
 
 
+class AuthPrincipal(BaseModel):
+    # Authenticated User data required for authorization only (cached per token "sub" to skip database lookup)
+    id: int
+    username: str
+    role: list[str] = []
+    disabled: bool | None = False
+    login_denied: bool | None = False
+    role_mask: int = 0  # User's roles compiled by PermissionMatrix
+    permissions_version: int = 0  # PermissionMatrix.version the role_mask was compiled with
+
+
 """ Users ---------------------------------------------------------------------------------------------------------- """
 
 
@@ -222,6 +235,11 @@ class TicketCreate(TicketBase):
     pass
 
 
+class TicketBulkCreate(TicketBase):
+    # Bulk request item: every Ticket names its own Employee
+    employee_id: int
+
+
 class TicketResponse(TicketBase):
     id: int
     created: str
@@ -254,3 +272,20 @@ class EmployeeResponse(EmployeeBase):
         # https://errors.pydantic.dev/2.8/migration/
         # orm_mode = True  # Pydantic V1 version format -> 'orm_mode' has been renamed to 'from_attributes'
         from_attributes = True  # Pydantic V2 version
+
+
+""" Bulk ---------------------------------------------------------------------------------------------------------- """
+
+
+class BulkItemResult(BaseModel):
+    # Result of one bulk request item: created record id or error (status_code + detail like single item request)
+    index: int
+    id: int | None = None
+    status_code: int
+    detail: Any = None
+
+
+class BulkResponse(BaseModel):
+    created: int
+    failed: int
+    items: list[BulkItemResult]
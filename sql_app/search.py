@@ -0,0 +1,77 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import re
+from sqlalchemy import and_, column, func, literal_column, or_, select, table, text
+from sqlalchemy.engine import Connection
+from . import models
+
+# Full-text search: SQLite FTS5 "external content" tables index text columns of employees and tickets (rows stay
+# in the main tables, FTS keeps only the index). Triggers keep the index in sync on every INSERT, DELETE and UPDATE
+# of indexed columns. Results are ranked by bm25 and every term matches as a prefix ("smi kyi" finds "Smith"
+# in "Kyiv"), prefix indexes of 2 and 3 characters make typeahead queries cheap.
+# Other databases have no FTS5: search falls back to case-insensitive substring match of every term (ILIKE).
+FTS_INDEXES = {
+    models.Employee: ("employees_fts", ("first_name", "last_name", "nick_name", "city", "address")),
+    models.Ticket: ("tickets_fts", ("title", "description")),
+}
+SEARCH_TERMS_LIMIT = 8
+LIKE_ESCAPE = "\\"
+
+
+def create_fts_indexes(connection: Connection):
+    for model, (fts_name, columns) in FTS_INDEXES.items():
+        table_name = model.__tablename__
+        names = ", ".join(columns)
+        new_values = ", ".join(f"new.{column}" for column in columns)
+        old_values = ", ".join(f"old.{column}" for column in columns)
+
+        connection.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_name} USING fts5({names}, "
+                                f"content='{table_name}', content_rowid='id', "
+                                f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"))
+        connection.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts_name}_insert AFTER INSERT ON {table_name} BEGIN "
+                                f"INSERT INTO {fts_name} (rowid, {names}) VALUES (new.id, {new_values}); END"))
+        connection.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts_name}_delete AFTER DELETE ON {table_name} BEGIN "
+                                f"INSERT INTO {fts_name} ({fts_name}, rowid, {names}) "
+                                f"VALUES ('delete', old.id, {old_values}); END"))
+        connection.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts_name}_update AFTER UPDATE OF {names} "
+                                f"ON {table_name} BEGIN "
+                                f"INSERT INTO {fts_name} ({fts_name}, rowid, {names}) "
+                                f"VALUES ('delete', old.id, {old_values}); "
+                                f"INSERT INTO {fts_name} (rowid, {names}) VALUES (new.id, {new_values}); END"))
+        connection.execute(text(f"INSERT INTO {fts_name} ({fts_name}) VALUES ('rebuild')"))  # Index existing rows
+
+
+def get_search_terms(query: str) -> list[str]:
+    # Words only: FTS5 query syntax (quotes, NEAR, column filters, ...) in user input is never passed through
+    return re.findall(r"\w+", query.lower())[:SEARCH_TERMS_LIMIT]
+
+
+def escape_like(term: str) -> str:
+    # LIKE wildcards of a term ("_" is a word character) and the escape character itself match literally
+    return term.replace(LIKE_ESCAPE, LIKE_ESCAPE * 2).replace("%", LIKE_ESCAPE + "%").replace("_", LIKE_ESCAPE + "_")
+
+
+def search_query(model, query: str, dialect_name: str):
+    # SELECT of model rows matching all terms, most relevant first (None if query has no words)
+    terms = get_search_terms(query)
+    if not terms:
+        return None
+
+    fts_name, columns = FTS_INDEXES[model]
+    if dialect_name == "sqlite":
+        fts_table = table(fts_name, column("rowid"))
+        match = " ".join(f'"{term}"*' for term in terms)  # Every term as quoted prefix, all terms must match
+        return (select(model)
+                .join(fts_table, fts_table.c.rowid == model.id)
+                .filter(literal_column(fts_name).op("MATCH")(match))
+                .order_by(func.bm25(literal_column(fts_name)), model.id))
+
+    return (select(model)
+            .filter(and_(*[or_(*[getattr(model, column_name).ilike(f"%{escape_like(term)}%", escape=LIKE_ESCAPE)
+                                 for column_name in columns])
+                           for term in terms]))
+            .order_by(model.id))
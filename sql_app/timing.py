@@ -0,0 +1,46 @@
+"""
+Project name: REST API server solution based on FastAPI framework with RBAC model
+Author: Volodymyr Letiahin
+Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
+License: MIT
+"""
+import time
+from .database import REQUEST_SQL_STATS, SQLStats
+from util import get_config
+
+APP_CONFIG = get_config()
+
+
+def get_server_timing(stats: SQLStats, app_duration: float) -> bytes:
+    # Server-Timing (W3C) is shown by browser dev tools next to network timings, durations are in milliseconds
+    return (f'db;dur={stats.duration * 1000:.3f};desc="{stats.queries} queries", '
+            f'app;dur={app_duration * 1000:.3f}').encode()
+
+
+# Per-request SQL statistics (see sql_app/database.py) and "Server-Timing" response header. Pure ASGI middleware:
+# the context variable set here is seen by the route and its database calls. Header covers the time until the
+# response start, statements of a streamed body (export) are counted but sent after the headers.
+class ServerTimingMiddleware:
+    def __init__(self, app) -> None:
+        self.app = app
+        self.header = APP_CONFIG["sql_timing"]["server_timing_header"]
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = SQLStats(scope)
+        started = time.perf_counter()
+
+        async def send_with_timing(message) -> None:
+            if message["type"] == "http.response.start" and self.header:
+                message["headers"] = [*message.get("headers", []),
+                                      (b"server-timing", get_server_timing(stats, time.perf_counter() - started))]
+            await send(message)
+
+        token = REQUEST_SQL_STATS.set(stats)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            REQUEST_SQL_STATS.reset(token)
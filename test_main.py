@@ -5,11 +5,37 @@ Contact: https://www.linkedin.com/in/volodymyr-letiahin-0208a5b2/
 License: MIT
 """
 from main import app, APP_CONFIG
+from sql_app.hashing import PasswordHashPool
+from sql_app.permissions import PermissionMatrix, PERMISSION_STORE
+from sql_app.database import engine, async_engine, parse_unique_violation, AsyncSessionLocal
+from sql_app import migrations, crud, models, search, auth, openapi_cache
+from sql_app.openapi_cache import get_cache_key
+from sql_app.logs import ACCESS_LOGGER, start_queue_logging, stop_queue_logging
+from sql_app.ratelimit import LOGIN_RATE_LIMITER
+from sql_app.cache import PrincipalCache
+from sqlalchemy import insert, inspect, select, text
+from sqlalchemy import exc
+from sqlalchemy import event
+from contextlib import contextmanager
 import util
+import asyncio
+import threading
+import sqlite3
+import os
+import time
+import csv
+import io
+import json
+import logging
+from datetime import datetime, timedelta
 
 # FastAPI Testing: https://fastapi.tiangolo.com/tutorial/testing/#testing
 from pytest_assert_utils import util as pt_util
 from fastapi.testclient import TestClient
+from fastapi import HTTPException
+from pydantic import TypeAdapter
+from sql_app import schemas
+import pytest
 
 
 TestApiServer = TestClient(app)
@@ -22,6 +48,34 @@ def print_response(response):
     util.print_json(response.json())
 
 
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+def get_query_count(response) -> int:
+    # Number of SQL statements of the request, from "Server-Timing: db;dur=...;desc="N queries", app;dur=..."
+    db_timing = response.headers["server-timing"].split(",")[0]
+    return int(db_timing.split('desc="')[1].split()[0])
+
+
+def assert_max_queries(method: str, url: str, max_queries: int, **kwargs):
+    # Query budget of an endpoint: fails on N+1 regressions (e.g. lazy loads per row)
+    response = TestApiServer.request(method, url, **kwargs)
+    assert response.status_code < 400, response.text
+    assert get_query_count(response) <= max_queries, (method, url, response.headers["server-timing"])
+    return response
+
+
 def test_create_valid_admin_header():
     response = TestApiServer.post(TestApiRootPath + "/token",
                                   data={
@@ -37,7 +91,8 @@ def test_create_valid_admin_header():
     assert response.status_code == 200
     assert response.json() == {
         "access_token": pt_util.Any(str),
-        "token_type": "bearer"
+        "token_type": "bearer",
+        "refresh_token": pt_util.Any(str)
     }
 
 
@@ -84,8 +139,54 @@ def test_get_new_user_token():
     assert response.status_code == 200
     assert response.json() == {
         "access_token": pt_util.Any(str),
-        "token_type": "bearer"
+        "token_type": "bearer",
+        "refresh_token": pt_util.Any(str)
     }
+    TestData["user_refresh_token"] = response.json()["refresh_token"]
+
+
+def test_refresh_token_rotation():
+    def refresh(refresh_token):
+        return TestApiServer.post(TestApiRootPath + "/token/refresh", data={"refresh_token": refresh_token})
+
+    invalid = APP_CONFIG["raise_error"]["invalid_refresh_token"]
+    first = TestData["user_refresh_token"]
+    response = refresh(first)
+    assert response.status_code == 200
+    second = response.json()["refresh_token"]
+    assert second != first
+    response = TestApiServer.get(TestApiRootPath + "/me",
+                                 headers={"Authorization": "Bearer " + response.json()["access_token"]})
+    assert response.json()["username"] == TestData["user"]["username"]
+
+    # Reuse of the rotated token revokes the whole family: its successor is rejected too
+    assert refresh(first).json() == {"detail": invalid["detail"]}
+    assert refresh(second).status_code == invalid["status_code"]
+    assert refresh("not-a-token").status_code == invalid["status_code"]
+
+    response = TestApiServer.post(TestApiRootPath + "/token",
+                                  data={"username": TestData["user"]["username"],
+                                        "password": TestData["user_password"]})
+    TestData["user_refresh_token"] = response.json()["refresh_token"]
+
+    # Sweeper deletes expired tokens by the expires index
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE refresh_tokens SET expires = 0 WHERE user_id = :user_id"),
+                           {"user_id": TestData["user"]["id"]})
+    assert refresh(TestData["user_refresh_token"]).status_code == invalid["status_code"]
+
+    async def sweep():
+        async with AsyncSessionLocal() as db:
+            return await crud.delete_expired_refresh_tokens(db)
+
+    assert asyncio.run(sweep()) >= 1
+    with engine.connect() as connection:
+        assert connection.scalar(text("SELECT count(*) FROM refresh_tokens WHERE expires = 0")) == 0
+
+    response = TestApiServer.post(TestApiRootPath + "/token",
+                                  data={"username": TestData["user"]["username"],
+                                        "password": TestData["user_password"]})
+    TestData["user_refresh_token"] = response.json()["refresh_token"]
 
 
 def test_read_me_new_user():
@@ -106,6 +207,130 @@ def test_read_status_new_user():
     assert response.json() == {"status": "ok"}
 
 
+def test_disable_new_user():
+    response = TestApiServer.patch(TestApiRootPath + f'/user/{TestData["user"]["id"]}/disabled',
+                                   headers=TestData["valid_admin_header"],
+                                   json={"disabled": True})
+    print_response(response)
+
+    assert response.status_code == 200
+    assert response.json()["disabled"] is True
+
+
+def test_read_status_disabled_new_user():
+    # Principal of the user is cached by previous requests: disabling must invalidate it
+    response = TestApiServer.get(TestApiRootPath + "/status",
+                                 headers=TestData["user_header"])
+    print_response(response)
+
+    assert response.status_code == APP_CONFIG["raise_error"]["user_disabled"]["status_code"]
+    assert response.json() == {"detail": APP_CONFIG["raise_error"]["user_disabled"]["detail"]}
+
+
+def test_enable_new_user():
+    response = TestApiServer.patch(TestApiRootPath + f'/user/{TestData["user"]["id"]}/disabled',
+                                   headers=TestData["valid_admin_header"],
+                                   json={"disabled": False})
+    print_response(response)
+
+    assert response.status_code == 200
+    assert response.json()["disabled"] is False
+
+
+def test_refresh_token_revoked_by_disable():
+    # Tokens issued before the user was disabled were revoked by the update
+    response = TestApiServer.post(TestApiRootPath + "/token/refresh",
+                                  data={"refresh_token": TestData["user_refresh_token"]})
+    assert response.status_code == APP_CONFIG["raise_error"]["invalid_refresh_token"]["status_code"]
+
+
+def test_login_rate_limit():
+    def login(password, username=TestData["user"]["username"]):
+        return TestApiServer.post(TestApiRootPath + "/token", data={"username": username, "password": password})
+
+    def expire_lockout():
+        with sqlite3.connect(LOGIN_RATE_LIMITER.db_path) as connection:
+            connection.execute("UPDATE login_buckets SET locked_until = 0")
+
+    settings = ("ip_limit", "username_limit", "lockout_failures", "lockout_seconds", "max_lockout_seconds")
+    limits = {name: getattr(LOGIN_RATE_LIMITER, name) for name in settings}
+    incorrect = APP_CONFIG["raise_error"]["incorrect_user_name_or_password"]["status_code"]
+    throttled = APP_CONFIG["raise_error"]["too_many_login_attempts"]["status_code"]
+    LOGIN_RATE_LIMITER.reset()
+    try:
+        # Username bucket: 3 failed passwords, then even the right one is rejected before the lookup and the hash
+        LOGIN_RATE_LIMITER.username_limit = (3, 1 / 60)
+        assert [login("wrong-Password@1").status_code for _ in range(3)] == [incorrect] * 3
+        response = login(TestData["user_password"])
+        assert response.status_code == throttled
+        assert 0 < int(response.headers["Retry-After"]) <= 60
+
+        # Usernames are case-sensitive: another spelling is another account with a bucket of its own
+        assert login("wrong-Password@1", username=TestData["user"]["username"].upper()).status_code == incorrect
+
+        # Lockout: 5th consecutive failure locks the username for a while, every next lockout twice as long
+        LOGIN_RATE_LIMITER.reset()
+        LOGIN_RATE_LIMITER.username_limit = (100, 1)
+        LOGIN_RATE_LIMITER.lockout_failures, LOGIN_RATE_LIMITER.lockout_seconds = 5, 300
+        LOGIN_RATE_LIMITER.max_lockout_seconds = 1000
+        retry_after = []
+        for _ in range(3):
+            assert [login("wrong-Password@1").status_code for _ in range(5)] == [incorrect] * 5
+            response = login(TestData["user_password"])
+            assert response.status_code == throttled
+            retry_after.append(int(response.headers["Retry-After"]))
+            expire_lockout()
+        assert all(expected - 1 <= seconds <= expected for seconds, expected in zip(retry_after, [300, 600, 1000]))
+
+        # Administrative login_denied flag is not touched: the lock ends by itself and failures start over
+        response = TestApiServer.get(TestApiRootPath + f'/user/{TestData["user"]["id"]}',
+                                     headers=TestData["valid_admin_header"])
+        assert response.json()["login_denied"] is False
+        assert login(TestData["user_password"]).status_code == 200
+
+        # Client IP bucket: every attempt takes a token
+        LOGIN_RATE_LIMITER.reset()
+        LOGIN_RATE_LIMITER.ip_limit = (2, 1 / 60)
+        assert [login("wrong-Password@1").status_code for _ in range(3)] == [incorrect, incorrect, throttled]
+    finally:
+        for name, value in limits.items():
+            setattr(LOGIN_RATE_LIMITER, name, value)
+        LOGIN_RATE_LIMITER.reset()
+
+
+def test_password_rehash_on_login():
+    from passlib.hash import argon2
+    from sql_app.auth import get_pwd_context
+
+    def get_hashed_password():
+        with engine.connect() as connection:
+            return connection.execute(text("SELECT hashed_password FROM users WHERE id = :id"),
+                                      {"id": TestData["user"]["id"]}).scalar_one()
+
+    # Hash of weaker Argon2 parameters (as before a calibration) is replaced by the first successful login
+    old_hash = argon2.using(memory_cost=1024, rounds=1, parallelism=1).hash(TestData["user_password"])
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE users SET hashed_password = :hash WHERE id = :id"),
+                           {"hash": old_hash, "id": TestData["user"]["id"]})
+    assert get_pwd_context().needs_update(old_hash)
+
+    response = TestApiServer.post(TestApiRootPath + "/token",
+                                  data={"username": TestData["user"]["username"],
+                                        "password": TestData["user_password"]})
+    assert response.status_code == 200
+    new_hash = get_hashed_password()
+    assert new_hash != old_hash
+    assert not get_pwd_context().needs_update(new_hash)
+    assert get_pwd_context().verify(TestData["user_password"], new_hash)
+
+    # Current hash: nothing to do
+    response = TestApiServer.post(TestApiRootPath + "/token",
+                                  data={"username": TestData["user"]["username"],
+                                        "password": TestData["user_password"]})
+    assert response.status_code == 200
+    assert get_hashed_password() == new_hash
+
+
 def test_create_new_employee():
     response = TestApiServer.post(TestApiRootPath + "/employee",
                                   headers=TestData["user_header"],
@@ -154,6 +379,22 @@ def test_update_new_employee():
     assert response.json() == TestData["employee"]
 
 
+def test_search_updated_new_employee():
+    search_url = TestApiRootPath + "/employee/search?include_tickets=false&q="
+
+    # Update trigger keeps FTS index in sync: new last name is found by prefixes, old one is not found anymore
+    response = TestApiServer.get(search_url + "marr smi kyi", headers=TestData["user_header"])
+    print_response(response)
+    assert response.status_code == 200
+    assert response.json()[0]["id"] == TestData["employee"]["id"]
+
+    response = TestApiServer.get(search_url + "marr fox", headers=TestData["user_header"])
+    assert response.json() == []
+
+    response = TestApiServer.get(search_url + '"*', headers=TestData["user_header"])  # No words: nothing to match
+    assert response.json() == []
+
+
 def test_create_new_ticket_for_new_employee():
     response = TestApiServer.post(TestApiRootPath + f'/ticket/{TestData["employee"]["id"]}',
                                   headers=TestData["user_header"],
@@ -190,6 +431,273 @@ def test_read_new_employee_with_ticket():
     assert response.json() == TestData["employee"]
 
 
+def test_update_new_ticket():
+    ticket = {key: TestData["ticket"][key] for key in ("title", "description", "status")}
+    with count_queries() as statements:
+        response = TestApiServer.put(TestApiRootPath + f'/ticket/{TestData["ticket"]["id"]}',
+                                     headers=TestData["user_header"],
+                                     json={**ticket, "status": "In progress"})
+    print_response(response)
+
+    TestData["ticket"]["status"] = "In progress"
+    TestData["ticket"]["updated"] = response.json()["updated"]
+
+    assert response.status_code == 200
+    assert response.json() == TestData["ticket"]
+    assert len(statements) == 1  # UPDATE ... RETURNING, no SELECT before or after
+
+    response = TestApiServer.put(TestApiRootPath + "/ticket/0", headers=TestData["user_header"], json=ticket)
+    assert response.status_code == APP_CONFIG["raise_error"]["ticket_not_found"]["status_code"]
+
+    response = TestApiServer.get(TestApiRootPath + f'/employee/{TestData["employee"]["id"]}',
+                                 headers=TestData["user_header"])
+    assert response.json()["tickets"] == [TestData["ticket"]]
+
+
+def test_search_new_ticket():
+    response = TestApiServer.get(TestApiRootPath + f'/ticket/search?q={TestData["ticket"]["title"][:4]}',
+                                 headers=TestData["user_header"])
+    print_response(response)
+
+    assert response.status_code == 200
+    assert TestData["ticket"] in response.json()
+
+
+def test_search_fallback_escapes_wildcards():
+    # ILIKE fallback of databases without FTS5 (run here by SQLite as LIKE): "_" of a word is not a wildcard
+    with engine.connect() as connection:
+        ticket_ids = connection.scalars(search.search_query(models.Ticket, "network_problem", "postgresql")).all()
+        assert TestData["ticket"]["id"] not in ticket_ids
+        ticket_ids = connection.scalars(search.search_query(models.Ticket, "network problem", "postgresql")).all()
+        assert TestData["ticket"]["id"] in ticket_ids
+    assert search.escape_like("a_b%c\\") == "a\\_b\\%c\\\\"
+
+
+def test_read_all_tickets_by_time_filters():
+    ticket_url = TestApiRootPath + "/ticket/?limit=100"
+    created = TestData["ticket"]["created"].replace(" ", "T")
+    updated = TestData["ticket"]["updated"].replace(" ", "T")
+
+    response = TestApiServer.get(ticket_url + f"&created_after={created}", headers=TestData["user_header"])
+    assert response.status_code == 200
+    assert TestData["ticket"]["id"] not in [ticket["id"] for ticket in response.json()]  # Strictly after
+
+    response = TestApiServer.get(ticket_url + f"&updated_since={updated}Z", headers=TestData["user_header"])
+    assert response.status_code == 200
+    assert response.json() == [TestData["ticket"]]
+
+    # Same moment in another timezone
+    created_before = datetime.strptime(created, "%Y-%m-%dT%H:%M:%S") - timedelta(seconds=1)
+    response = TestApiServer.get(ticket_url + f"&created_after={created_before.isoformat()}-02:00",
+                                 headers=TestData["user_header"])
+    assert TestData["ticket"]["id"] not in [ticket["id"] for ticket in response.json()]
+    response = TestApiServer.get(ticket_url + f"&created_after={created_before.isoformat()}Z",
+                                 headers=TestData["user_header"])
+    assert TestData["ticket"]["id"] in [ticket["id"] for ticket in response.json()]
+
+
+def test_export_tickets():
+    export_url = TestApiRootPath + "/ticket/export"
+    list_response = TestApiServer.get(TestApiRootPath + "/ticket/?limit=100000", headers=TestData["user_header"])
+
+    response = TestApiServer.get(export_url, headers=TestData["user_header"])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == list_response.json()
+
+    response = TestApiServer.get(export_url + "?format=csv&gzip=true", headers=TestData["user_header"])
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"  # Decompressed by HTTP client
+    assert response.headers["vary"] == "Accept-Encoding"
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert list(rows[0]) == list(schemas.TicketResponse.model_fields)
+    assert [int(row["id"]) for row in rows] == [ticket["id"] for ticket in list_response.json()]
+
+    # Client not accepting gzip gets the same export uncompressed
+    response = TestApiServer.get(export_url + "?format=csv&gzip=true",
+                                 headers={**TestData["user_header"], "Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert list(csv.DictReader(io.StringIO(response.text))) == rows
+
+    # Time filter: empty export still has CSV header
+    created = TestData["ticket"]["created"].replace(" ", "T")
+    response = TestApiServer.get(export_url + f"?format=csv&created_after={created}Z", headers=TestData["user_header"])
+    assert response.text.splitlines() == [",".join(schemas.TicketResponse.model_fields)]
+
+
+def test_read_all_employees_constant_queries():
+    # Warm up principal cache, so only queries of the page itself are counted
+    TestApiServer.get(TestApiRootPath + "/employee/?limit=1", headers=TestData["user_header"])
+
+    query_counts = {}
+    for limit in (1, 10, 100):
+        with count_queries() as statements:
+            response = TestApiServer.get(TestApiRootPath + f"/employee/?limit={limit}",
+                                         headers=TestData["user_header"])
+        assert response.status_code == 200
+        query_counts[limit] = len(statements)
+
+    # Employees page + one batched tickets query, whatever the page size is (no N+1)
+    assert query_counts == {1: 2, 10: 2, 100: 2}
+
+
+def test_read_all_employees_response_model():
+    # Fast list path dumps rows directly: body must be exactly what response_model validation would produce
+    response = TestApiServer.get(TestApiRootPath + "/employee/?limit=100", headers=TestData["user_header"])
+    employee_list = TypeAdapter(list[schemas.EmployeeResponse])
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert employee_list.dump_python(employee_list.validate_python(response.json()), mode="json") == response.json()
+
+
+def test_read_new_employee_tickets_options():
+    employee_url = TestApiRootPath + f'/employee/{TestData["employee"]["id"]}'
+
+    response = TestApiServer.get(employee_url + "?tickets_limit=1", headers=TestData["user_header"])
+    assert response.status_code == 200
+    assert response.json() == TestData["employee"]
+
+    for query in ("?include_tickets=false", "?tickets_limit=0"):
+        with count_queries() as statements:
+            response = TestApiServer.get(employee_url + query, headers=TestData["user_header"])
+        assert response.status_code == 200
+        assert response.json()["tickets"] == []
+        assert len(statements) == 1
+
+
+def test_conditional_reads():
+    ticket_url = TestApiRootPath + f'/ticket/{TestData["ticket"]["id"]}'
+    response = TestApiServer.get(ticket_url, headers=TestData["user_header"])
+    assert response.headers["etag"].startswith('W/"')
+
+    for validator in ({"If-None-Match": response.headers["etag"]},
+                      {"If-Modified-Since": response.headers["last-modified"]}):
+        not_modified = TestApiServer.get(ticket_url, headers={**TestData["user_header"], **validator})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        assert not_modified.headers["etag"] == response.headers["etag"]
+
+    response = TestApiServer.get(ticket_url, headers={**TestData["user_header"], "If-None-Match": 'W/"other"'})
+    assert response.status_code == 200
+    assert response.json() == TestData["ticket"]
+
+    # Revalidation of pages and employee (with tickets): one version query, rows are neither loaded nor serialized
+    employee_url = TestApiRootPath + f'/employee/{TestData["employee"]["id"]}'
+    urls = (employee_url, employee_url + "?tickets_limit=2", employee_url + "?include_tickets=false",
+            TestApiRootPath + "/employee/?limit=100", TestApiRootPath + "/ticket/?limit=100",
+            TestApiRootPath + "/ticket/my/", TestApiRootPath + "/user/?limit=100")
+    etags = {}
+    for url in urls:
+        etags[url] = TestApiServer.get(url, headers=TestData["user_header"]).headers["etag"]
+        with count_queries() as statements:
+            response = TestApiServer.get(url, headers={**TestData["user_header"], "If-None-Match": etags[url]})
+        assert response.status_code == 304, url
+        assert len(statements) == 1, url
+
+    # New ticket of the employee: new version of the employee and of my tickets, in the same second too
+    ticket = {key: TestData["ticket"][key] for key in ("title", "description", "status")}
+    response = TestApiServer.post(TestApiRootPath + f'/ticket/{TestData["employee"]["id"]}',
+                                  headers=TestData["user_header"], json=ticket)
+    new_ticket_id = response.json()["id"]
+    for url in (employee_url, employee_url + "?tickets_limit=2", TestApiRootPath + "/ticket/my/"):
+        response = TestApiServer.get(url, headers={**TestData["user_header"], "If-None-Match": etags[url]})
+        assert response.status_code == 200, url
+        assert response.headers["etag"] != etags[url], url
+
+    response = TestApiServer.delete(TestApiRootPath + f"/ticket/{new_ticket_id}", headers=TestData["user_header"])
+    assert response.status_code == 200
+    response = TestApiServer.get(employee_url,
+                                 headers={**TestData["user_header"], "If-None-Match": etags[employee_url]})
+    assert response.status_code == 304
+
+    # Every update is a new version, also two of them within one second ("updated" has one-second resolution)
+    list_url = TestApiRootPath + "/ticket/?limit=100"
+    seen_etags = {(url, TestApiServer.get(url, headers=TestData["user_header"]).headers["etag"])
+                  for url in (ticket_url, list_url)}
+    for status in ("Updated", TestData["ticket"]["status"]):
+        assert TestApiServer.put(ticket_url, headers=TestData["user_header"],
+                                 json={**ticket, "status": status}).status_code == 200
+        for url in (ticket_url, list_url):
+            etag = TestApiServer.get(url, headers=TestData["user_header"]).headers["etag"]
+            assert (url, etag) not in seen_etags, url
+            seen_etags.add((url, etag))
+    TestData["ticket"]["updated"] = TestApiServer.get(ticket_url, headers=TestData["user_header"]).json()["updated"]
+
+
+def get_bulk_employees(series: int, count: int) -> list[dict]:
+    # Own phone / email range (+999 is not a country code): never collides with seeded Employees (unique columns)
+    employee = {key: TestData["employee"][key] for key in TestData["employee_update"]}
+    return [{**employee, "phone": f"+99900{series}{index:04d}", "email": f"Bulk.Fox{series}.{index}@example.com"}
+            for index in range(count)]
+
+
+def delete_employees(employee_ids):
+    for employee_id in employee_ids:
+        assert TestApiServer.delete(TestApiRootPath + f"/employee/{employee_id}",
+                                    headers=TestData["user_header"]).status_code == 200
+
+
+def test_create_employees_bulk():
+    # Request is validated as a whole, as single item requests: an invalid item rejects it before any insert
+    employees = get_bulk_employees(series=1, count=3)
+    response = TestApiServer.post(TestApiRootPath + "/employee/bulk", headers=TestData["user_header"],
+                                  json=[employees[0], {**employees[0], "birthday": "not a date"}])
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", 1, "birthday"]
+
+    # Duplicate phone of the batch fails in the database: that item only, the others are created
+    employees.insert(1, {**employees[0], "email": "Bulk.Fox1.duplicate@example.com"})
+    response = TestApiServer.post(TestApiRootPath + "/employee/bulk", headers=TestData["user_header"], json=employees)
+    print_response(response)
+
+    assert response.status_code == 200
+    assert response.json()["created"] == 3
+    assert response.json()["failed"] == 1
+    phone_already_registered = APP_CONFIG["raise_error"]["phone_already_registered"]
+    assert [item["status_code"] for item in response.json()["items"]] == [200, phone_already_registered["status_code"],
+                                                                          200, 200]
+    assert response.json()["items"][1]["detail"] == phone_already_registered["detail"]
+
+    employee_ids = [item["id"] for item in response.json()["items"] if item["id"] is not None]
+    response = TestApiServer.get(TestApiRootPath + f"/employee/{employee_ids[-1]}", headers=TestData["user_header"])
+    assert response.status_code == 200
+    assert response.json()["email"] == "Bulk.Fox1.2@example.com"
+
+    # Delete bulk records, so next tests see the same database
+    delete_employees(employee_ids)
+
+
+def test_create_tickets_bulk():
+    response = TestApiServer.post(TestApiRootPath + "/employee/bulk", headers=TestData["user_header"],
+                                  json=get_bulk_employees(series=2, count=3))
+    assert response.json()["created"] == 3
+    employee_ids = [item["id"] for item in response.json()["items"]]
+
+    tickets = [{**TestData["ticket"], "employee_id": employee_id} for employee_id in employee_ids]
+    tickets.append({**TestData["ticket"], "employee_id": 0})  # Unknown Employee
+
+    response = TestApiServer.post(TestApiRootPath + "/ticket/bulk", headers=TestData["user_header"], json=tickets)
+    print_response(response)
+
+    assert response.status_code == 200
+    assert response.json()["created"] == 3
+    assert [item["status_code"] for item in response.json()["items"]] == [200, 200, 200, 404]
+    assert response.json()["items"][3]["detail"] == APP_CONFIG["raise_error"]["employee_not_found"]["detail"]
+
+    ticket_ids = [item["id"] for item in response.json()["items"] if item["id"] is not None]
+    response = TestApiServer.get(TestApiRootPath + f"/employee/{employee_ids[0]}", headers=TestData["user_header"])
+    assert [ticket["owner_id"] for ticket in response.json()["tickets"]] == [TestData["user"]["id"]]
+
+    # Delete bulk records, so next tests see the same database
+    for ticket_id in ticket_ids:
+        assert TestApiServer.delete(TestApiRootPath + f"/ticket/{ticket_id}",
+                                    headers=TestData["user_header"]).status_code == 200
+    delete_employees(employee_ids)
+
+
 def test_read_my_ticket():
     response = TestApiServer.get(TestApiRootPath + "/ticket/my/?skip=0&limit=100",
                                  headers=TestData["user_header"])
@@ -199,6 +707,37 @@ def test_read_my_ticket():
     assert response.json() == [TestData["ticket"]]
 
 
+def test_read_all_tickets_by_cursor():
+    response = TestApiServer.get(TestApiRootPath + "/ticket/?skip=0&limit=100",
+                                 headers=TestData["user_header"])
+    skip_ids = [ticket["id"] for ticket in response.json()]
+
+    # Walk through all tickets page by page with 1 ticket per page
+    cursor_ids = []
+    url = TestApiRootPath + "/ticket/?limit=1"
+    while True:
+        response = TestApiServer.get(url, headers=TestData["user_header"])
+        assert response.status_code == 200
+        cursor_ids += [ticket["id"] for ticket in response.json()]
+
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if next_cursor is None:
+            break
+        url = TestApiRootPath + f"/ticket/?limit=1&cursor={next_cursor}"
+
+    assert TestData["ticket"]["id"] in cursor_ids
+    assert cursor_ids == skip_ids
+
+
+def test_read_my_ticket_invalid_cursor():
+    response = TestApiServer.get(TestApiRootPath + "/ticket/my/?cursor=Wrong-Cursor!!!",
+                                 headers=TestData["user_header"])
+    print_response(response)
+
+    assert response.status_code == APP_CONFIG["raise_error"]["invalid_cursor"]["status_code"]
+    assert response.json() == {"detail": APP_CONFIG["raise_error"]["invalid_cursor"]["detail"]}
+
+
 def test_delete_new_ticket():
     response = TestApiServer.delete(TestApiRootPath + f'/ticket/{TestData["ticket"]["id"]}',
                                     headers=TestData["user_header"])
@@ -246,6 +785,14 @@ def test_read_deleted_new_employee():
     assert response.json() == {"detail": APP_CONFIG["raise_error"]["employee_not_found"]["detail"]}
 
 
+def test_search_deleted_new_employee():
+    response = TestApiServer.get(TestApiRootPath + "/employee/search?q=marr smi kyi",
+                                 headers=TestData["user_header"])
+
+    assert response.status_code == 200
+    assert TestData["employee"]["id"] not in [employee["id"] for employee in response.json()]
+
+
 def test_delete_new_user():
     response = TestApiServer.delete(TestApiRootPath + f'/user/{TestData["user"]["id"]}',
                                     headers=TestData["valid_admin_header"])
@@ -264,6 +811,19 @@ def test_read_deleted_new_user():
     assert response.json() == {"detail": APP_CONFIG["raise_error"]["user_not_found"]["detail"]}
 
 
+def test_update_deleted_new_user_password():
+    hash_count = 'password_hash_duration_seconds_count{operation="hash"}'
+    hashes_before = get_metric_samples().get(hash_count, 0)
+    response = TestApiServer.patch(TestApiRootPath + f'/user/{TestData["user"]["id"]}/password',
+                                   headers=TestData["valid_admin_header"],
+                                   json={"password": TestData["user_password"]})
+    print_response(response)
+
+    assert response.status_code == APP_CONFIG["raise_error"]["user_not_found"]["status_code"]
+    assert response.json() == {"detail": APP_CONFIG["raise_error"]["user_not_found"]["detail"]}
+    assert get_metric_samples().get(hash_count, 0) == hashes_before  # No Argon2 hash for an unknown User
+
+
 def test_read_me_by_deleted_new_user():
     response = TestApiServer.get(TestApiRootPath + "/me",
                                  headers=TestData["user_header"])
@@ -271,3 +831,364 @@ def test_read_me_by_deleted_new_user():
 
     assert response.status_code == APP_CONFIG["raise_error"]["incorrect_user_name_or_password"]["status_code"]
     assert response.json() == {"detail": APP_CONFIG["raise_error"]["incorrect_user_name_or_password"]["detail"]}
+
+
+def get_metric_samples() -> dict[str, float]:
+    response = TestApiServer.get(TestApiRootPath + "/metrics", headers=TestData["valid_admin_header"])
+    assert response.status_code == 200
+    samples = {}
+    for line in response.text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_password_hash_pool_back_pressure():
+    pool = PasswordHashPool(max_workers=1, max_queue_size=1, retry_after=3)
+    release = threading.Event()
+
+    async def fill_pool_and_overflow():
+        # 1 job is running + 1 job is queued = the pool is full
+        blocked = [asyncio.create_task(pool.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert pool.queue_depth == 1
+
+        # Saturation is visible in /metrics before requests are rejected
+        samples = get_metric_samples()
+        assert samples["password_hash_in_flight"] >= 2
+        assert samples["password_hash_queue_depth"] >= 1
+
+        with pytest.raises(HTTPException) as rejected:
+            await pool.run(release.wait)
+
+        release.set()
+        await asyncio.gather(*blocked)
+        assert pool.in_flight == 0
+        samples = get_metric_samples()
+        assert samples["password_hash_in_flight"] == samples["password_hash_queue_depth"] == 0
+        return rejected.value
+
+    error = asyncio.run(fill_pool_and_overflow())
+
+    assert error.status_code == APP_CONFIG["raise_error"]["too_many_password_requests"]["status_code"]
+    assert error.detail == APP_CONFIG["raise_error"]["too_many_password_requests"]["detail"]
+    assert error.headers == {"Retry-After": "3"}
+
+
+def test_permission_matrix():
+    matrix = PermissionMatrix({"about": "Test permissions",
+                               "rbac_roles": ["admin", "manager", "support"],
+                               "POST_user": ["admin"],
+                               "GET_ticket": ["manager", "support"],
+                               "GET_report": ["auditor"]})  # Role known by endpoint ACL only
+
+    assert matrix.allows("POST_user", matrix.role_mask(["admin"]))
+    assert not matrix.allows("POST_user", matrix.role_mask(["manager", "support"]))
+    assert matrix.allows("GET_ticket", matrix.role_mask(["admin", "support"]))
+    assert matrix.allows("GET_report", matrix.role_mask(["auditor"]))
+    assert not matrix.allows("GET_ticket", matrix.role_mask(["unknown"]))
+    assert not matrix.allows("GET_ticket", matrix.role_mask(None))
+
+
+def test_permissions_hot_reload(tmp_path, monkeypatch):
+    search_url = TestApiRootPath + "/ticket/search?q=network"
+    with open(PERMISSION_STORE.path) as permissions_file:
+        permissions_text = permissions_file.read()
+
+    # Store reads a copy, config/permissions.json is never touched (path and mtime are restored after the test)
+    permissions_path = str(tmp_path / "permissions.json")
+    with open(permissions_path, "w") as permissions_file:
+        permissions_file.write(permissions_text)
+    monkeypatch.setattr(PERMISSION_STORE, "path", permissions_path)
+    monkeypatch.setattr(PERMISSION_STORE, "_mtime", PERMISSION_STORE._read_mtime())
+
+    def write_permissions(text):  # Atomic replace, as a deployment would do it
+        with open(permissions_path + ".tmp", "w") as permissions_file:
+            permissions_file.write(text)
+        os.replace(permissions_path + ".tmp", permissions_path)
+        stamp = time.time_ns() + 1_000_000
+        os.utime(permissions_path, ns=(stamp, stamp))  # New mtime even within file time resolution
+
+    try:
+        assert TestApiServer.get(search_url, headers=TestData["valid_admin_header"]).status_code == 200
+        openapi_key = get_cache_key()
+        app.openapi()
+
+        permissions = json.loads(permissions_text)
+        old_matrix = PERMISSION_STORE.matrix
+        # Reversed roles: bit of "admin" in the old matrix is the bit of "support" in the new one
+        write_permissions(json.dumps({**permissions, "rbac_roles": permissions["rbac_roles"][::-1],
+                                      "GET_ticket_search": ["support"]}))
+        assert PERMISSION_STORE.reload_if_changed()
+        assert PERMISSION_STORE.matrix.version == old_matrix.version + 1
+
+        # Principal with a role mask of the old matrix (loaded during the reload): the mask is compiled again
+        stale_principal = schemas.AuthPrincipal(id=1, username="admin", role=["admin"],
+                                                role_mask=old_matrix.role_mask(["admin"]),
+                                                permissions_version=old_matrix.version)
+        with pytest.raises(HTTPException) as error:
+            auth.RBAC(endpoint="GET_ticket_search")(stale_principal)
+        assert error.value.status_code == APP_CONFIG["raise_error"]["not_enough_permissions"]["status_code"]
+        assert app.openapi_schema is None  # OpenAPI document of the old permissions is dropped, new cache key
+        assert get_cache_key() != openapi_key
+        response = TestApiServer.get(search_url, headers=TestData["valid_admin_header"])
+        assert response.status_code == APP_CONFIG["raise_error"]["not_enough_permissions"]["status_code"]
+
+        # Broken file or removed endpoint key is rejected: previous permissions stay in use
+        write_permissions(permissions_text[:20])
+        assert not PERMISSION_STORE.reload_if_changed()
+        write_permissions(json.dumps({key: value for key, value in permissions.items() if key != "GET_ticket"}))
+        assert not PERMISSION_STORE.reload_if_changed()
+        response = TestApiServer.get(search_url, headers=TestData["valid_admin_header"])
+        assert response.status_code == APP_CONFIG["raise_error"]["not_enough_permissions"]["status_code"]
+    finally:
+        write_permissions(permissions_text)
+        PERMISSION_STORE.reload_if_changed()
+
+    assert TestApiServer.get(search_url, headers=TestData["valid_admin_header"]).status_code == 200
+
+
+def test_principal_cache(tmp_path):
+    cache = PrincipalCache(max_size=10, ttl_seconds=60, stamp_path=str(tmp_path / "stamp"), stamp_check_seconds=60)
+    principal = schemas.AuthPrincipal(id=1, username="cached", role=[], disabled=False, login_denied=False, role_mask=0)
+
+    # Principal loaded before an invalidate() is not put into the cache: it may be stale
+    generation = cache.generation
+    cache.invalidate(principal.id)
+    cache.put(principal, generation)
+    assert cache.get("cached") is None
+    cache.put(principal, cache.generation)
+    assert cache.get("cached") == principal
+
+    # Stamp of another worker is checked at most once per stamp_check_seconds
+    stamp = time.time_ns() + 1_000_000_000
+    os.utime(tmp_path / "stamp", ns=(stamp, stamp))
+    assert cache.get("cached") == principal
+    cache.stamp_check_seconds = 0
+    assert cache.get("cached") is None
+
+    # Two workers sharing the stamp: A invalidates another user before its stamp check, B's change is not lost
+    worker_a = PrincipalCache(max_size=10, ttl_seconds=60, stamp_path=str(tmp_path / "shared"), stamp_check_seconds=60)
+    worker_b = PrincipalCache(max_size=10, ttl_seconds=60, stamp_path=str(tmp_path / "shared"), stamp_check_seconds=60)
+    worker_a.put(principal, worker_a.generation)
+    worker_b.invalidate(principal.id)  # E.g. user disabled by a request of worker B
+    worker_a.invalidate(2)
+    assert worker_a.get("cached") is None
+
+
+def test_parse_unique_violation():
+    class PostgresUniqueViolation(Exception):  # psycopg2 style error: SQLSTATE in "pgcode", details in "diag"
+        pgcode = "23505"
+        diag = type("Diag", (), {"table_name": "users", "message_detail": "Key (email)=(a@b.c) already exists."})
+
+    sqlite_error = exc.IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed: users.username"))
+    postgres_error = exc.IntegrityError("INSERT", {}, PostgresUniqueViolation("duplicate key value"))
+    other_error = exc.IntegrityError("INSERT", {}, Exception("NOT NULL constraint failed: users.username"))
+
+    class AsyncpgUniqueViolation(Exception):  # asyncpg error wrapped by SQLAlchemy adapter: details in __cause__
+        sqlstate = "23505"
+
+    asyncpg_cause = type("UniqueViolationError", (Exception,),
+                         {"table_name": "employees", "detail": "Key (phone)=(+380504430000) already exists."})
+    asyncpg_orig = AsyncpgUniqueViolation("duplicate key value")
+    asyncpg_orig.__cause__ = asyncpg_cause()
+    asyncpg_error = exc.IntegrityError("INSERT", {}, asyncpg_orig)
+
+    assert parse_unique_violation(sqlite_error) == ("users", "username")
+    assert parse_unique_violation(postgres_error) == ("users", "email")
+    assert parse_unique_violation(asyncpg_error) == ("employees", "phone")
+    assert parse_unique_violation(other_error) is None
+
+
+def test_postgres_statements():
+    # PostgreSQL path (asyncpg server, psycopg2 setup) can't run here: statements must at least compile for it
+    from sqlalchemy import update
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.schema import CreateIndex
+
+    def compile_postgres(statement) -> str:
+        return " ".join(str(statement.compile(dialect=postgresql.dialect())).split())
+
+    statement = compile_postgres(update(models.Ticket).where(models.Ticket.id == 1).values(status="New")
+                                 .returning(models.Ticket))
+    assert statement.startswith("UPDATE tickets SET status=%(status)s, version=(version + %(version_1)s) "
+                                "WHERE tickets.id = %(id_1)s RETURNING tickets.id,")
+    statement = compile_postgres(insert(models.Employee).values(phone="+380504430000")
+                                 .returning(models.Employee.id))
+    assert statement == "INSERT INTO employees (phone, version) VALUES (%(phone)s, %(version)s) RETURNING employees.id"
+    statement = compile_postgres(update(models.RefreshToken).where(~models.RefreshToken.used).values(used=True)
+                                 .returning(models.RefreshToken.user_id))
+    assert statement.endswith("WHERE NOT refresh_tokens.used RETURNING refresh_tokens.user_id")
+    assert {compile_postgres(CreateIndex(index)) for index in models.Employee.__table__.indexes if index.unique} == {
+        "CREATE UNIQUE INDEX ix_employees_phone ON employees (phone)",
+        "CREATE UNIQUE INDEX ix_employees_email ON employees (email)"}
+
+
+def test_unique_employee_contacts_migration():
+    # Older employees table: no UNIQUE indexes, duplicates in it. Oldest employee keeps the value.
+    from sqlalchemy import create_engine
+    scratch_engine = create_engine("sqlite://")
+    employees = models.Employee.__table__
+    with scratch_engine.begin() as connection:
+        employees.create(connection)
+        for index_name in ("ix_employees_phone", "ix_employees_email"):
+            connection.execute(text(f"DROP INDEX {index_name}"))
+        connection.execute(text("CREATE INDEX ix_employees_phone ON employees (phone)"))
+        connection.execute(insert(employees), [
+            {"id": 1, "phone": "+380504430000", "email": "a@b.com"},
+            {"id": 2, "phone": "+380504430000", "email": "a@b.com"},
+            {"id": 3, "phone": "+380504430001", "email": "c@b.com"},
+        ])
+        migrations.unique_employee_contacts(connection)
+
+        assert connection.execute(select(employees.c.id, employees.c.phone, employees.c.email)
+                                  .order_by(employees.c.id)).all() == [
+            (1, "+380504430000", "a@b.com"), (2, "+3805044300002", "a.2@b.com"), (3, "+380504430001", "c@b.com")]
+        indexes = {index["name"]: index["unique"] for index in inspect(connection).get_indexes("employees")}
+        assert indexes["ix_employees_phone"] and indexes["ix_employees_email"]
+        migrations.unique_employee_contacts(connection)  # Idempotent
+    scratch_engine.dispose()
+
+
+def test_schema_migrations():
+    assert migrations.upgrade(engine) == migrations.SCHEMA_VERSION  # Already applied: no changes
+    with engine.connect() as connection:
+        assert migrations.get_schema_version(connection) == migrations.SCHEMA_VERSION
+
+    # Server start on a current database: one SELECT of the version, no create_all() and no migration lock
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        assert migrations.prepare_database(engine, auto_migrate=False) == migrations.SCHEMA_VERSION
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert len(statements) == 1
+
+    ticket_indexes = {index["name"]: index["column_names"] for index in inspect(engine).get_indexes("tickets")}
+    assert ticket_indexes == {"ix_tickets_owner_id_id": ["owner_id", "id"],
+                              "ix_tickets_employee_id_id": ["employee_id", "id"],
+                              "ix_tickets_created": ["created"],
+                              "ix_tickets_updated": ["updated"]}
+
+    # Stored as Unix epoch integer, rendered as UTC string: checked on a row of its own (rolled back), so the test
+    # doesn't depend on tickets left in the database
+    with engine.connect() as connection:
+        ticket_id = connection.execute(insert(models.Ticket).values(title="Epoch", created="2024-01-02 03:04:05")
+                                       .returning(models.Ticket.id)).scalar_one()
+        row = connection.execute(text("SELECT typeof(created), created FROM tickets WHERE id = :id"),
+                                 {"id": ticket_id}).one()
+        assert tuple(row) == ("integer", 1704164645)
+        assert connection.scalar(select(models.Ticket.created).where(models.Ticket.id == ticket_id)) == \
+            "2024-01-02 03:04:05"
+        connection.rollback()
+
+
+def test_openapi_cache():
+    openapi_schema = app.openapi()
+    with open(util.get_project_root() / APP_CONFIG["api_docs"]["cache_path"].lstrip("/")) as cache_file:
+        cache = json.load(cache_file)
+
+    assert cache["key"] == get_cache_key()
+    assert cache["openapi"] == openapi_schema
+    assert "/ticket/export" in openapi_schema["paths"]
+
+
+def test_openapi_cache_key(tmp_path, monkeypatch):
+    # Any application module is a source of the document, not only main.py and schemas
+    project_root = util.get_project_root()
+    for pattern in openapi_cache.OPENAPI_SOURCES:
+        for source in project_root.glob(pattern):
+            (tmp_path / source.relative_to(project_root)).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / source.relative_to(project_root)).write_bytes(source.read_bytes())
+    monkeypatch.setattr(openapi_cache, "get_project_root", lambda: tmp_path)
+    cache_key = get_cache_key()
+
+    with open(tmp_path / "sql_app" / "auth.py", "a") as module_file:
+        module_file.write("\n# Changed dependency\n")
+    assert get_cache_key() != cache_key
+    cache_key = get_cache_key()
+
+    (tmp_path / "sql_app" / "new_module.py").write_text("")
+    assert get_cache_key() != cache_key
+
+
+def test_metrics():
+    ticket_url = TestApiRootPath + "/ticket/0"
+    TestApiServer.get(ticket_url, headers=TestData["valid_admin_header"])  # 404 of a known route
+
+    response = TestApiServer.get(TestApiRootPath + "/metrics", headers=TestData["valid_admin_header"])
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+    samples = get_metric_samples()
+    assert samples['http_requests_total{method="GET",route="/ticket/{ticket_id}",status="404"}'] >= 1
+    assert samples['http_request_duration_seconds_count{method="GET",route="/ticket/{ticket_id}",status="404"}'] >= 1
+    assert samples['password_hash_duration_seconds_count{operation="verify"}'] >= 1
+    assert samples["db_pool_checkouts_total"] >= 1
+    assert not any('route="/ticket/0"' in name for name in samples)  # Route templates only
+
+    response = TestApiServer.get(TestApiRootPath + "/metrics", headers=TestData["base_header"])
+    assert response.status_code == APP_CONFIG["raise_error"]["could_not_validate_credentials"]["status_code"]
+
+
+def test_query_budgets(caplog):
+    budgets = {
+        "/me": 2,  # Principal of the token (on cache miss), then the full user profile
+        "/user/?limit=100": 1,
+        "/employee/?limit=100&include_tickets=false": 1,
+        "/employee/?limit=100": 2,  # Employees, then tickets of the whole page by one query
+        "/employee/search?q=a": 2,
+        "/ticket/?limit=100": 1,
+        "/ticket/my/": 1,
+    }
+    for url, max_queries in budgets.items():
+        assert_max_queries("GET", TestApiRootPath + url, max_queries, headers=TestData["valid_admin_header"])
+
+    response = TestApiServer.get(TestApiRootPath + "/status")
+    db_timing, app_timing = response.headers["server-timing"].split(", ")
+    assert db_timing.startswith("db;dur=") and app_timing.startswith("app;dur=")
+
+    sql_timing = APP_CONFIG["sql_timing"]
+    slow_query_ms = sql_timing["slow_query_ms"]
+    sql_timing["slow_query_ms"] = 0  # Every statement is slow
+    try:
+        with caplog.at_level("WARNING", logger="sql_app.slow_query"):
+            TestApiServer.get(TestApiRootPath + "/ticket/0", headers=TestData["valid_admin_header"])
+    finally:
+        sql_timing["slow_query_ms"] = slow_query_ms
+
+    slow_queries = [json.loads(record.getMessage()) for record in caplog.records]
+    assert slow_queries and all(slow_query["route"] == "/ticket/{ticket_id}" for slow_query in slow_queries)
+    assert "int" in json.dumps(slow_queries[-1]["parameters"])  # Types, not values
+
+
+def test_access_log():
+    records = []
+
+    class ListHandler(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+
+    handler = ListHandler()
+    ACCESS_LOGGER.addHandler(handler)
+    ACCESS_LOGGER.setLevel(logging.INFO)  # As in log.ini
+    listeners = start_queue_logging()  # Records of ACCESS_LOGGER go through the queue to the handler
+    try:
+        assert [logger for logger, queue_handler, listener in listeners if logger is ACCESS_LOGGER]
+        TestApiServer.get(TestApiRootPath + "/ticket/0", headers=TestData["valid_admin_header"])
+        TestApiServer.get(TestApiRootPath + "/status")
+    finally:
+        stop_queue_logging(listeners)  # Writes queued records
+        ACCESS_LOGGER.removeHandler(handler)
+        ACCESS_LOGGER.setLevel(logging.NOTSET)
+    assert ACCESS_LOGGER.handlers == []
+
+    found, anonymous = [json.loads(record.getMessage()) for record in records[-2:]]
+    assert found["route"] == "/ticket/{ticket_id}" and found["status"] == 404 and found["method"] == "GET"
+    assert found["user_id"] == 1 and found["queries"] >= 1 and found["duration_ms"] > 0
+    assert anonymous["route"] == "/status" and anonymous["status"] == 401 and anonymous["user_id"] is None
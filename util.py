@@ -6,8 +6,10 @@ License: MIT
 """
 import json
 import time
+from dataclasses import dataclass
+from functools import cached_property
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
 from fastapi import HTTPException
 
 " Support functions ------------------------------------------------------------------------------------------------"
@@ -20,10 +22,10 @@ def get_current_time_utc(date_format="DATE"):  # date_format = DATE or TIME or U
     result = ""
 
     if date_format == "TIME":
-        result = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        result = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
 
     if date_format == "DATE":
-        result = datetime.now().strftime("%Y-%m-%d")
+        result = datetime.now(timezone.utc).strftime("%Y-%m-%d")
 
     if date_format == "UNIX":
         result = int(time.time())  # current date and time in Unix timestamp format
@@ -47,28 +49,43 @@ def get_setup() -> json:
     return json_obj
 
 
-def get_config():
-    """ GET project config from config.json file"""
-    file_path_config = f"{get_project_root()}/config/config.json"
-    config_json = get_json_file_content(file_path_config)
+# Project settings loaded once per process: every JSON file is parsed on first use and the same object is returned
+# afterward (main, auth, crud, database, schemas, ... used to re-open and re-parse the same files at import).
+# Settings are read-only: nobody changes them in place. permissions.json is reloaded at runtime by
+# sql_app/permissions.py as a new object, get_permissions() keeps returning the content read at startup.
+@dataclass(frozen=True)
+class Settings:
+    config_path: Path
 
-    return config_json
+    @cached_property
+    def config(self) -> dict:
+        return get_json_file_content(self.config_path / "config.json")
 
+    @cached_property
+    def schemas(self) -> dict:
+        return get_json_file_content(self.config_path / "schemas.json")
 
-def get_schemas():
-    """ GET project schemas from schemas.json file"""
-    file_path_config = f"{get_project_root()}/config/schemas.json"
-    permissions_json = get_json_file_content(file_path_config)
+    @cached_property
+    def permissions(self) -> dict:
+        return get_json_file_content(self.config_path / "permissions.json")
 
-    return permissions_json
 
+SETTINGS = Settings(config_path=get_project_root() / "config")
+
+
+def get_config():
+    """ GET project config from config.json file (loaded once)"""
+    return SETTINGS.config
+
+
+def get_schemas():
+    """ GET project schemas from schemas.json file (loaded once)"""
+    return SETTINGS.schemas
 
-def get_permissions():
-    """ GET project permissions from permissions.json file"""
-    file_path_config = f"{get_project_root()}/config/permissions.json"
-    permissions_json = get_json_file_content(file_path_config)
 
-    return permissions_json
+def get_permissions():
+    """ GET project permissions from permissions.json file (loaded once, see sql_app/permissions.py for reload)"""
+    return SETTINGS.permissions
 
 
 def get_test_main():